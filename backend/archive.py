@@ -0,0 +1,91 @@
+import os
+import tarfile
+import time
+import zipfile
+import zlib
+
+EXPORT_FORMATS = ("zip", "tar.gz")
+# Files are streamed into the archive this many bytes at a time, and the
+# archive leaves after every chunk, so memory stays flat however large
+# the crawl is.
+EXPORT_CHUNK = 256 * 1024
+# Already-compressed formats are stored in zips rather than deflated again.
+STORED_EXTS = {"docx", "xlsx", "pptx", "pdf", "gz", "zip", "png", "jpg", "jpeg"}
+
+
+class _Sink:
+    """Write-only stream the archivers write into; drained after each chunk."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def _read_chunks(path):
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(EXPORT_CHUNK)
+            if not chunk:
+                return
+            yield chunk
+
+
+def iter_zip(entries):
+    """Yield a zip archive of (arcname, path) entries as it is built."""
+    sink = _Sink()
+    with zipfile.ZipFile(sink, "w") as zf:
+        for arcname, path in entries:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            info = zipfile.ZipInfo(arcname, time.localtime(stat.st_mtime)[:6])
+            info.file_size = stat.st_size
+            ext = arcname.rsplit(".", 1)[-1].lower()
+            info.compress_type = zipfile.ZIP_STORED if ext in STORED_EXTS else zipfile.ZIP_DEFLATED
+            with zf.open(info, "w") as member:
+                for chunk in _read_chunks(path):
+                    member.write(chunk)
+                    yield sink.drain()
+            yield sink.drain()
+    yield sink.drain()
+
+
+def iter_tar_gz(entries):
+    """Yield a gzip-compressed tar of (arcname, path) entries as it is built."""
+    gz = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for arcname, path in entries:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        info = tarfile.TarInfo(arcname)
+        info.size = stat.st_size
+        info.mtime = int(stat.st_mtime)
+        info.mode = 0o644
+        yield gz.compress(info.tobuf(format=tarfile.PAX_FORMAT))
+        written = 0
+        for chunk in _read_chunks(path):
+            # Never write more than the header promised if the file grew.
+            chunk = chunk[: info.size - written]
+            written += len(chunk)
+            yield gz.compress(chunk)
+        # Pad a shrunk file to its declared size, then to a whole block.
+        yield gz.compress(bytes(info.size - written + (-info.size % tarfile.BLOCKSIZE)))
+    yield gz.compress(bytes(2 * tarfile.BLOCKSIZE)) + gz.flush()
+
+
+def iter_archive(entries, archive_format):
+    chunks = iter_zip(entries) if archive_format == "zip" else iter_tar_gz(entries)
+    return (chunk for chunk in chunks if chunk)
@@ -0,0 +1,268 @@
+"""Offline crawl benchmark: scrape_site against the legacy crawlers.
+
+Serves a synthetic site (see sitegen.py) from a local aiohttp server and
+crawls it with each crawler in a fresh spawned process, so peak RSS and
+CPU time are that crawler's own (CPU time includes its extraction and
+parse pools). Pages and documents are counted by the server, which
+serves the same seeded site to every crawler. Results are written as
+JSON (stdout, or --output) for tracking across releases; a summary goes
+to stderr.
+
+    cd backend && python benchmarks/bench_crawl.py --pages 200 --docs 40 --output bench.json
+
+The legacy crawlers are the repository-root scraper.py (blocking requests
+inside scrape_site) and edu_web_scraper.py, which sleeps one second
+between pages; keep --pages small when running the latter.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import importlib.util
+import io
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import UTC, datetime
+from urllib.parse import urlparse
+
+from aiohttp import web
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ROOT = os.path.dirname(BACKEND)
+sys.path.insert(0, BACKEND)
+from sitegen import DOC_TYPES, LATENCY_DISTS, build_app  # noqa: E402
+
+CRAWLERS = ("scrape_site", "legacy_scraper", "edu_web_scraper")
+
+
+def load_legacy(name):
+    # The legacy crawlers live at the repository root; scraper.py shares
+    # its module name with the backend's, so load them by path.
+    spec = importlib.util.spec_from_file_location(
+        f"legacy_{name}", os.path.join(ROOT, f"{name}.py")
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+async def crawl(scraper, start_url, doc_types, out_dir, job_id):
+    try:
+        await scraper.scrape_site(start_url, False, doc_types, out_dir, job_id)
+    finally:
+        await scraper.http_client.close()
+
+
+def crawl_scrape_site(start_url, out_dir, doc_types, args):
+    import job_store
+    import politeness
+    import scraper
+
+    scraper.MAX_PAGES = 2 * args.pages  # missing pages count against the limit too
+    scraper.HTTP_CACHE = False
+    job_store.JOB_DB = os.path.join(out_dir, "..", "jobs.sqlite3")
+    if not args.polite:
+        # Measure the crawl engine, not the per-host rate limit.
+        politeness.DEFAULT_RATE = politeness.MAX_RATE = politeness.BURST = 1e6
+    job_id = str(uuid.uuid4())
+    scraper.JOBS[job_id] = {
+        "status": "running",
+        "progress": 0,
+        "domain": urlparse(start_url).netloc,
+    }
+    asyncio.run(crawl(scraper, start_url, doc_types, out_dir, job_id))
+    # Shut the pools down so their CPU time is reaped into RUSAGE_CHILDREN.
+    pools = [scraper.parse_executor, *scraper.extract_executors.values()]
+    for pool in pools:
+        if pool is not None:
+            pool.shutdown()
+
+
+def crawl_legacy_scraper(start_url, out_dir, doc_types, args):
+    legacy = load_legacy("scraper")
+    job_id = str(uuid.uuid4())
+    legacy.JOBS[job_id] = {"status": "running", "progress": 0, "domain": urlparse(start_url).netloc}
+    asyncio.run(legacy.scrape_site(start_url, False, doc_types, out_dir, job_id))
+
+
+def crawl_edu_web_scraper(start_url, out_dir, doc_types, args):
+    edu = load_legacy("edu_web_scraper")
+    # It recurses once per page level and prints every URL.
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 10 * args.pages))
+    with contextlib.redirect_stdout(io.StringIO()):
+        edu.scrape_page(start_url, urlparse(start_url).netloc, out_dir, use_js=False)
+
+
+def measure(crawler, start_url, doc_types, args, results):
+    result = {}
+    try:
+        crawl = globals()[f"crawl_{crawler}"]
+        with tempfile.TemporaryDirectory() as tmp:
+            out_dir = os.path.join(tmp, "out")
+            os.makedirs(out_dir)
+            os.chdir(tmp)
+            before = resource.getrusage(resource.RUSAGE_SELF)
+            started = time.perf_counter()
+            crawl(start_url, out_dir, doc_types, args)
+            result["seconds"] = time.perf_counter() - started
+            after = resource.getrusage(resource.RUSAGE_SELF)
+            children = resource.getrusage(resource.RUSAGE_CHILDREN)
+            result["cpu_seconds"] = (
+                after.ru_utime
+                - before.ru_utime
+                + after.ru_stime
+                - before.ru_stime
+                + children.ru_utime
+                + children.ru_stime
+            )
+            result["peak_rss_bytes"] = after.ru_maxrss * 1024
+            result["peak_child_rss_bytes"] = children.ru_maxrss * 1024
+            result["outputs"] = len(
+                [name for name in os.listdir(out_dir) if not name.startswith(".")]
+            )
+    except ImportError as e:
+        result = {"skipped": str(e)}
+    except Exception as e:
+        result = {"error": repr(e)}
+    finally:
+        results.put(result)
+
+
+async def run(crawler, start_url, doc_types, args, hits):
+    for kind in hits:
+        hits[kind] = 0
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    proc = ctx.Process(target=measure, args=(crawler, start_url, doc_types, args, results))
+    proc.start()
+    # The server keeps running on this loop while the crawler works.
+    result = await asyncio.get_running_loop().run_in_executor(None, results.get)
+    await asyncio.get_running_loop().run_in_executor(None, proc.join)
+    result = {"crawler": crawler, **result}
+    if "seconds" in result:
+        result.update(
+            pages=hits["page"],
+            docs=hits["document"],
+            errors_served=hits["error"] + hits["missing"],
+            pages_per_sec=round(hits["page"] / result["seconds"], 2),
+            docs_per_sec=round(hits["document"] / result["seconds"], 2),
+            seconds=round(result["seconds"], 3),
+            cpu_seconds=round(result["cpu_seconds"], 3),
+        )
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def summary(result):
+    if "seconds" not in result:
+        return f"{result['crawler']:>16}: {result.get('skipped') or result.get('error')}"
+    return (
+        f"{result['crawler']:>16}: {result['seconds']:7.2f}s | {result['pages_per_sec']:7.1f} pages/sec | "
+        f"{result['docs_per_sec']:6.1f} docs/sec | CPU {result['cpu_seconds']:6.2f}s | "
+        f"peak RSS {result['peak_rss_bytes'] / 1e6:6.1f} MB (pools {result['peak_child_rss_bytes'] / 1e6:.1f} MB)"
+    )
+
+
+async def main(args):
+    site = {
+        "pages": args.pages,
+        "fanout": args.fanout,
+        "cross_links": args.cross_links,
+        "latency_ms": args.latency_ms,
+        "latency_dist": args.latency_dist,
+        "error_rate": args.error_rate,
+        "missing_rate": args.missing_rate,
+        "docs": args.docs,
+        "doc_types": args.doc_types,
+        "doc_size": args.doc_size,
+        "seed": args.seed,
+    }
+    app = build_app(**site)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    tcp_site = web.TCPSite(runner, "127.0.0.1", 0)
+    await tcp_site.start()
+    port = tcp_site._server.sockets[0].getsockname()[1]
+    start_url = f"http://127.0.0.1:{port}/p/0"
+    print(
+        f"site: {args.pages} pages, {args.docs} documents ({sum(map(len, app['documents'].values())) / 1e6:.1f} MB)",
+        file=sys.stderr,
+    )
+
+    results = []
+    try:
+        for n in range(args.repeat):
+            for crawler in args.crawlers:
+                result = await run(crawler, start_url, list(args.doc_types), args, app["hits"])
+                result["run"] = n
+                results.append(result)
+                print(summary(result), file=sys.stderr)
+    finally:
+        await runner.cleanup()
+
+    report = {
+        "benchmark": "crawl",
+        "timestamp": datetime.now(UTC).isoformat(timespec="seconds"),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "site": site,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--crawlers", nargs="+", choices=CRAWLERS, default=list(CRAWLERS))
+    parser.add_argument("--pages", type=int, default=100)
+    parser.add_argument("--fanout", type=int, default=5)
+    parser.add_argument("--cross-links", type=int, default=2, help="random extra links per page")
+    parser.add_argument(
+        "--latency-ms", type=float, default=20, help="mean (median for lognormal) response time"
+    )
+    parser.add_argument("--latency-dist", choices=LATENCY_DISTS, default="lognormal")
+    parser.add_argument(
+        "--error-rate", type=float, default=0.02, help="share of pages answering 500"
+    )
+    parser.add_argument(
+        "--missing-rate", type=float, default=0.02, help="share of pages with a link to a 404"
+    )
+    parser.add_argument("--docs", type=int, default=20)
+    parser.add_argument("--doc-types", nargs="+", choices=DOC_TYPES, default=list(DOC_TYPES))
+    parser.add_argument(
+        "--doc-size", type=int, default=5, help="PDF pages / PPTX slides per document"
+    )
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument(
+        "--polite", action="store_true", help="keep scrape_site's per-host rate limits"
+    )
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    asyncio.run(main(parser.parse_args()))
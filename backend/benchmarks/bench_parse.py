@@ -0,0 +1,105 @@
+"""Inline vs. process-pool HTML parsing: throughput and event-loop latency.
+
+Parses a corpus of saved HTML pages the way crawl_page does while a probe
+task measures how late the event loop wakes up. With no --corpus, a
+synthetic corpus of link-heavy pages is generated.
+
+    cd backend && python benchmarks/bench_parse.py --corpus ~/saved_pages --workers 1 2 4 8
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import scraper  # noqa: E402
+
+
+def load_corpus(path, count):
+    if path:
+        files = sorted(
+            p for p in Path(path).expanduser().rglob("*") if p.suffix.lower() in (".html", ".htm")
+        )
+        bodies = [p.read_bytes() for p in files]
+        return (bodies * (count // max(1, len(bodies)) + 1))[:count] if bodies else []
+    bodies = []
+    for n in range(count):
+        paragraphs = "".join(
+            f"<p>Paragraph {i} of page {n} with <b>some</b> inline markup.</p>" for i in range(300)
+        )
+        links = "".join(
+            f'<li><a href="/section/{n}/item/{i}">Item {i}</a></li>' for i in range(400)
+        )
+        bodies.append(
+            f"<html><head><title>Page {n}</title></head><body>{paragraphs}<ul>{links}</ul></body></html>".encode()
+        )
+    return bodies
+
+
+async def loop_probe(lags, stop, interval=0.005):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - started - interval)
+
+
+async def run(bodies, workers, backend):
+    scraper.PARSE_WORKERS = workers
+    scraper.PARSE_CONCURRENCY = 2 * workers
+    scraper.PARSE_BACKEND = backend
+    scraper.parse_executor = None
+    ctx = scraper.CrawlContext(None, "http://bench.local/", [], None, None)
+    if workers:
+        # Warm the pool so process start-up is not counted.
+        await asyncio.gather(
+            *(
+                scraper.parse_html(ctx, b"<html></html>", "http://bench.local/", None)
+                for _ in range(workers)
+            )
+        )
+
+    lags, stop = [], asyncio.Event()
+    probe = asyncio.create_task(loop_probe(lags, stop))
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(
+            scraper.parse_html(ctx, body, f"http://bench.local/{i}", None)
+            for i, body in enumerate(bodies)
+        )
+    )
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await probe
+    if scraper.parse_executor is not None:
+        scraper.parse_executor.shutdown()
+        scraper.parse_executor = None
+
+    lags = sorted(lags) or [0.0]
+    p99 = lags[min(len(lags) - 1, int(len(lags) * 0.99))]
+    label = f"pool x{workers}" if workers else "inline"
+    print(
+        f"{label:>10}: {len(bodies) / elapsed:7.1f} pages/sec | loop lag "
+        f"median {statistics.median(lags) * 1000:6.1f}ms p99 {p99 * 1000:7.1f}ms max {lags[-1] * 1000:7.1f}ms"
+    )
+
+
+async def main(args):
+    bodies = load_corpus(args.corpus, args.pages)
+    if not bodies:
+        sys.exit(f"no .html files under {args.corpus}")
+    print(f"{len(bodies)} pages, {sum(map(len, bodies)) / 1e6:.1f} MB, backend={args.backend}")
+    for workers in [0] + sorted(set(args.workers)):
+        await run(bodies, workers, args.backend)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", help="directory of saved .html pages")
+    parser.add_argument("--pages", type=int, default=400)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, os.cpu_count() or 1])
+    parser.add_argument("--backend", choices=["lxml", "bs4"], default="lxml")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,126 @@
+"""Single-pass vs. streamed, page-range-split PDF extraction.
+
+Extracts a set of local multi-hundred-page PDFs the old way (one
+PdfReader pass building the text with +=) and through iter_extraction
+(page ranges on the PDF process pool, streamed to an output file), and
+reports time, pages/sec and the crawler process's peak RSS (Linux; the
+streamed runs' page work happens in the pool's processes). With no
+--corpus, synthetic PDFs are generated.
+
+    cd backend && python benchmarks/bench_pdf.py --corpus ~/pdfs --pages-per-task 10 25 50
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import PyPDF2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sitegen import make_pdf  # noqa: E402
+
+import scraper  # noqa: E402
+
+
+def write_pdf(path, pages, lines=45):
+    Path(path).write_bytes(make_pdf(pages, lines))
+
+
+def legacy_extract_pdf(path):
+    # extract_pdf as it was before the streaming extractor.
+    text = ""
+    with open(path, "rb") as f:
+        reader = PyPDF2.PdfReader(f)
+        for page in reader.pages:
+            page_text = page.extract_text()
+            if page_text:
+                text += page_text
+    return text
+
+
+def reset_peak_rss():
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def peak_rss():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def report(label, pages, elapsed):
+    print(
+        f"{label:>22}: {elapsed:7.2f}s | {pages / elapsed:7.1f} pages/sec | peak RSS {peak_rss() / 1e6:7.1f} MB"
+    )
+
+
+def run_legacy(pdfs, pages, out_dir):
+    reset_peak_rss()
+    started = time.perf_counter()
+    for pdf in pdfs:
+        Path(out_dir, pdf.name + ".txt").write_text(legacy_extract_pdf(pdf))
+    report("single pass", pages, time.perf_counter() - started)
+
+
+async def run_streamed(pdfs, pages, out_dir, pages_per_task):
+    scraper.PDF_PAGES_PER_TASK = pages_per_task
+    # Warm the pool so process start-up is not counted.
+    await scraper.run_extraction(str(pdfs[0]), "pdf")
+    reset_peak_rss()
+    started = time.perf_counter()
+    stats = scraper.new_job_stats()
+    await asyncio.gather(
+        *(
+            scraper.write_extraction(
+                str(pdf), "pdf", os.path.join(out_dir, pdf.name + ".txt"), stats
+            )
+            for pdf in pdfs
+        )
+    )
+    report(f"streamed x{pages_per_task}/task", pages, time.perf_counter() - started)
+
+
+async def main(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.corpus:
+            pdfs = sorted(Path(args.corpus).expanduser().rglob("*.pdf"))
+        else:
+            pdfs = [Path(tmp, f"synthetic{n}.pdf") for n in range(args.docs)]
+            for pdf in pdfs:
+                write_pdf(pdf, args.pages)
+        if not pdfs:
+            sys.exit(f"no .pdf files under {args.corpus}")
+        pages = sum(scraper.count_pdf_pages(str(pdf)) for pdf in pdfs)
+        print(
+            f"{len(pdfs)} PDFs, {pages} pages, {sum(p.stat().st_size for p in pdfs) / 1e6:.1f} MB"
+        )
+        out_dir = Path(tmp, "out")
+        out_dir.mkdir()
+        run_legacy(pdfs, pages, out_dir)
+        for pages_per_task in args.pages_per_task:
+            await run_streamed(pdfs, pages, str(out_dir), pages_per_task)
+        await scraper.writer.flush()
+    for pool in scraper.extract_executors.values():
+        pool.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", help="directory of .pdf files")
+    parser.add_argument("--docs", type=int, default=3)
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--pages-per-task", type=int, nargs="+", default=[25])
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,97 @@
+"""Whole-frame vs. chunked CSV/XLSX extraction: peak RSS and time.
+
+Each run happens in a fresh process so its peak RSS is its own: the old
+path (pd.read_csv / pd.read_excel, then df.to_string()) against
+write_table, which streams the file in chunks of about TABLE_CHUNK_BYTES
+into the output. With no --csv/--xlsx, synthetic files are generated.
+
+    cd backend && python benchmarks/bench_tables.py --rows 1000000 --chunk-mb 8 32
+"""
+
+import argparse
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def make_csv(path, rows):
+    with open(path, "w") as f:
+        f.write("id,name,city,amount,updated\n")
+        for i in range(rows):
+            f.write(f"{i},Person {i},City {i % 500},{i * 1.25:.2f},2024-01-{i % 28 + 1:02d}\n")
+
+
+def make_xlsx(path, rows):
+    import openpyxl
+
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(["id", "name", "city", "amount", "updated"])
+    for i in range(rows):
+        sheet.append([i, f"Person {i}", f"City {i % 500}", i * 1.25, f"2024-01-{i % 28 + 1:02d}"])
+    workbook.save(path)
+
+
+def measure(method, path, ext, out_path, chunk_bytes, results):
+    import pandas as pd
+
+    import scraper
+
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    if method == "whole frame":
+        df = pd.read_csv(path) if ext == "csv" else pd.read_excel(path)
+        with open(out_path, "w") as f:
+            f.write(df.to_string())
+    else:
+        scraper.write_table(path, ext, out_path, chunk_bytes)
+    elapsed = time.perf_counter() - started
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results.put((elapsed, baseline * 1024, peak * 1024))
+
+
+def run(method, path, ext, out_path, chunk_bytes=None):
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    proc = ctx.Process(target=measure, args=(method, path, ext, out_path, chunk_bytes, results))
+    proc.start()
+    elapsed, baseline, peak = results.get()
+    proc.join()
+    label = method if chunk_bytes is None else f"{method} {chunk_bytes // 2**20}MB"
+    print(
+        f"{ext:>4} {label:>14}: {elapsed:7.2f}s | peak RSS {peak / 1e6:7.1f} MB "
+        f"({(peak - baseline) / 1e6:+7.1f} MB over imports) | output {os.path.getsize(out_path) / 1e6:.1f} MB"
+    )
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        tables = []
+        if args.csv or args.xlsx:
+            tables += [(p, "csv") for p in args.csv or []] + [(p, "xlsx") for p in args.xlsx or []]
+        else:
+            csv_path, xlsx_path = os.path.join(tmp, "table.csv"), os.path.join(tmp, "table.xlsx")
+            make_csv(csv_path, args.rows)
+            make_xlsx(xlsx_path, args.xlsx_rows)
+            tables = [(csv_path, "csv"), (xlsx_path, "xlsx")]
+        out_path = os.path.join(tmp, "out.txt")
+        for path, ext in tables:
+            print(f"{path}: {os.path.getsize(path) / 1e6:.1f} MB")
+            run("whole frame", path, ext, out_path)
+            for chunk_mb in args.chunk_mb:
+                run("chunked", path, ext, out_path, chunk_mb * 2**20)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--csv", nargs="+", help="local .csv files")
+    parser.add_argument("--xlsx", nargs="+", help="local .xlsx files")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="rows in the synthetic CSV")
+    parser.add_argument("--xlsx-rows", type=int, default=200_000, help="rows in the synthetic XLSX")
+    parser.add_argument("--chunk-mb", type=int, nargs="+", default=[8])
+    main(parser.parse_args())
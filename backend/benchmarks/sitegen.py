@@ -0,0 +1,199 @@
+"""Synthetic sites for the crawl benchmarks.
+
+build_app serves a seeded, reproducible site from aiohttp: pages /p/0..N-1
+in a tree of ``fanout`` children plus random cross-links, per-page latency
+drawn from a chosen distribution, a share of pages answering 500, a share
+of links pointing at missing pages, and PDF/DOCX/XLSX/PPTX documents.
+
+Documents are linked on the ``localhost`` alias of the server's address,
+i.e. another host as far as the crawlers are concerned (the usual CDN or
+file-server layout). edu_web_scraper.py only downloads documents from
+other hosts and would otherwise fetch them as pages.
+
+Every request is counted in ``app["hits"]`` by kind (page, document,
+error, missing), so crawlers can be compared on what the server handed
+out whatever they write to disk.
+"""
+
+import asyncio
+import io
+import random
+
+import openpyxl
+from aiohttp import web
+from docx import Document as DocxDocument
+from pptx import Presentation
+
+LATENCY_DISTS = ("fixed", "uniform", "exponential", "lognormal")
+DOC_TYPES = ("pdf", "docx", "xlsx", "pptx")
+CONTENT_TYPES = {
+    "pdf": "application/pdf",
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "pptx": "application/vnd.openxmlformats-officedocument.presentationml.presentation",
+}
+
+
+def make_pdf(pages, lines=45, label="synthetic benchmark"):
+    """A plain PDF with ``lines`` lines of Helvetica text on every page."""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    kids = []
+    for n in range(pages):
+        rows = " ".join(
+            f"(Page {n} line {i} of the {label} document body text.) Tj T*" for i in range(lines)
+        )
+        stream = f"BT /F1 10 Tf 12 TL 50 760 Td {rows} ET".encode()
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>"
+            % len(objects)
+        )
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {pages} >>".encode()
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, obj in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (i, obj)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % off for off in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1,
+        xref,
+    )
+    return bytes(out)
+
+
+def make_docx(label, paragraphs):
+    document = DocxDocument()
+    document.add_heading(f"Report {label}", 1)
+    for i in range(paragraphs):
+        document.add_paragraph(f"Paragraph {i} of report {label}. " * 8)
+    buf = io.BytesIO()
+    document.save(buf)
+    return buf.getvalue()
+
+
+def make_xlsx(label, rows):
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(["id", "name", "city", "amount", "source"])
+    for i in range(rows):
+        sheet.append([i, f"Person {i}", f"City {i % 500}", i * 1.25, label])
+    buf = io.BytesIO()
+    workbook.save(buf)
+    return buf.getvalue()
+
+
+def make_pptx(label, slides):
+    presentation = Presentation()
+    for i in range(slides):
+        slide = presentation.slides.add_slide(presentation.slide_layouts[1])
+        slide.shapes.title.text = f"Slide {i} of deck {label}"
+        slide.placeholders[1].text = f"Point {i} in deck {label}\nAnother point"
+    buf = io.BytesIO()
+    presentation.save(buf)
+    return buf.getvalue()
+
+
+def make_document(ext, label, size):
+    """A unique document of roughly ``size`` units (pages, paragraphs, rows or slides)."""
+    if ext == "pdf":
+        return make_pdf(size, label=label)
+    if ext == "docx":
+        return make_docx(label, size * 10)
+    if ext == "xlsx":
+        return make_xlsx(label, size * 100)
+    return make_pptx(label, size)
+
+
+def latency(rng, dist, mean):
+    if mean <= 0:
+        return 0
+    if dist == "uniform":
+        return rng.uniform(0, 2 * mean)
+    if dist == "exponential":
+        return rng.expovariate(1 / mean)
+    if dist == "lognormal":
+        # Median ``mean`` with a long tail, like real servers.
+        return min(rng.lognormvariate(0, 0.8) * mean, 50 * mean)
+    return mean
+
+
+def build_app(
+    pages=200,
+    fanout=5,
+    cross_links=2,
+    latency_ms=20,
+    latency_dist="lognormal",
+    error_rate=0.02,
+    missing_rate=0.02,
+    docs=40,
+    doc_types=DOC_TYPES,
+    doc_size=5,
+    seed=1,
+):
+    """The synthetic site; everything random is derived from ``seed``."""
+    if latency_dist not in LATENCY_DISTS:
+        raise ValueError(f"latency_dist must be one of {', '.join(LATENCY_DISTS)}")
+    documents = {}
+    doc_links = {}
+    for i in range(docs):
+        ext = doc_types[i % len(doc_types)]
+        name = f"doc{i}.{ext}"
+        documents[name] = make_document(ext, f"{seed}-{i}", doc_size)
+        doc_links.setdefault(i % pages, []).append(name)
+    failing = {
+        n for n in range(1, pages) if random.Random(f"{seed}:error:{n}").random() < error_rate
+    }
+    hits = {"page": 0, "document": 0, "error": 0, "missing": 0}
+
+    async def page(request):
+        n = int(request.match_info["n"])
+        rng = random.Random(f"{seed}:page:{n}")
+        await asyncio.sleep(latency(rng, latency_dist, latency_ms / 1000))
+        if n >= pages:
+            hits["missing"] += 1
+            raise web.HTTPNotFound()
+        if n in failing:
+            hits["error"] += 1
+            raise web.HTTPInternalServerError()
+        hits["page"] += 1
+        targets = [c for c in range(n * fanout + 1, n * fanout + fanout + 1) if c < pages]
+        targets += [rng.randrange(pages) for _ in range(cross_links)]
+        targets += [pages + n for _ in range(1) if rng.random() < missing_rate]
+        links = "".join(f'<li><a href="/p/{c}">Page {c}</a></li>' for c in targets)
+        doc_host = f"http://localhost:{request.url.port}"
+        links += "".join(
+            f'<li><a href="{doc_host}/d/{name}">{name}</a></li>' for name in doc_links.get(n, ())
+        )
+        text = " ".join(f"Sentence {i} on page {n} of the synthetic site." for i in range(40))
+        return web.Response(
+            text=f"<html><head><title>Page {n}</title></head><body><h1>Page {n}</h1><p>{text}</p><ul>{links}</ul></body></html>",
+            content_type="text/html",
+        )
+
+    async def document(request):
+        name = request.match_info["name"]
+        await asyncio.sleep(
+            latency(random.Random(f"{seed}:doc:{name}"), latency_dist, latency_ms / 1000)
+        )
+        if name not in documents:
+            hits["missing"] += 1
+            raise web.HTTPNotFound()
+        hits["document"] += 1
+        return web.Response(
+            body=documents[name], content_type=CONTENT_TYPES[name.rsplit(".", 1)[1]]
+        )
+
+    app = web.Application()
+    app["hits"] = hits
+    app["documents"] = documents
+    app.router.add_get("/p/{n}", page)
+    app.router.add_get("/d/{name}", document)
+    return app
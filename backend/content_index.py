@@ -0,0 +1,142 @@
+import collections
+import hashlib
+import os
+import re
+import sqlite3
+from contextlib import closing
+
+# Lives inside each output_{domain} directory.
+INDEX_FILE = ".content_index.sqlite3"
+
+# Pages whose 64-bit SimHashes differ in at most SIMHASH_DISTANCE bits are
+# near-duplicates. Texts shorter than SIMHASH_MIN_TOKENS words are only
+# de-duplicated exactly (short pages collide too easily).
+SIMHASH_DISTANCE = 3
+SIMHASH_MIN_TOKENS = 50
+# SIMHASH_DISTANCE + 1 bands: two hashes within the distance must agree
+# exactly on at least one band, so lookups only compare within a band.
+SIMHASH_BANDS = SIMHASH_DISTANCE + 1
+
+TOKEN = re.compile(r"\w+")
+
+
+def simhash(text):
+    tokens = TOKEN.findall(text.lower())
+    if len(tokens) < SIMHASH_MIN_TOKENS:
+        return None
+    weights = [0] * 64
+    for shingle in {" ".join(tokens[i : i + 3]) for i in range(len(tokens) - 2)}:
+        h = int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest(), "big")
+        for bit in range(64):
+            weights[bit] += 1 if h >> bit & 1 else -1
+    return sum(1 << bit for bit in range(64) if weights[bit] > 0)
+
+
+def _bands(value):
+    width = 64 // SIMHASH_BANDS
+    mask = (1 << width) - 1
+    return [(i, value >> (i * width) & mask) for i in range(SIMHASH_BANDS)]
+
+
+class ContentIndex:
+    """Content-addressed view of an output directory.
+
+    Maps content hashes (and SimHashes of page text) to the one file that
+    stores that content, and every crawled URL's own filename to the file
+    holding its content, so duplicates are written once but still listed
+    and downloadable under their own name.
+
+    Lookups and claims are answered from memory on the event loop. The
+    SQLite file is only touched on the output writer thread: it is opened
+    by OutputWriter.open_contents, and the queued rows are written and
+    committed with each batched fsync.
+    """
+
+    def __init__(self, out_dir):
+        self.db = sqlite3.connect(os.path.join(out_dir, INDEX_FILE), timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS contents (content_id TEXT PRIMARY KEY, filename TEXT, simhash TEXT)"
+        )
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS aliases (filename TEXT PRIMARY KEY, url TEXT, target TEXT)"
+        )
+        # (sql, params) waiting for the writer thread's next commit().
+        self.queued = collections.deque()
+        self.by_hash = {}
+        self.bands = {}
+        for content_id, filename, sh in self.db.execute(
+            "SELECT content_id, filename, simhash FROM contents"
+        ):
+            self._remember(content_id, filename, int(sh, 16) if sh else None)
+        self.aliases = dict(self.db.execute("SELECT filename, target FROM aliases"))
+
+    def find_exact(self, content_id):
+        return self.by_hash.get(content_id)
+
+    def find_near(self, sh):
+        if sh is None:
+            return None
+        for band in _bands(sh):
+            for other, filename in self.bands.get(band, ()):
+                if bin(sh ^ other).count("1") <= SIMHASH_DISTANCE:
+                    return filename
+        return None
+
+    def add_content(self, content_id, filename, sh=None):
+        self.queued.append(
+            (
+                "INSERT OR REPLACE INTO contents VALUES (?, ?, ?)",
+                (content_id, filename, format(sh, "016x") if sh is not None else None),
+            )
+        )
+        self._remember(content_id, filename, sh)
+
+    def remove_content(self, content_id, filename):
+        """Drop a claim made by add_content (the write behind it failed)."""
+        if self.by_hash.get(content_id) != filename:
+            return
+        self.queued.append(
+            ("DELETE FROM contents WHERE content_id = ? AND filename = ?", (content_id, filename))
+        )
+        del self.by_hash[content_id]
+        for band, entries in list(self.bands.items()):
+            self.bands[band] = [entry for entry in entries if entry[1] != filename]
+            if not self.bands[band]:
+                del self.bands[band]
+
+    def add_alias(self, url, filename, target):
+        self.queued.append(
+            ("INSERT OR REPLACE INTO aliases VALUES (?, ?, ?)", (filename, url, target))
+        )
+        self.aliases[filename] = target
+
+    def resolve(self, filename):
+        return self.aliases.get(filename)
+
+    def commit(self):
+        """Write and commit the queued rows; runs on the output writer thread."""
+        if not self.queued:
+            return
+        while self.queued:
+            self.db.execute(*self.queued.popleft())
+        self.db.commit()
+
+    def close(self):
+        self.commit()
+        self.db.close()
+
+    def _remember(self, content_id, filename, sh):
+        self.by_hash[content_id] = filename
+        if sh is not None:
+            for band in _bands(sh):
+                self.bands.setdefault(band, []).append((sh, filename))
+
+
+def resolve_alias(out_dir, filename):
+    path = os.path.join(out_dir, INDEX_FILE)
+    if not os.path.exists(path):
+        return None
+    with closing(sqlite3.connect(path)) as db:
+        row = db.execute("SELECT target FROM aliases WHERE filename = ?", (filename,)).fetchone()
+    return row[0] if row else None
@@ -0,0 +1,889 @@
+import abc
+import asyncio
+import collections
+import contextlib
+import contextvars
+import functools
+import json
+import math
+import os
+import sqlite3
+import time
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import job_store
+import retries
+import scraper
+from frontier import budget_prefix, check_limits
+from http_cache import HttpCache
+from record_store import RecordStore
+from urlnorm import canonicalize_url
+
+# Broker shared by the workers of a distributed crawl: a Redis URL
+# ("redis://host:6379/0"), or a SQLite file for workers on one machine.
+# Unset, every job runs in the process that accepted it.
+BROKER_URL = os.environ.get("CRAWL_BROKER")
+# URLs are spread over PARTITIONS by host hash, and each partition is leased
+# to one worker, so a host's politeness state never leaves that worker.
+PARTITIONS = 64
+# A worker (and its partition leases) counts as gone LEASE_TTL seconds after
+# its last heartbeat; heartbeats, lease renewal, rebalancing and stats
+# reports happen every HEARTBEAT_INTERVAL.
+LEASE_TTL = 30
+HEARTBEAT_INTERVAL = 5
+# Idle wait when none of a worker's partitions has queued URLs.
+POLL_INTERVAL = 0.5
+# On a graceful leave, URLs already taken get this long to finish.
+DRAIN_TIMEOUT = 30
+KEY_PREFIX = "crawl"
+
+# Links and documents found while one URL is processed, as (kind, url,
+# depth); sent to the broker before that URL is acked.
+_outbox = contextvars.ContextVar("outbox")
+
+
+def partition(url):
+    return zlib.crc32(urlparse(url).netloc.lower().encode()) % PARTITIONS
+
+
+def entry(kind, url, depth=0):
+    """(url, partition, item) for Broker.add: kind is "page" or "doc", depth
+    the page's link hops from the seed."""
+    return url, partition(url), f"{kind} {depth} {url}"
+
+
+def parse_item(item):
+    """(kind, depth, url) of a queued item."""
+    kind, depth, url = item.split(" ", 2)
+    return kind, int(depth), url
+
+
+def merge_stats(all_stats):
+    """Sum per-worker job stats (timings are per worker and left out)."""
+    merged = {}
+    for stats in all_stats:
+        for key, value in stats.items():
+            if isinstance(value, int | float):
+                merged[key] = merged.get(key, 0) + value
+            elif key == "errors_by_category":
+                errors = merged.setdefault(key, {})
+                for category, n in value.items():
+                    errors[category] = errors.get(category, 0) + n
+            elif key == "failures":
+                merged[key] = (merged.get(key, []) + value)[-retries.FAILURE_LOG_SIZE :]
+    return merged
+
+
+class Broker(abc.ABC):
+    """Shared state of distributed crawls.
+
+    Holds job specs and status, each job's seen-set, a frontier queue per
+    partition, partition leases and worker heartbeats. Popped URLs stay in
+    flight under their partition until acked; ``requeue`` puts a partition's
+    in-flight URLs back (when it changes hands), so a URL is only ever
+    finished once. A job is done when no URL is queued or in flight.
+    """
+
+    @abc.abstractmethod
+    async def submit(self, job_id, spec, entries):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def add(self, job_id, entries):
+        """Queue the (url, partition, item) entries not seen before; returns how many."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def jobs(self):
+        """(job_id, spec) of every running job."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def status(self, job_id):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def get_job(self, job_id):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def pop(self, job_id, parts, n, worker):
+        """Up to ``n`` queued (partition, item) pairs from ``parts``, now in flight."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def ack(self, job_id, part, item, worker):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def requeue(self, job_id, part):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def count_page(self, job_id):
+        """Count one more page against the job's page budget; returns the total."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def spend(self, job_id, prefix):
+        """Count one more page against the job's budget for the path ``prefix``; returns the total."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def report_stats(self, job_id, worker, stats):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def heartbeat(self, worker):
+        """Record that ``worker`` is alive; returns the live workers."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def leave(self, worker):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def acquire(self, part, worker):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def renew(self, worker):
+        """Extend ``worker``'s leases; returns the partitions it still holds."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def release(self, part, worker):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+def _in_thread(method):
+    # sqlite3 blocks, so SQLiteBroker's calls run on its own thread.
+    @functools.wraps(method)
+    async def run(self, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, method, self, *args)
+
+    return run
+
+
+class SQLiteBroker(Broker):
+    """Broker in a SQLite file: for tests and workers sharing one machine.
+
+    Every query runs on one dedicated thread (which owns the connection),
+    so a busy or slow database file never stalls the event loop.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._db = None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="broker")
+        self.executor.submit(self._create_tables).result()
+
+    def _create_tables(self):
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(
+            "CREATE TABLE IF NOT EXISTS dist_jobs (job_id TEXT PRIMARY KEY, spec TEXT, status TEXT, "
+            "outstanding INTEGER DEFAULT 0, pages INTEGER DEFAULT 0);"
+            "CREATE TABLE IF NOT EXISTS dist_seen (job_id TEXT, url TEXT, PRIMARY KEY (job_id, url)) WITHOUT ROWID;"
+            "CREATE TABLE IF NOT EXISTS dist_queue (seq INTEGER PRIMARY KEY AUTOINCREMENT, job_id TEXT, "
+            "part INTEGER, item TEXT, worker TEXT);"
+            "CREATE INDEX IF NOT EXISTS dist_queue_part ON dist_queue (job_id, part, worker, seq);"
+            "CREATE TABLE IF NOT EXISTS dist_spent (job_id TEXT, prefix TEXT, pages INTEGER, PRIMARY KEY (job_id, prefix));"
+            "CREATE TABLE IF NOT EXISTS dist_stats (job_id TEXT, worker TEXT, stats TEXT, PRIMARY KEY (job_id, worker));"
+            "CREATE TABLE IF NOT EXISTS dist_workers (worker TEXT PRIMARY KEY, heartbeat_at REAL);"
+            "CREATE TABLE IF NOT EXISTS dist_leases (part INTEGER PRIMARY KEY, worker TEXT, expires_at REAL);"
+        )
+
+    @property
+    def db(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        return self._db
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        db = self.db
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def _add(self, db, job_id, entries):
+        added = 0
+        for url, part, item in entries:
+            if db.execute("INSERT OR IGNORE INTO dist_seen VALUES (?, ?)", (job_id, url)).rowcount:
+                db.execute(
+                    "INSERT INTO dist_queue (job_id, part, item) VALUES (?, ?, ?)",
+                    (job_id, part, item),
+                )
+                added += 1
+        if added:
+            db.execute(
+                "UPDATE dist_jobs SET outstanding = outstanding + ? WHERE job_id = ?",
+                (added, job_id),
+            )
+        return added
+
+    @_in_thread
+    def submit(self, job_id, spec, entries):
+        with self._transaction() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO dist_jobs VALUES (?, ?, 'running', 0, 0)",
+                (job_id, json.dumps(spec)),
+            )
+            self._add(db, job_id, entries)
+
+    @_in_thread
+    def add(self, job_id, entries):
+        with self._transaction() as db:
+            return self._add(db, job_id, entries)
+
+    @_in_thread
+    def jobs(self):
+        rows = self.db.execute(
+            "SELECT job_id, spec FROM dist_jobs WHERE status = 'running'"
+        ).fetchall()
+        return [(job_id, json.loads(spec)) for job_id, spec in rows]
+
+    @_in_thread
+    def status(self, job_id):
+        row = self.db.execute("SELECT status FROM dist_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return row[0] if row else None
+
+    @_in_thread
+    def get_job(self, job_id):
+        row = self.db.execute(
+            "SELECT spec, status, outstanding, pages FROM dist_jobs WHERE job_id = ?", (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        stats = self.db.execute(
+            "SELECT stats FROM dist_stats WHERE job_id = ?", (job_id,)
+        ).fetchall()
+        return {
+            "job_id": job_id,
+            "spec": json.loads(row[0]),
+            "status": row[1],
+            "outstanding": row[2],
+            "pages": row[3],
+            "stats": merge_stats(json.loads(s) for (s,) in stats),
+        }
+
+    @_in_thread
+    def pop(self, job_id, parts, n, worker):
+        if not parts or n <= 0:
+            return []
+        with self._transaction() as db:
+            rows = db.execute(
+                f"SELECT seq, part, item FROM dist_queue WHERE job_id = ? AND worker IS NULL "
+                f"AND part IN ({','.join('?' * len(parts))}) ORDER BY seq LIMIT ?",
+                (job_id, *parts, n),
+            ).fetchall()
+            db.executemany(
+                "UPDATE dist_queue SET worker = ? WHERE seq = ?",
+                [(worker, seq) for seq, _, _ in rows],
+            )
+        return [(part, item) for _, part, item in rows]
+
+    @_in_thread
+    def ack(self, job_id, part, item, worker):
+        with self._transaction() as db:
+            if not db.execute(
+                "DELETE FROM dist_queue WHERE job_id = ? AND part = ? AND item = ? AND worker = ?",
+                (job_id, part, item, worker),
+            ).rowcount:
+                return False
+            db.execute(
+                "UPDATE dist_jobs SET outstanding = outstanding - 1 WHERE job_id = ?", (job_id,)
+            )
+            db.execute(
+                "UPDATE dist_jobs SET status = 'done' WHERE job_id = ? AND outstanding <= 0",
+                (job_id,),
+            )
+        return True
+
+    @_in_thread
+    def requeue(self, job_id, part):
+        self.db.execute(
+            "UPDATE dist_queue SET worker = NULL WHERE job_id = ? AND part = ? AND worker IS NOT NULL",
+            (job_id, part),
+        )
+
+    @_in_thread
+    def count_page(self, job_id):
+        with self._transaction() as db:
+            db.execute("UPDATE dist_jobs SET pages = pages + 1 WHERE job_id = ?", (job_id,))
+            return db.execute("SELECT pages FROM dist_jobs WHERE job_id = ?", (job_id,)).fetchone()[
+                0
+            ]
+
+    @_in_thread
+    def spend(self, job_id, prefix):
+        with self._transaction() as db:
+            db.execute(
+                "INSERT INTO dist_spent VALUES (?, ?, 1) ON CONFLICT (job_id, prefix) DO UPDATE SET pages = pages + 1",
+                (job_id, prefix),
+            )
+            return db.execute(
+                "SELECT pages FROM dist_spent WHERE job_id = ? AND prefix = ?", (job_id, prefix)
+            ).fetchone()[0]
+
+    @_in_thread
+    def report_stats(self, job_id, worker, stats):
+        self.db.execute(
+            "INSERT OR REPLACE INTO dist_stats VALUES (?, ?, ?)",
+            (job_id, worker, json.dumps(stats)),
+        )
+
+    @_in_thread
+    def heartbeat(self, worker):
+        now = time.time()
+        with self._transaction() as db:
+            db.execute("INSERT OR REPLACE INTO dist_workers VALUES (?, ?)", (worker, now))
+            db.execute("DELETE FROM dist_workers WHERE heartbeat_at < ?", (now - LEASE_TTL,))
+            return [w for (w,) in db.execute("SELECT worker FROM dist_workers ORDER BY worker")]
+
+    @_in_thread
+    def leave(self, worker):
+        self.db.execute("DELETE FROM dist_workers WHERE worker = ?", (worker,))
+
+    @_in_thread
+    def acquire(self, part, worker):
+        now = time.time()
+        with self._transaction() as db:
+            row = db.execute(
+                "SELECT worker, expires_at FROM dist_leases WHERE part = ?", (part,)
+            ).fetchone()
+            if row and row[0] != worker and row[1] >= now:
+                return False
+            db.execute(
+                "INSERT OR REPLACE INTO dist_leases VALUES (?, ?, ?)",
+                (part, worker, now + LEASE_TTL),
+            )
+        return True
+
+    @_in_thread
+    def renew(self, worker):
+        with self._transaction() as db:
+            db.execute(
+                "UPDATE dist_leases SET expires_at = ? WHERE worker = ?",
+                (time.time() + LEASE_TTL, worker),
+            )
+            return {
+                part
+                for (part,) in db.execute(
+                    "SELECT part FROM dist_leases WHERE worker = ?", (worker,)
+                )
+            }
+
+    @_in_thread
+    def release(self, part, worker):
+        self.db.execute("DELETE FROM dist_leases WHERE part = ? AND worker = ?", (part, worker))
+
+    @_in_thread
+    def _disconnect(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    async def close(self):
+        await self._disconnect()
+        self.executor.shutdown(wait=False)
+
+
+# Each script runs atomically on the server. Queue keys are built from a
+# prefix inside the scripts, so this needs a single Redis-compatible server
+# (not Redis Cluster).
+_ADD = """
+local added = 0
+for i = 2, #ARGV, 3 do
+  if redis.call('SADD', KEYS[1], ARGV[i]) == 1 then
+    redis.call('RPUSH', ARGV[1] .. ARGV[i + 1], ARGV[i + 2])
+    added = added + 1
+  end
+end
+if added > 0 then redis.call('HINCRBY', KEYS[2], 'outstanding', added) end
+return added
+"""
+_POP = """
+local out = {}
+local n = tonumber(ARGV[3])
+for i = 4, #ARGV do
+  while #out < 2 * n do
+    local item = redis.call('LMOVE', ARGV[1] .. ARGV[i], ARGV[2] .. ARGV[i], 'LEFT', 'RIGHT')
+    if not item then break end
+    table.insert(out, ARGV[i])
+    table.insert(out, item)
+  end
+end
+return out
+"""
+_ACK = """
+if redis.call('LREM', KEYS[1], 1, ARGV[1]) == 0 then return -1 end
+local left = redis.call('HINCRBY', KEYS[2], 'outstanding', -1)
+if left <= 0 then redis.call('HSET', KEYS[2], 'status', 'done') end
+return left
+"""
+_REQUEUE = """
+local n = 0
+while redis.call('LMOVE', KEYS[1], KEYS[2], 'RIGHT', 'LEFT') do n = n + 1 end
+return n
+"""
+_RENEW = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('PEXPIRE', KEYS[1], ARGV[2]) end
+return 0
+"""
+_RELEASE = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) end
+return 0
+"""
+
+
+class RedisBroker(Broker):
+    """Broker on a Redis-compatible server (Redis 6.2+, Valkey, KeyDB)."""
+
+    def __init__(self, url):
+        try:
+            import redis.asyncio as aioredis
+        except ImportError:
+            raise RuntimeError("a Redis CRAWL_BROKER needs the redis package (pip install redis)")
+        self.redis = aioredis.from_url(url, decode_responses=True)
+        self._add = self.redis.register_script(_ADD)
+        self._pop = self.redis.register_script(_POP)
+        self._ack = self.redis.register_script(_ACK)
+        self._requeue = self.redis.register_script(_REQUEUE)
+        self._renew = self.redis.register_script(_RENEW)
+        self._release = self.redis.register_script(_RELEASE)
+
+    @staticmethod
+    def key(*parts):
+        return ":".join((KEY_PREFIX, *map(str, parts)))
+
+    async def submit(self, job_id, spec, entries):
+        await self.redis.hset(
+            self.key(job_id, "job"),
+            mapping={
+                "spec": json.dumps(spec),
+                "status": "running",
+                "outstanding": 0,
+                "pages": 0,
+            },
+        )
+        await self.redis.sadd(self.key("running"), job_id)
+        await self.add(job_id, entries)
+
+    async def add(self, job_id, entries):
+        if not entries:
+            return 0
+        args = [self.key(job_id, "q", "")]
+        for url, part, item in entries:
+            args += [url, part, item]
+        return await self._add(keys=[self.key(job_id, "seen"), self.key(job_id, "job")], args=args)
+
+    async def jobs(self):
+        running = []
+        for job_id in await self.redis.smembers(self.key("running")):
+            spec, status = await self.redis.hmget(self.key(job_id, "job"), "spec", "status")
+            if status == "running":
+                running.append((job_id, json.loads(spec)))
+            else:
+                await self.redis.srem(self.key("running"), job_id)
+        return running
+
+    async def status(self, job_id):
+        return await self.redis.hget(self.key(job_id, "job"), "status")
+
+    async def get_job(self, job_id):
+        job = await self.redis.hgetall(self.key(job_id, "job"))
+        if not job:
+            return None
+        stats = await self.redis.hvals(self.key(job_id, "stats"))
+        return {
+            "job_id": job_id,
+            "spec": json.loads(job["spec"]),
+            "status": job["status"],
+            "outstanding": int(job["outstanding"]),
+            "pages": int(job["pages"]),
+            "stats": merge_stats(json.loads(s) for s in stats),
+        }
+
+    async def pop(self, job_id, parts, n, worker):
+        if not parts or n <= 0:
+            return []
+        out = await self._pop(
+            args=[self.key(job_id, "q", ""), self.key(job_id, "inflight", ""), n, *parts]
+        )
+        return [(int(out[i]), out[i + 1]) for i in range(0, len(out), 2)]
+
+    async def ack(self, job_id, part, item, worker):
+        left = await self._ack(
+            keys=[self.key(job_id, "inflight", part), self.key(job_id, "job")], args=[item]
+        )
+        return left >= 0
+
+    async def requeue(self, job_id, part):
+        await self._requeue(keys=[self.key(job_id, "inflight", part), self.key(job_id, "q", part)])
+
+    async def count_page(self, job_id):
+        return await self.redis.hincrby(self.key(job_id, "job"), "pages", 1)
+
+    async def spend(self, job_id, prefix):
+        return await self.redis.hincrby(self.key(job_id, "spent"), prefix, 1)
+
+    async def report_stats(self, job_id, worker, stats):
+        await self.redis.hset(self.key(job_id, "stats"), worker, json.dumps(stats))
+
+    async def heartbeat(self, worker):
+        now = time.time()
+        workers = self.key("workers")
+        await self.redis.zadd(workers, {worker: now})
+        await self.redis.zremrangebyscore(workers, "-inf", now - LEASE_TTL)
+        return await self.redis.zrange(workers, 0, -1)
+
+    async def leave(self, worker):
+        await self.redis.zrem(self.key("workers"), worker)
+
+    async def acquire(self, part, worker):
+        lease = self.key("lease", part)
+        if await self.redis.set(lease, worker, nx=True, px=int(LEASE_TTL * 1000)):
+            return True
+        return bool(await self._renew(keys=[lease], args=[worker, int(LEASE_TTL * 1000)]))
+
+    async def renew(self, worker):
+        held = set()
+        for part in range(PARTITIONS):
+            if await self._renew(
+                keys=[self.key("lease", part)], args=[worker, int(LEASE_TTL * 1000)]
+            ):
+                held.add(part)
+        return held
+
+    async def release(self, part, worker):
+        await self._release(keys=[self.key("lease", part)], args=[worker])
+
+    async def close(self):
+        await self.redis.aclose()
+
+
+def open_broker(url):
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBroker(url)
+    return SQLiteBroker(url.removeprefix("sqlite:///"))
+
+
+class DistributedContext(scraper.CrawlContext):
+    """CrawlContext whose discoveries go to the broker, not local queues."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Path budgets are spent in the broker, across workers (CrawlNode.admit),
+        # not by this worker's frontier.
+        self.path_budgets = self.frontier.path_budgets
+        self.frontier.path_budgets = {}
+
+    def enqueue(self, url, depth=0, priority=None, lastmod=None):
+        # Partition queues are first-in first-out, so sitemap hints only
+        # order local crawls; the depth limit holds either way.
+        url = self.claim(url)
+        if url is None:
+            return False
+        if depth > self.frontier.max_depth:
+            self.stats["pages_too_deep"] += 1
+            return False
+        _outbox.get().append(("page", url, depth))
+        return True
+
+    async def enqueue_document(self, url):
+        self.stats["docs_found"] += 1
+        _outbox.get().append(("doc", url, 0))
+
+
+class CrawlNode:
+    """One worker of a distributed crawl.
+
+    Heartbeats through the broker, holds leases on its share of the
+    partitions and crawls every running job's URLs in them. When workers
+    join, surplus partitions are handed back once their in-flight URLs are
+    acked; when a worker leaves (or its leases expire), the partitions are
+    taken over and their unacked URLs requeued. A URL is acked only after
+    the links and documents found on it are in the broker, so nothing is
+    lost; only a worker dying mid-URL makes that URL run twice.
+    """
+
+    def __init__(self, broker, worker_id=None, output_root=""):
+        self.broker = broker
+        self.worker_id = worker_id or job_store.OWNER
+        self.output_root = output_root
+        self.owned = set()
+        self.draining = set()
+        # Popped but not yet acked, per partition.
+        self.inflight = collections.Counter()
+        self.crawls = {}
+        self.leaving = False
+        self._lease_lock = asyncio.Lock()
+
+    async def submit(
+        self,
+        url,
+        use_js,
+        doc_types,
+        output_format="files",
+        priority=scraper.DEFAULT_PRIORITY,
+        limits=None,
+    ):
+        if output_format not in scraper.OUTPUT_FORMATS:
+            raise ValueError(f"output_format must be one of {', '.join(scraper.OUTPUT_FORMATS)}")
+        if priority not in scraper.PRIORITIES:
+            raise ValueError(f"priority must be one of {', '.join(scraper.PRIORITIES)}")
+        limits = {key: value for key, value in (limits or {}).items() if value is not None}
+        check_limits(limits)
+        job_id = str(uuid.uuid4())
+        domain = urlparse(url).netloc
+        spec = {
+            "url": url,
+            "domain": domain,
+            "out_dir": f"output_{domain}",
+            "use_js": use_js,
+            "doc_types": list(doc_types),
+            "output_format": output_format,
+            "priority": priority,
+            "limits": limits,
+        }
+        await self.broker.submit(job_id, spec, [entry("page", canonicalize_url(url))])
+        return job_id
+
+    async def job_status(self, job_id):
+        """(status, progress, stats) across all workers, like get_job_status."""
+        job = await self.broker.get_job(job_id)
+        if job is None:
+            return "not_found", 0, {}
+        progress = (
+            100 if job["status"] == "done" else min(95, int(job["pages"] / scraper.MAX_PAGES * 100))
+        )
+        return job["status"], progress, {**job["stats"], "queued": job["outstanding"]}
+
+    async def run(self):
+        while True:
+            await self.rebalance()
+            await self.sync_jobs()
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+
+    async def rebalance(self):
+        workers = await self.broker.heartbeat(self.worker_id)
+        share = math.ceil(PARTITIONS / max(1, len(workers)))
+        async with self._lease_lock:
+            self.owned = await self.broker.renew(self.worker_id)
+            self.draining &= self.owned
+            # Stop taking URLs from partitions beyond our share; each is
+            # released once what we already took from it is acked.
+            surplus = max(0, len(self.owned) - share)
+            while len(self.draining) > surplus:
+                self.draining.pop()
+            self.draining.update(
+                sorted(self.owned - self.draining, reverse=True)[: surplus - len(self.draining)]
+            )
+            for part in sorted(self.draining):
+                if not self.inflight[part]:
+                    await self._release(part)
+        if len(self.owned) >= share:
+            return
+        # Start at a worker-specific offset so joiners don't race for the same partitions.
+        start = zlib.crc32(self.worker_id.encode()) % PARTITIONS
+        for i in range(PARTITIONS):
+            part = (start + i) % PARTITIONS
+            if len(self.owned) >= share:
+                break
+            if part in self.owned or not await self.broker.acquire(part, self.worker_id):
+                continue
+            # Whatever a departed worker had in flight here goes back in the queue.
+            for job_id, _ in await self.broker.jobs():
+                await self.broker.requeue(job_id, part)
+            self.owned.add(part)
+
+    async def _release(self, part):
+        for job_id, _ in await self.broker.jobs():
+            await self.broker.requeue(job_id, part)
+        await self.broker.release(part, self.worker_id)
+        self.owned.discard(part)
+        self.draining.discard(part)
+
+    async def sync_jobs(self):
+        for job_id in [job_id for job_id, task in self.crawls.items() if task.done()]:
+            del self.crawls[job_id]
+        if self.leaving:
+            return
+        for job_id, spec in await self.broker.jobs():
+            if job_id not in self.crawls:
+                self.crawls[job_id] = asyncio.create_task(self.crawl(job_id, spec))
+
+    async def leave(self, timeout=None):
+        """Stop taking URLs, finish the ones taken, and hand back every partition."""
+        self.leaving = True
+        crawls = list(self.crawls.values())
+        if crawls:
+            await asyncio.wait(crawls, timeout=DRAIN_TIMEOUT if timeout is None else timeout)
+        for task in crawls:
+            task.cancel()
+        await asyncio.gather(*crawls, return_exceptions=True)
+        async with self._lease_lock:
+            for part in sorted(self.owned):
+                await self._release(part)
+        await self.broker.leave(self.worker_id)
+
+    async def crawl(self, job_id, spec):
+        out_dir = os.path.join(self.output_root, spec["out_dir"])
+        os.makedirs(out_dir, exist_ok=True)
+        job = scraper.JOBS[job_id] = {
+            "status": "running",
+            "progress": 0,
+            "domain": spec["domain"],
+            "stats": scraper.new_job_stats(),
+        }
+        # Broker jobs skip local admission but share this process's budgets.
+        scraper.job_scheduler.register(job_id, spec.get("priority", scraper.DEFAULT_PRIORITY))
+        ctx = DistributedContext(
+            scraper.http_client.session(),
+            spec["url"],
+            spec["doc_types"],
+            out_dir,
+            job_id,
+            spec["use_js"],
+            spec.get("limits"),
+        )
+        scraper.active_crawls.add(ctx)
+        if scraper.HTTP_CACHE:
+            ctx.cache = HttpCache.for_domain(ctx.base_domain)
+        ctx.contents = await scraper.writer.open_contents(out_dir)
+        if spec["output_format"] == "jsonl":
+            ctx.records = RecordStore(out_dir)
+        queue = asyncio.Queue(maxsize=scraper.MAX_CONCURRENT)
+        workers = [
+            asyncio.create_task(self.crawl_worker(ctx, queue))
+            for _ in range(scraper.MAX_CONCURRENT)
+        ]
+        try:
+            await self.feed(ctx, queue)
+            await queue.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            scraper.active_crawls.discard(ctx)
+            if ctx.cache is not None:
+                ctx.cache.close()
+            await scraper.writer.close_contents(ctx.contents)
+            if ctx.records is not None:
+                await scraper.writer.close_records(ctx.records)
+            await scraper.writer.flush()
+            await self.broker.report_stats(job_id, self.worker_id, ctx.stats)
+            scraper.job_scheduler.finish(job_id)
+        if await self.broker.status(job_id) == "done":
+            job["status"], job["progress"] = "done", 100
+        scraper.publish_progress(ctx, force=True)
+
+    async def feed(self, ctx, queue):
+        # Keep the local queue topped up from our partitions until the job is
+        # done or this worker leaves.
+        reported = time.monotonic()
+        while not self.leaving and await self.broker.status(ctx.job_id) == "running":
+            taken = []
+            if not queue.full():
+                async with self._lease_lock:
+                    parts = sorted(self.owned - self.draining)
+                    taken = await self.broker.pop(
+                        ctx.job_id, parts, queue.maxsize - queue.qsize(), self.worker_id
+                    )
+                    for part, item in taken:
+                        self.inflight[part] += 1
+                for taken_item in taken:
+                    queue.put_nowait(taken_item)
+            if time.monotonic() - reported >= HEARTBEAT_INTERVAL:
+                await self.broker.report_stats(ctx.job_id, self.worker_id, ctx.stats)
+                reported = time.monotonic()
+            if not taken:
+                await asyncio.sleep(POLL_INTERVAL)
+
+    async def crawl_worker(self, ctx, queue):
+        while True:
+            part, item = await queue.get()
+            try:
+                await self.process(ctx, part, item)
+            finally:
+                self.inflight[part] -= 1
+                queue.task_done()
+
+    async def process(self, ctx, part, item):
+        kind, depth, url = parse_item(item)
+        outbox = []
+        _outbox.set(outbox)
+        try:
+            if kind == "doc":
+                await self.process_document(ctx, url)
+            elif await self.admit(ctx, url):
+                # crawl_page reads the page's depth from the frontier.
+                ctx.frontier.ranks[url] = (depth, 0)
+                try:
+                    await scraper.crawl_page(ctx, url)
+                finally:
+                    ctx.frontier.done(url)
+                # A page that turned out to be a document (by Content-Type)
+                # is already ours: extract it here instead of queueing it.
+                if ("doc", url, 0) in outbox:
+                    outbox.remove(("doc", url, 0))
+                    await self.process_document(ctx, url)
+        except Exception:
+            scraper.metrics.error("crawl" if kind == "page" else "document", ctx.stats)
+        entries = [entry(*found) for found in outbox]
+        if entries:
+            await persist(self.broker.add, ctx.job_id, entries)
+        await persist(self.broker.ack, ctx.job_id, part, item, self.worker_id)
+        scraper.update_progress(ctx)
+
+    async def admit(self, ctx, url):
+        """Count a page against the job's path budget and MAX_PAGES across all workers."""
+        prefix = budget_prefix(urlparse(url).path or "/", ctx.path_budgets)
+        if prefix is not None:
+            budget = ctx.path_budgets.get(prefix, ctx.path_budgets.get("*"))
+            if await self.broker.spend(ctx.job_id, prefix) > budget:
+                ctx.stats["pages_over_budget"] += 1
+                return False
+        return await self.broker.count_page(ctx.job_id) <= scraper.MAX_PAGES
+
+    async def process_document(self, ctx, url):
+        try:
+            await scraper.process_document(
+                ctx.session,
+                url,
+                ctx.doc_types,
+                ctx.out_dir,
+                ctx.stats,
+                ctx.cache,
+                ctx.contents,
+                ctx.records,
+                ctx.doc_exts.pop(url, None),
+                ctx.job_id,
+            )
+        finally:
+            ctx.stats["docs_done"] += 1
+
+
+async def persist(call, *args):
+    # A broker hiccup must not drop a URL: retry until the call goes through.
+    while True:
+        try:
+            return await call(*args)
+        except Exception:
+            scraper.metrics.error("broker")
+            await asyncio.sleep(POLL_INTERVAL)
+
+
+def node_from_env():
+    return CrawlNode(open_broker(BROKER_URL)) if BROKER_URL else None
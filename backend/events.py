@@ -0,0 +1,33 @@
+import asyncio
+
+# Progress events are snapshots, so a subscriber that falls behind only
+# needs the latest ones: the oldest queued event is dropped when full.
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+class EventBus:
+    """In-process fan-out of job events to streaming API clients."""
+
+    def __init__(self):
+        self.subscribers = {}
+
+    def subscribe(self, job_id):
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.subscribers.setdefault(job_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, job_id, queue):
+        queues = self.subscribers.get(job_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self.subscribers[job_id]
+
+    def publish(self, job_id, event):
+        for queue in self.subscribers.get(job_id, ()):
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+    def has_subscribers(self, job_id):
+        return bool(self.subscribers.get(job_id))
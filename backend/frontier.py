@@ -0,0 +1,116 @@
+import asyncio
+import itertools
+import re
+import time
+from urllib.parse import urlsplit
+
+# Frontier order: lower scores are crawled first. Every link hop from the
+# seed costs DEPTH_WEIGHT; a sitemap <priority> above the default 0.5 and a
+# recent <lastmod> pull a page forward, and URLs matching PATH_PATTERNS
+# (matched against path and query) are pushed back by the given weight.
+DEPTH_WEIGHT = 1.0
+PRIORITY_WEIGHT = 2.0
+DEFAULT_PRIORITY = 0.5
+LASTMOD_WEIGHT = 1.0
+LASTMOD_HORIZON = 365 * 24 * 3600  # lastmod older than this earns nothing
+PATH_PATTERNS = {
+    r"/(calendar|events?)/\d{4}|[?&](day|month|year|date)=": 5.0,
+    r"/\d{4}/\d{1,2}(/\d{1,2})?/?$": 3.0,
+    r"/(tags?|category|categories|author|archives?)/": 3.0,
+    r"[?&](page|sort|order|filter|view)=": 2.0,
+    r"/(login|logout|signin|register|cart|share|print|feed|rss)(/|$|\?)": 5.0,
+}
+# Per-job limits. Pages more than MAX_DEPTH link hops from the seed are not
+# queued; pages found in sitemaps count as SITEMAP_DEPTH hops. PATH_BUDGETS
+# caps the pages fetched under a path prefix ({"/events/": 50}); the
+# longest matching prefix wins and "*" gives every top-level directory
+# without its own entry that many pages.
+MAX_DEPTH = 25
+SITEMAP_DEPTH = 1
+PATH_BUDGETS = {}
+
+
+def score_url(url, depth, priority=None, lastmod=None):
+    parts = urlsplit(url)
+    target = f"{parts.path}?{parts.query}" if parts.query else parts.path
+    score = depth * DEPTH_WEIGHT
+    score -= PRIORITY_WEIGHT * (
+        (DEFAULT_PRIORITY if priority is None else priority) - DEFAULT_PRIORITY
+    )
+    if lastmod is not None:
+        age = max(0.0, time.time() - lastmod)
+        score -= LASTMOD_WEIGHT * max(0.0, 1 - age / LASTMOD_HORIZON)
+    for pattern, weight in PATH_PATTERNS.items():
+        if re.search(pattern, target, re.IGNORECASE):
+            score += weight
+    return round(score, 4)
+
+
+def budget_prefix(path, budgets):
+    """The prefix whose budget a path counts against, or None."""
+    matches = [prefix for prefix in budgets if prefix != "*" and path.startswith(prefix)]
+    if matches:
+        return max(matches, key=len)
+    if "*" in budgets:
+        parts = path.split("/")
+        return f"/{parts[1]}/" if len(parts) > 2 else "/"
+    return None
+
+
+def check_limits(limits):
+    """Raise ValueError for per-job limits the frontier cannot apply."""
+    max_depth = limits.get("max_depth")
+    if max_depth is not None and (not isinstance(max_depth, int) or max_depth < 0):
+        raise ValueError("max_depth must be a non-negative integer")
+    for prefix, budget in (limits.get("path_budgets") or {}).items():
+        if prefix != "*" and not prefix.startswith("/"):
+            raise ValueError("path_budgets keys must be path prefixes starting with / (or *)")
+        if not isinstance(budget, int) or budget < 0:
+            raise ValueError("path_budgets values must be non-negative integers")
+
+
+class Frontier(asyncio.PriorityQueue):
+    """A job's page queue, best score first, with its depth limit and path budgets.
+
+    Entries are (score, arrival, url), so pages with equal scores keep
+    breadth-first order. ``ranks`` holds the depth and score of every page
+    queued or in flight, for its links' depth and for checkpoints.
+    """
+
+    def __init__(self, max_depth=None, path_budgets=None):
+        super().__init__()
+        self.max_depth = MAX_DEPTH if max_depth is None else max_depth
+        self.path_budgets = PATH_BUDGETS if path_budgets is None else path_budgets
+        self.ranks = {}
+        self.spent = {}
+        self._arrivals = itertools.count()
+
+    def push(self, url, depth=0, priority=None, lastmod=None, score=None):
+        """Queue a page; False if it is deeper than the job allows."""
+        if depth > self.max_depth:
+            return False
+        if score is None:
+            score = score_url(url, depth, priority, lastmod)
+        self.ranks[url] = (depth, score)
+        self.put_nowait((score, next(self._arrivals), url))
+        return True
+
+    async def pop(self):
+        return (await self.get())[2]
+
+    def depth(self, url):
+        return self.ranks.get(url, (0, 0))[0]
+
+    def done(self, url):
+        self.ranks.pop(url, None)
+
+    def spend(self, url):
+        """Count a page against its path budget; False once that is used up."""
+        prefix = budget_prefix(urlsplit(url).path or "/", self.path_budgets)
+        if prefix is None:
+            return True
+        budget = self.path_budgets.get(prefix, self.path_budgets.get("*"))
+        if self.spent.get(prefix, 0) >= budget:
+            return False
+        self.spent[prefix] = self.spent.get(prefix, 0) + 1
+        return True
@@ -0,0 +1,99 @@
+import codecs
+import re
+from urllib.parse import urljoin
+
+import lxml.html
+from lxml import etree
+
+from content_index import simhash
+
+# Tags whose text never reaches the output (BeautifulSoup's get_text skips
+# them as well).
+SKIP_TAGS = ("script", "style", "template")
+# <meta charset> / http-equiv declarations must sit in the first 1024 bytes
+# (HTML spec); look a little further for sloppy pages.
+SNIFF_BYTES = 4096
+BOMS = (
+    (codecs.BOM_UTF8, "utf-8"),
+    (codecs.BOM_UTF16_LE, "utf-16-le"),
+    (codecs.BOM_UTF16_BE, "utf-16-be"),
+)
+META_CHARSET = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?\s*([a-zA-Z0-9_:.-]+)""", re.I)
+
+
+def parse_page(body, url, charset=None, backend="lxml"):
+    """Turn a raw HTML body into {"title", "text", "links", "simhash"}.
+
+    Kept free of crawler state and heavy imports so it can run in a
+    process-pool worker; links come back already resolved against ``url``
+    and the text's SimHash is computed here for near-duplicate detection.
+    """
+    if not body:
+        return {"title": "", "text": "", "links": [], "simhash": None}
+    if backend == "bs4":
+        page = _parse_bs4(body, url, charset)
+    else:
+        page = _parse_lxml(body, url, charset)
+    page["simhash"] = simhash(page["text"])
+    return page
+
+
+def sniff_charset(head):
+    """Charset from a byte-order mark or <meta> in the start of a body, or None."""
+    for bom, name in BOMS:
+        if head.startswith(bom):
+            return name
+    match = META_CHARSET.search(head[:SNIFF_BYTES])
+    if match:
+        name = match.group(1).decode("ascii").lower()
+        try:
+            return codecs.lookup(name).name
+        except LookupError:
+            pass
+    return None
+
+
+def guess_charset(body, header_charset=None):
+    if header_charset:
+        return header_charset
+    sniffed = sniff_charset(body)
+    if sniffed:
+        return sniffed
+    try:
+        body.decode("utf-8")
+        return "utf-8"
+    except UnicodeDecodeError:
+        # Let the parser go by <meta charset>, or its latin-1 default.
+        return None
+
+
+def _parse_lxml(body, url, charset):
+    try:
+        parser = lxml.html.HTMLParser(encoding=guess_charset(body, charset), remove_comments=True)
+    except LookupError:
+        parser = lxml.html.HTMLParser(remove_comments=True)
+    try:
+        root = lxml.html.document_fromstring(body, parser=parser)
+    except (etree.ParserError, ValueError):
+        return {"title": "", "text": "", "links": []}
+
+    title_el = root.find(".//title")
+    title = title_el.text_content().strip() if title_el is not None else ""
+    links = [urljoin(url, a.get("href").strip()) for a in root.iter("a") if a.get("href")]
+
+    etree.strip_elements(root, *SKIP_TAGS, with_tail=False)
+    text = "\n".join(s.strip() for s in root.itertext() if s.strip())
+    return {"title": title, "text": text, "links": links}
+
+
+def _parse_bs4(body, url, charset):
+    from bs4 import BeautifulSoup
+
+    try:
+        soup = BeautifulSoup(body, "lxml", from_encoding=charset)
+    except Exception:
+        soup = BeautifulSoup(body, "html.parser", from_encoding=charset)
+    title = soup.title.string if soup.title and soup.title.string else ""
+    links = [urljoin(url, a["href"].strip()) for a in soup.find_all("a", href=True)]
+    text = soup.get_text(separator="\n", strip=True)
+    return {"title": title.strip(), "text": text, "links": links}
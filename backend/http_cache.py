@@ -0,0 +1,82 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+# One SQLite file per crawled domain, keyed by canonical URL.
+CACHE_DIR = "http_cache"
+COMMIT_EVERY = 100
+
+
+class HttpCache:
+    """Validators and content hashes from earlier crawls of a domain.
+
+    Lets a re-crawl send conditional requests and skip parsing/extraction
+    for anything that comes back 304 or with an unchanged body. For pages
+    the outgoing links are kept too, so the crawl can continue past an
+    unchanged page without parsing it again.
+    """
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, content_hash TEXT, links TEXT, fetched_at REAL)"
+        )
+        self.pending = 0
+
+    @classmethod
+    def for_domain(cls, domain):
+        return cls(os.path.join(CACHE_DIR, domain.replace(":", "_") + ".sqlite3"))
+
+    def get(self, url):
+        row = self.db.execute(
+            "SELECT etag, last_modified, content_hash, links FROM entries WHERE url = ?", (url,)
+        ).fetchone()
+        if row is None:
+            return None
+        etag, last_modified, digest, links = row
+        return {
+            "etag": etag,
+            "last_modified": last_modified,
+            "content_hash": digest,
+            "links": json.loads(links) if links else [],
+        }
+
+    def put(self, url, etag=None, last_modified=None, content_hash=None, links=None):
+        self.db.execute(
+            "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                url,
+                etag,
+                last_modified,
+                content_hash,
+                json.dumps(links) if links is not None else None,
+                time.time(),
+            ),
+        )
+        self.pending += 1
+        if self.pending >= COMMIT_EVERY:
+            self.db.commit()
+            self.pending = 0
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+
+def conditional_headers(entry):
+    headers = {}
+    if entry:
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
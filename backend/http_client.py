@@ -0,0 +1,64 @@
+import asyncio
+import os
+import ssl
+
+import aiohttp
+
+# Keep-alive pools: sockets across all hosts, and per host. Idle sockets
+# stay open KEEPALIVE_TIMEOUT seconds for the next request to that host.
+POOL_LIMIT = 100
+POOL_LIMIT_PER_HOST = 20
+KEEPALIVE_TIMEOUT = 30
+# Resolved addresses are reused for DNS_TTL seconds.
+DNS_TTL = 300
+# Certificate verification. SCRAPER_VERIFY_TLS=0 accepts any certificate
+# (the old per-request ssl=False); SCRAPER_CA_BUNDLE adds trusted roots,
+# e.g. for a site behind a private CA.
+VERIFY_TLS = os.environ.get("SCRAPER_VERIFY_TLS", "1") != "0"
+CA_BUNDLE = os.environ.get("SCRAPER_CA_BUNDLE")
+
+
+def tls_context():
+    """The one SSLContext every connection shares (False: no verification)."""
+    if not VERIFY_TLS:
+        return False
+    return ssl.create_default_context(cafile=CA_BUNDLE)
+
+
+class HttpClient:
+    """The process-wide aiohttp session every job fetches through.
+
+    One connector means one DNS cache and one set of keep-alive pools, so
+    a job crawling a host another job (or an earlier crawl) just visited
+    reuses its sockets and skips DNS, TCP and TLS setup. The session is
+    created on first use and closed by the app's lifespan; per-job details
+    such as stats travel with each request as ``trace_request_ctx``.
+    """
+
+    def __init__(self, trace_configs=()):
+        self.trace_configs = list(trace_configs)
+        self._session = None
+        self._loop = None
+
+    def session(self):
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            connector = aiohttp.TCPConnector(
+                limit=POOL_LIMIT,
+                limit_per_host=POOL_LIMIT_PER_HOST,
+                keepalive_timeout=KEEPALIVE_TIMEOUT,
+                ttl_dns_cache=DNS_TTL,
+                ssl=tls_context(),
+                enable_cleanup_closed=True,
+            )
+            timeout = aiohttp.ClientTimeout(total=15, connect=5)
+            self._session = aiohttp.ClientSession(
+                connector=connector, timeout=timeout, trace_configs=self.trace_configs
+            )
+            self._loop = loop
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
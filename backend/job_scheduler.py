@@ -0,0 +1,154 @@
+import asyncio
+import bisect
+import collections
+import contextlib
+import itertools
+
+# Jobs crawled at once by this process; later ones wait in the queue (by
+# priority class, then arrival) and report their place in it via /status.
+MAX_RUNNING_JOBS = 4
+# Page requests and document downloads in flight across every running job;
+# a slot covers the request and body read only. One job on its own never
+# needs more than MAX_CONCURRENT and DOC_CONCURRENCY; the budgets only bite
+# when jobs compete.
+FETCH_BUDGET = 64
+DOCUMENT_BUDGET = 16
+# Priority classes: admission order, and each running job's weight in the
+# round-robin over the shared budgets.
+PRIORITIES = {"high": 4, "normal": 2, "low": 1}
+DEFAULT_PRIORITY = "normal"
+# Queued jobs call their heartbeat this often so their lease in the job
+# store (job_store.LEASE_TIMEOUT) does not lapse while they wait.
+QUEUED_HEARTBEAT = 20
+
+
+class FairShare:
+    """A pool of slots shared by jobs, handed out by weighted round-robin.
+
+    Free slots go to whoever asks. Once the pool is exhausted, callers wait
+    per job and every released slot goes to the job chosen by smooth
+    weighted round-robin among those waiting, so a job with a deep frontier
+    cannot starve the others and heavier jobs get proportionally more turns.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.in_use = 0
+        self.waiters = {}
+        self.weights = {}
+        self.current = {}
+
+    def register(self, job_id, weight):
+        self.weights[job_id] = weight
+
+    def unregister(self, job_id):
+        self.weights.pop(job_id, None)
+        self.current.pop(job_id, None)
+
+    @contextlib.asynccontextmanager
+    async def slot(self, job_id):
+        await self.acquire(job_id)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire(self, job_id):
+        if self.in_use < self.size and not self.waiters:
+            self.in_use += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.setdefault(job_id, collections.deque()).append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()  # handed a slot just as we were cancelled
+            else:
+                self._forget(job_id, waiter)
+            raise
+
+    def release(self):
+        self.in_use -= 1
+        while self.in_use < self.size and self.waiters:
+            job_id = self._next_job()
+            waiter = self.waiters[job_id].popleft()
+            if not self.waiters[job_id]:
+                del self.waiters[job_id]
+            if not waiter.done():
+                self.in_use += 1
+                waiter.set_result(None)
+
+    def _next_job(self):
+        total = 0
+        for job_id in self.waiters:
+            weight = self.weights.get(job_id, PRIORITIES[DEFAULT_PRIORITY])
+            self.current[job_id] = self.current.get(job_id, 0) + weight
+            total += weight
+        chosen = max(self.waiters, key=self.current.get)
+        self.current[chosen] -= total
+        return chosen
+
+    def _forget(self, job_id, waiter):
+        waiters = self.waiters.get(job_id)
+        if waiters and waiter in waiters:
+            waiters.remove(waiter)
+            if not waiters:
+                del self.waiters[job_id]
+
+
+class JobScheduler:
+    """Admits jobs up to MAX_RUNNING_JOBS and shares the fetch and document
+    budgets between the running ones."""
+
+    def __init__(self):
+        self.running = set()
+        self.queue = []
+        self.fetch = FairShare(FETCH_BUDGET)
+        self.documents = FairShare(DOCUMENT_BUDGET)
+        self._arrivals = itertools.count()
+
+    def position(self, job_id):
+        """1-based place of a queued job, or None if it is not queued."""
+        for n, (_, _, queued_id, _, _) in enumerate(self.queue, start=1):
+            if queued_id == job_id:
+                return n
+        return None
+
+    async def admit(self, job_id, priority=DEFAULT_PRIORITY, heartbeat=None):
+        """Wait until the job may run; call finish() when it is done."""
+        if len(self.running) < MAX_RUNNING_JOBS and not self.queue:
+            self.register(job_id, priority)
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        entry = (-PRIORITIES[priority], next(self._arrivals), job_id, priority, waiter)
+        bisect.insort(self.queue, entry)
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(asyncio.shield(waiter), QUEUED_HEARTBEAT)
+                    return
+                except TimeoutError:
+                    if heartbeat is not None:
+                        heartbeat()
+        except BaseException:
+            if waiter.done():
+                self.finish(job_id)
+            else:
+                self.queue.remove(entry)
+            raise
+
+    def register(self, job_id, priority=DEFAULT_PRIORITY):
+        self.running.add(job_id)
+        self.fetch.register(job_id, PRIORITIES[priority])
+        self.documents.register(job_id, PRIORITIES[priority])
+
+    def finish(self, job_id):
+        if job_id in self.running:
+            self.running.discard(job_id)
+            self.fetch.unregister(job_id)
+            self.documents.unregister(job_id)
+        while len(self.running) < MAX_RUNNING_JOBS and self.queue:
+            _, _, queued_id, priority, waiter = self.queue.pop(0)
+            self.register(queued_id, priority)
+            waiter.set_result(None)
@@ -0,0 +1,188 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+
+# SQLite file shared by every worker process of the API.
+JOB_DB = "jobs.sqlite3"
+# A running job whose owner has not checkpointed for LEASE_TIMEOUT seconds is
+# considered orphaned and may be resumed by any worker; after MAX_ATTEMPTS
+# resumes it is marked failed instead.
+LEASE_TIMEOUT = 60
+MAX_ATTEMPTS = 3
+
+# Identifies this process as the owner of the jobs it runs.
+OWNER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+_store = None
+
+
+class JobStore:
+    """Job records and crawl checkpoints (frontier, seen and visited sets)."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "job_id TEXT PRIMARY KEY, url TEXT, domain TEXT, out_dir TEXT, use_js INTEGER, doc_types TEXT, "
+            "status TEXT, progress INTEGER, stats TEXT, owner TEXT, heartbeat_at REAL, attempts INTEGER DEFAULT 0, "
+            "created_at REAL, output_format TEXT DEFAULT 'files', priority TEXT DEFAULT 'normal', limits TEXT DEFAULT '{}')"
+        )
+        for column in (
+            "output_format TEXT DEFAULT 'files'",
+            "priority TEXT DEFAULT 'normal'",
+            "limits TEXT DEFAULT '{}'",
+        ):
+            try:
+                self.db.execute(f"ALTER TABLE jobs ADD COLUMN {column}")
+            except sqlite3.OperationalError:
+                pass  # already there
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS checkpoints (job_id TEXT PRIMARY KEY, state BLOB, saved_at REAL)"
+        )
+
+    @property
+    def db(self):
+        # One connection per thread: the event loop, plus any threads the
+        # API server runs handlers on.
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = self._local.db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        return db
+
+    def create_job(
+        self,
+        job_id,
+        url,
+        domain,
+        out_dir,
+        use_js,
+        doc_types,
+        output_format="files",
+        priority="normal",
+        limits=None,
+    ):
+        # Jobs start out queued; the scheduler marks them running on admission.
+        now = time.time()
+        self.db.execute(
+            "INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?, 'queued', 0, '{}', ?, ?, 0, ?, ?, ?, ?)",
+            (
+                job_id,
+                url,
+                domain,
+                out_dir,
+                int(bool(use_js)),
+                json.dumps(list(doc_types)),
+                OWNER,
+                now,
+                now,
+                output_format,
+                priority,
+                json.dumps(limits or {}),
+            ),
+        )
+
+    def get_job(self, job_id):
+        row = self.db.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._job(row) if row else None
+
+    def save_progress(self, job_id, status, progress, stats):
+        # Doubles as the owner's heartbeat.
+        self.db.execute(
+            "UPDATE jobs SET status = ?, progress = ?, stats = ?, heartbeat_at = ? WHERE job_id = ? AND owner = ?",
+            (status, progress, json.dumps(stats), time.time(), job_id, OWNER),
+        )
+
+    def save_checkpoint(self, job_id, state):
+        blob = zlib.compress(json.dumps(state).encode())
+        self.db.execute(
+            "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?)", (job_id, blob, time.time())
+        )
+
+    def load_checkpoint(self, job_id):
+        row = self.db.execute(
+            "SELECT state FROM checkpoints WHERE job_id = ?", (job_id,)
+        ).fetchone()
+        return json.loads(zlib.decompress(row[0])) if row else None
+
+    def finish(self, job_id, status, progress, stats):
+        self.save_progress(job_id, status, progress, stats)
+        self.db.execute("DELETE FROM checkpoints WHERE job_id = ?", (job_id,))
+
+    def release(self, job_id):
+        # Give up the lease right away (graceful shutdown) so another worker
+        # or the next start can resume without waiting for LEASE_TIMEOUT.
+        self.db.execute(
+            "UPDATE jobs SET heartbeat_at = 0 WHERE job_id = ? AND owner = ?", (job_id, OWNER)
+        )
+
+    def claim_orphans(self):
+        """Take over queued or running jobs whose owner stopped heartbeating."""
+        cutoff = time.time() - LEASE_TIMEOUT
+        self.db.execute(
+            "UPDATE jobs SET status = 'failed' WHERE status IN ('queued', 'running') AND heartbeat_at < ? AND attempts >= ?",
+            (cutoff, MAX_ATTEMPTS),
+        )
+        claimed = []
+        for (job_id,) in self.db.execute(
+            "SELECT job_id FROM jobs WHERE status IN ('queued', 'running') AND heartbeat_at < ?",
+            (cutoff,),
+        ).fetchall():
+            cur = self.db.execute(
+                "UPDATE jobs SET owner = ?, heartbeat_at = ?, attempts = attempts + 1 "
+                "WHERE job_id = ? AND status IN ('queued', 'running') AND heartbeat_at < ?",
+                (OWNER, time.time(), job_id, cutoff),
+            )
+            if cur.rowcount == 1:
+                claimed.append(self.get_job(job_id))
+        return claimed
+
+    @staticmethod
+    def _job(row):
+        (
+            job_id,
+            url,
+            domain,
+            out_dir,
+            use_js,
+            doc_types,
+            status,
+            progress,
+            stats,
+            owner,
+            heartbeat_at,
+            attempts,
+            created_at,
+            output_format,
+            priority,
+            limits,
+        ) = row
+        return {
+            "job_id": job_id,
+            "url": url,
+            "domain": domain,
+            "out_dir": out_dir,
+            "use_js": bool(use_js),
+            "doc_types": json.loads(doc_types),
+            "output_format": output_format or "files",
+            "priority": priority or "normal",
+            "limits": json.loads(limits or "{}"),
+            "status": status,
+            "progress": progress,
+            "stats": json.loads(stats or "{}"),
+            "owner": owner,
+            "attempts": attempts,
+        }
+
+
+def get_store():
+    global _store
+    if _store is None or _store.path != JOB_DB:
+        _store = JobStore(JOB_DB)
+    return _store
@@ -0,0 +1,165 @@
+import asyncio
+import queue
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Browsers kept alive for use_js crawls; also the number of pages rendered at
+# once across all jobs.
+RENDER_POOL_SIZE = 4
+RENDER_TIMEOUT = 20
+# A page is settled once its resource timeline has not grown for this long
+# (or RENDER_WAIT_SELECTOR matches, when set).
+NETWORK_IDLE_TIME = 0.5
+RENDER_WAIT_SELECTOR = None
+# After a failed browser launch, stop trying for this long.
+LAUNCH_RETRY_AFTER = 300
+
+# Static HTML with less visible text than this, plus scripts or a typical
+# SPA mount point, is treated as a JavaScript shell worth rendering.
+JS_SHELL_MAX_TEXT = 200
+MOUNT_POINT = re.compile(rb'<div[^>]+id=["\'](root|app|__next|__nuxt)["\'][^>]*>\s*</div>', re.I)
+NOSCRIPT_JS = re.compile(rb"<noscript[^>]*>[^<]*javascript", re.I)
+
+
+def looks_like_js_shell(body, text):
+    if len(text) >= JS_SHELL_MAX_TEXT:
+        return False
+    return bool(MOUNT_POINT.search(body) or NOSCRIPT_JS.search(body) or b"<script" in body.lower())
+
+
+class BrowserPool:
+    """A bounded pool of reusable headless Chrome sessions.
+
+    Selenium is blocking, so rendering runs on a small dedicated thread pool;
+    a browser is taken from the pool per page and handed back afterwards
+    instead of being launched and torn down for every URL.
+    """
+
+    def __init__(self, size=None):
+        self.size = size or RENDER_POOL_SIZE
+        self.idle = queue.Queue()
+        self.created = 0
+        self.lock = threading.Lock()
+        self.executor = None
+        self.unavailable_until = 0.0
+
+    async def render(self, url, wait_selector=None):
+        """Return the rendered HTML of ``url``, or None if no browser is available."""
+        if time.monotonic() < self.unavailable_until:
+            return None
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix="render")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, self._render, url, wait_selector or RENDER_WAIT_SELECTOR
+        )
+
+    def close(self):
+        while True:
+            try:
+                driver = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                driver.quit()
+            except Exception:
+                pass
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+        self.created = 0
+
+    def _render(self, url, wait_selector):
+        driver = self._acquire()
+        if driver is None:
+            return None
+        try:
+            driver.get(url)
+            wait_until_settled(driver, wait_selector)
+            html = driver.page_source
+        except Exception:
+            # A crashed or wedged browser is not returned to the pool.
+            self._discard(driver)
+            return None
+        self.idle.put(driver)
+        return html
+
+    def _acquire(self):
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            can_create = self.created < self.size
+            if can_create:
+                self.created += 1
+        if not can_create:
+            return self.idle.get()
+        try:
+            return launch_browser()
+        except Exception:
+            with self.lock:
+                self.created -= 1
+            self.unavailable_until = time.monotonic() + LAUNCH_RETRY_AFTER
+            return None
+
+    def _discard(self, driver):
+        try:
+            driver.quit()
+        except Exception:
+            pass
+        with self.lock:
+            self.created -= 1
+
+
+def launch_browser():
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+
+    options = Options()
+    options.add_argument("--headless=new")
+    options.add_argument("--disable-gpu")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    driver = webdriver.Chrome(options=options)
+    driver.set_page_load_timeout(RENDER_TIMEOUT)
+    return driver
+
+
+def wait_until_settled(driver, wait_selector=None):
+    from selenium.common.exceptions import TimeoutException
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions
+    from selenium.webdriver.support.ui import WebDriverWait
+
+    wait = WebDriverWait(driver, RENDER_TIMEOUT, poll_frequency=0.1)
+    try:
+        if wait_selector:
+            wait.until(
+                expected_conditions.presence_of_element_located((By.CSS_SELECTOR, wait_selector))
+            )
+        else:
+            wait.until(NetworkIdle(NETWORK_IDLE_TIME))
+    except TimeoutException:
+        pass  # take whatever has rendered so far
+
+
+class NetworkIdle:
+    """WebDriverWait condition: document loaded and no new resource requests for ``idle`` seconds."""
+
+    def __init__(self, idle):
+        self.idle = idle
+        self.count = -1
+        self.since = time.monotonic()
+
+    def __call__(self, driver):
+        if driver.execute_script("return document.readyState") != "complete":
+            return False
+        count = driver.execute_script("return performance.getEntriesByType('resource').length")
+        now = time.monotonic()
+        if count != self.count:
+            self.count, self.since = count, now
+            return False
+        return now - self.since >= self.idle
@@ -1,13 +1,38 @@
 from fastapi import FastAPI, UploadFile, Form, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
+from contextlib import asynccontextmanager
+import asyncio
+import json
 import os
 
-from scraper import start_scrape_job, get_job_status, list_results, get_result_file
+from scraper import start_scrape_job, get_job_status, job_scheduler, list_results, get_result_file, get_result_record, export_results, watch_orphaned_jobs, stream_job_events, renderer, metrics, http_client
+from archive import EXPORT_FORMATS
+import distributed
 from ai_text_tools import score_text, deai_text
 
-app = FastAPI(title="Universal Educational Web Scraper & AI Analyzer")
+# Set when CRAWL_BROKER points at a broker: jobs are then crawled by every
+# worker attached to it instead of by the process that accepted them.
+crawl_node = distributed.node_from_env()
+# /events polls the broker this often (seconds) for a distributed job's progress.
+NODE_EVENT_POLL_INTERVAL = 1.0
+
+@asynccontextmanager
+async def lifespan(app):
+    # Pick up jobs left running by a crashed or restarted worker.
+    watcher = asyncio.create_task(watch_orphaned_jobs())
+    node_task = asyncio.create_task(crawl_node.run()) if crawl_node else None
+    yield
+    watcher.cancel()
+    if node_task is not None:
+        node_task.cancel()
+        # Finish the URLs already taken and hand our partitions to the others.
+        await crawl_node.leave()
+    await http_client.close()
+    renderer.close()
+
+app = FastAPI(title="Universal Educational Web Scraper & AI Analyzer", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -21,28 +46,101 @@ class ScrapeRequest(BaseModel):
     url: str
     use_js: bool = True
     doc_types: list = ["docx", "pdf", "csv", "xlsx", "pptx", "txt"]
+    output_format: str = "files"
+    priority: str = "normal"
+    max_depth: int | None = None
+    path_budgets: dict = {}
 
 @app.post("/scrape")
 async def scrape(request: ScrapeRequest):
-    job_id = await start_scrape_job(request.url, request.use_js, request.doc_types)
+    try:
+        limits = {"max_depth": request.max_depth, "path_budgets": request.path_budgets}
+        if crawl_node:
+            job_id = await crawl_node.submit(request.url, request.use_js, request.doc_types, request.output_format, request.priority, limits)
+        else:
+            job_id = await start_scrape_job(request.url, request.use_js, request.doc_types, request.output_format, request.priority, limits)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
     return {"job_id": job_id}
 
 @app.get("/status/{job_id}")
 async def status(job_id: str):
-    status, progress = get_job_status(job_id)
-    return {"status": status, "progress": progress}
+    status, progress, stats = await crawl_node.job_status(job_id) if crawl_node else ("not_found", 0, {})
+    if status == "not_found":
+        status, progress, stats = get_job_status(job_id)
+    response = {"status": status, "progress": progress, "stats": stats}
+    if status == "queued":
+        response["queue_position"] = job_scheduler.position(job_id)
+    return response
+
+@app.get("/events/{job_id}")
+async def events(job_id: str):
+    """Server-Sent Events stream of a job's progress, ending when it stops running"""
+    async def sse():
+        async for event in node_job_events(job_id) if crawl_node else stream_job_events(job_id):
+            if event is None:
+                yield ": keepalive\n\n"
+            else:
+                yield f"data: {json.dumps(event)}\n\n"
+    return StreamingResponse(sse(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+async def node_job_events(job_id):
+    """Progress events of a distributed job, polled from the broker in the
+    shape stream_job_events yields; jobs the broker does not know are
+    followed locally."""
+    status, progress, stats = await crawl_node.job_status(job_id)
+    if status == "not_found":
+        async for event in stream_job_events(job_id):
+            yield event
+        return
+    last = {"type": "progress", "status": status, "progress": progress, **stats}
+    yield last
+    while last["status"] in ("queued", "running"):
+        await asyncio.sleep(NODE_EVENT_POLL_INTERVAL)
+        status, progress, stats = await crawl_node.job_status(job_id)
+        event = {"type": "progress", "status": status, "progress": progress, **stats}
+        if event == last:
+            continue
+        last = event
+        yield event
 
 @app.get("/results/{domain}")
-async def results(domain: str):
-    return {"files": list_results(domain)}
+async def results(domain: str, cursor: str = None, limit: int = 100, type: str = None, ext: str = None,
+                  min_size: int = None, max_size: int = None):
+    """One page of result names; pass next_cursor back as cursor for the next page"""
+    try:
+        files, next_cursor = list_results(domain, cursor, limit, type, ext, min_size, max_size)
+    except ValueError:
+        return JSONResponse({"error": "Invalid cursor"}, status_code=400)
+    return {"files": files, "next_cursor": next_cursor}
 
 @app.get("/download/{domain}/{filename}")
 async def download(domain: str, filename: str):
+    """One result file; honours Range requests (206 Partial Content)"""
+    record = get_result_record(domain, filename)
+    if record is not None:
+        return JSONResponse(record)
     path = get_result_file(domain, filename)
     if not os.path.exists(path):
         return JSONResponse({"error": "File not found"}, status_code=404)
     return FileResponse(path, filename=filename)
 
+@app.get("/export/{domain}")
+async def export(domain: str, format: str = "zip"):
+    """Every result for a domain as one zip or tar.gz, streamed as it is built"""
+    if format not in EXPORT_FORMATS:
+        return JSONResponse({"error": f"format must be one of {', '.join(EXPORT_FORMATS)}"}, status_code=400)
+    if not os.path.isdir(f"output_{domain}"):
+        return JSONResponse({"error": "Domain not found"}, status_code=404)
+    media_type = "application/zip" if format == "zip" else "application/gzip"
+    headers = {"Content-Disposition": f'attachment; filename="{domain}.{format}"'}
+    return StreamingResponse(export_results(domain, format), media_type=media_type, headers=headers)
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Crawl stage latencies, byte/error counters and queue depths (Prometheus text format)"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.post("/score-text")
 async def api_score_text(request: Request):
     data = await request.form()
@@ -0,0 +1,255 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import aiohttp
+
+# Histogram buckets (seconds) shared by every stage.
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Metrics:
+    """Process-wide crawl instrumentation, rendered in Prometheus text format.
+
+    Stage latencies go into histograms, bytes and errors into counters, and
+    queue depths are read from registered callbacks at scrape time. Calls
+    that pass a job's stats dict also fold into that job's summary
+    (``timings`` and ``errors_by_category``), which travels with the job
+    record.
+    """
+
+    def __init__(self, prefix="scraper"):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._bytes = {}
+        self._errors = {}
+        self._retries = {}
+        self._connections = {}
+        self._dns = {}
+        self._gauges = {}
+
+    def observe(self, stage, seconds, stats=None):
+        with self._lock:
+            hist = self._histograms.get(stage)
+            if hist is None:
+                hist = self._histograms[stage] = {
+                    "buckets": [0] * len(BUCKETS),
+                    "sum": 0.0,
+                    "count": 0,
+                }
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    hist["buckets"][i] += 1
+            hist["sum"] += seconds
+            hist["count"] += 1
+        if stats is not None:
+            summary = stats.setdefault("timings", {}).setdefault(
+                stage, {"count": 0, "avg_ms": 0.0, "max_ms": 0.0}
+            )
+            ms = seconds * 1000
+            summary["count"] += 1
+            summary["avg_ms"] = round(
+                summary["avg_ms"] + (ms - summary["avg_ms"]) / summary["count"], 3
+            )
+            summary["max_ms"] = round(max(summary["max_ms"], ms), 3)
+
+    def time(self, stage, stats=None):
+        return _Timer(self, stage, stats)
+
+    def count_bytes(self, kind, nbytes):
+        with self._lock:
+            self._bytes[kind] = self._bytes.get(kind, 0) + nbytes
+
+    def error(self, category, stats=None):
+        with self._lock:
+            self._errors[category] = self._errors.get(category, 0) + 1
+        if stats is not None:
+            errors = stats.setdefault("errors_by_category", {})
+            errors[category] = errors.get(category, 0) + 1
+
+    def retry(self, category, stats=None):
+        """Count a failed attempt that is being retried."""
+        with self._lock:
+            self._retries[category] = self._retries.get(category, 0) + 1
+        if stats is not None:
+            stats["retries"] = stats.get("retries", 0) + 1
+
+    def connection(self, kind, stats=None):
+        """Count a pooled connection opened ("new") or taken from the pool ("reused")."""
+        with self._lock:
+            self._connections[kind] = self._connections.get(kind, 0) + 1
+        if stats is not None:
+            stats[f"connections_{kind}"] = stats.get(f"connections_{kind}", 0) + 1
+
+    def dns_cache(self, result):
+        with self._lock:
+            self._dns[result] = self._dns.get(result, 0) + 1
+
+    def gauge(self, name, read):
+        """Register ``read()`` as the current value of queue/gauge ``name``."""
+        self._gauges[name] = read
+
+    def trace_config(self):
+        """aiohttp tracing that times DNS, connect and time-to-first-byte and
+        counts connection reuse; a request's job stats come in as
+        ``trace_request_ctx={"stats": stats}``."""
+        config = aiohttp.TraceConfig(
+            trace_config_ctx_factory=lambda trace_request_ctx: SimpleNamespace(
+                stats=(trace_request_ctx or {}).get("stats")
+            )
+        )
+
+        def started(name):
+            async def handler(session, ctx, params):
+                setattr(ctx, name, time.perf_counter())
+
+            return handler
+
+        def finished(name, stage):
+            async def handler(session, ctx, params):
+                began = getattr(ctx, name, None)
+                if began is not None:
+                    self.observe(stage, time.perf_counter() - began, ctx.stats)
+
+            return handler
+
+        def connected(kind):
+            async def handler(session, ctx, params):
+                self.connection(kind, ctx.stats)
+
+            return handler
+
+        def dns_cache(result):
+            async def handler(session, ctx, params):
+                self.dns_cache(result)
+
+            return handler
+
+        config.on_dns_resolvehost_start.append(started("dns"))
+        config.on_dns_resolvehost_end.append(finished("dns", "fetch_dns"))
+        config.on_connection_create_start.append(started("connect"))
+        config.on_connection_create_end.append(finished("connect", "fetch_connect"))
+        config.on_request_start.append(started("request"))
+        config.on_request_end.append(finished("request", "fetch_ttfb"))
+        config.on_connection_create_end.append(connected("new"))
+        config.on_connection_reuseconn.append(connected("reused"))
+        config.on_dns_cache_hit.append(dns_cache("hit"))
+        config.on_dns_cache_miss.append(dns_cache("miss"))
+        return config
+
+    def render(self):
+        p = self.prefix
+        lines = [
+            f"# HELP {p}_stage_seconds Time spent per crawl stage.",
+            f"# TYPE {p}_stage_seconds histogram",
+        ]
+        with self._lock:
+            for stage, hist in sorted(self._histograms.items()):
+                for bound, count in zip(BUCKETS, hist["buckets"]):
+                    lines.append(
+                        f'{p}_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}'
+                    )
+                lines.append(
+                    f'{p}_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {hist["count"]}'
+                )
+                lines.append(f'{p}_stage_seconds_sum{{stage="{stage}"}} {hist["sum"]:.6f}')
+                lines.append(f'{p}_stage_seconds_count{{stage="{stage}"}} {hist["count"]}')
+            lines += [
+                f"# HELP {p}_bytes_total Bytes fetched and written.",
+                f"# TYPE {p}_bytes_total counter",
+            ]
+            lines += [
+                f'{p}_bytes_total{{kind="{kind}"}} {n}' for kind, n in sorted(self._bytes.items())
+            ]
+            lines += [
+                f"# HELP {p}_errors_total Failures by category.",
+                f"# TYPE {p}_errors_total counter",
+            ]
+            lines += [
+                f'{p}_errors_total{{category="{cat}"}} {n}'
+                for cat, n in sorted(self._errors.items())
+            ]
+            lines += [
+                f"# HELP {p}_retries_total Failed attempts retried, by failure category.",
+                f"# TYPE {p}_retries_total counter",
+            ]
+            lines += [
+                f'{p}_retries_total{{category="{cat}"}} {n}'
+                for cat, n in sorted(self._retries.items())
+            ]
+            lines += [
+                f"# HELP {p}_connections_total Pooled connections opened or reused.",
+                f"# TYPE {p}_connections_total counter",
+            ]
+            lines += [
+                f'{p}_connections_total{{kind="{kind}"}} {n}'
+                for kind, n in sorted(self._connections.items())
+            ]
+            total = sum(self._connections.values())
+            lines += [
+                f"# HELP {p}_connection_reuse_ratio Share of requests sent on a reused connection.",
+                f"# TYPE {p}_connection_reuse_ratio gauge",
+            ]
+            lines.append(
+                f"{p}_connection_reuse_ratio {self._connections.get('reused', 0) / total if total else 0:.4f}"
+            )
+            lines += [
+                f"# HELP {p}_dns_cache_total DNS cache lookups.",
+                f"# TYPE {p}_dns_cache_total counter",
+            ]
+            lines += [
+                f'{p}_dns_cache_total{{result="{result}"}} {n}'
+                for result, n in sorted(self._dns.items())
+            ]
+        lines += [
+            f"# HELP {p}_queue_depth Items waiting per queue.",
+            f"# TYPE {p}_queue_depth gauge",
+        ]
+        for name, read in sorted(self._gauges.items()):
+            try:
+                lines.append(f'{p}_queue_depth{{queue="{name}"}} {read()}')
+            except Exception:
+                pass
+        return "\n".join(lines) + "\n"
+
+
+class _Timer:
+    def __init__(self, metrics, stage, stats):
+        self.metrics = metrics
+        self.stage = stage
+        self.stats = stats
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.stage, time.perf_counter() - self.started, self.stats)
+        return False
+
+
+def classify_error(exc):
+    """Coarse failure category for an exception raised while fetching."""
+    # Before ClientConnectorError, which both subclass: a bad certificate or
+    # handshake will not fix itself on retry and says nothing about whether
+    # the host is up.
+    if isinstance(exc, aiohttp.ClientConnectorCertificateError | aiohttp.ClientSSLError):
+        return "tls"
+    if isinstance(exc, aiohttp.ClientConnectorDNSError):
+        return "dns"
+    if isinstance(exc, TimeoutError | aiohttp.ServerTimeoutError):
+        return "timeout"
+    if isinstance(exc, aiohttp.ClientConnectorError):
+        return "connect"
+    if isinstance(exc, aiohttp.ClientPayloadError | aiohttp.ServerDisconnectedError):
+        return "truncated"
+    if isinstance(exc, aiohttp.ClientConnectionError):
+        return "connect"  # reset or refused before a response came back
+    if isinstance(exc, aiohttp.ClientError):
+        return "http"
+    return "other"
+
+
+def status_category(status):
+    return "http_4xx" if 400 <= status < 500 else "http_5xx" if status >= 500 else f"http_{status}"
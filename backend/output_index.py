@@ -0,0 +1,97 @@
+import os
+import sqlite3
+from contextlib import closing
+
+# Lives inside each output_{domain} directory; maintained by the output writer.
+OUTPUT_INDEX = ".outputs.sqlite3"
+LIST_LIMIT = 100
+MAX_LIST_LIMIT = 1000
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS outputs (seq INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT UNIQUE, "
+    "ext TEXT, kind TEXT, size INTEGER, target TEXT)"
+)
+
+
+def file_ext(name):
+    return name.rsplit(".", 1)[-1].lower() if "." in name else ""
+
+
+class OutputIndex:
+    """Listing of the files in one output directory, kept by the writer thread.
+
+    Rows are added as files are written (or become aliases of another file)
+    and removed with them, so /results pages through the index instead of
+    listing a directory that may hold tens of thousands of entries.
+    """
+
+    def __init__(self, out_dir):
+        self.db = sqlite3.connect(os.path.join(out_dir, OUTPUT_INDEX), timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(SCHEMA)
+
+    def add(self, name, size, kind=None, target=None):
+        self.db.execute(
+            "INSERT INTO outputs (name, ext, kind, size, target) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET kind = excluded.kind, size = excluded.size, target = excluded.target",
+            (name, file_ext(name), kind or "file", size, target),
+        )
+
+    def remove(self, name):
+        self.db.execute("DELETE FROM outputs WHERE name = ?", (name,))
+
+    def commit(self):
+        self.db.commit()
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+
+def build_index(out_dir):
+    """Index a directory written before the writer kept an index."""
+    index = OutputIndex(out_dir)
+    for entry in os.scandir(out_dir):
+        if entry.is_file() and not entry.name.startswith("."):
+            index.add(entry.name, entry.stat().st_size)
+    index.close()
+
+
+def list_outputs(
+    out_dir, cursor=None, limit=LIST_LIMIT, kind=None, ext=None, min_size=None, max_size=None
+):
+    """One page of output names after ``cursor``; returns (names, next_cursor)."""
+    if not os.path.exists(os.path.join(out_dir, OUTPUT_INDEX)):
+        build_index(out_dir)
+    with closing(sqlite3.connect(os.path.join(out_dir, OUTPUT_INDEX), timeout=30)) as db:
+        return query_listing(db, "outputs", cursor, limit, kind, ext, min_size, max_size)
+
+
+def query_listing(
+    db, table, cursor=None, limit=LIST_LIMIT, kind=None, ext=None, min_size=None, max_size=None
+):
+    """Cursor-paged names from an index table (seq, name, ext, kind, size, target).
+
+    Aliases are filtered by the size of the entry holding their content.
+    """
+    limit = max(1, min(limit or LIST_LIMIT, MAX_LIST_LIMIT))
+    where, args = ["o.seq > ?"], [int(cursor or 0)]
+    if kind:
+        where.append("o.kind = ?")
+        args.append(kind)
+    if ext:
+        where.append("o.ext = ?")
+        args.append(ext.lower().lstrip("."))
+    if min_size is not None:
+        where.append("COALESCE(t.size, o.size) >= ?")
+        args.append(min_size)
+    if max_size is not None:
+        where.append("COALESCE(t.size, o.size) <= ?")
+        args.append(max_size)
+    rows = db.execute(
+        f"SELECT o.seq, o.name FROM {table} o LEFT JOIN {table} t ON t.name = o.target "
+        f"WHERE {' AND '.join(where)} ORDER BY o.seq LIMIT ?",
+        (*args, limit),
+    ).fetchall()
+    next_cursor = str(rows[-1][0]) if len(rows) == limit else None
+    return [name for _, name in rows], next_cursor
@@ -0,0 +1,194 @@
+import asyncio
+import email.utils
+import time
+from urllib.parse import urlsplit
+from urllib.robotparser import RobotFileParser
+
+import aiohttp
+
+# Per-host request rates (requests/second). Hosts start at DEFAULT_RATE, gain
+# INCREASE_STEP for every successful response up to MAX_RATE (or the rate
+# their robots.txt allows) and are cut by DECREASE_FACTOR on 429/503, never
+# below MIN_RATE unless robots.txt asks for a slower rate still.
+DEFAULT_RATE = 8.0
+MAX_RATE = 50.0
+MIN_RATE = 0.2
+BURST = 10
+INCREASE_STEP = 0.5
+DECREASE_FACTOR = 0.5
+MAX_RETRY_AFTER = 300
+
+ROBOTS_USER_AGENT = "*"
+ROBOTS_TTL = 24 * 3600
+# A robots.txt that answers 5xx or cannot be fetched at all disallows the
+# whole host (RFC 9309), but only for ROBOTS_ERROR_TTL seconds before it is
+# fetched again. A 4xx means the site has no rules.
+ROBOTS_ERROR_TTL = 300
+OBEY_ROBOTS = True
+
+
+class HostState:
+    def __init__(self, rate=None, max_rate=None, burst=None):
+        self.max_rate = max_rate or MAX_RATE
+        self.rate = min(rate or DEFAULT_RATE, self.max_rate)
+        self.burst = burst or BURST
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def reserve(self):
+        """Take one token and return how long the caller must wait for it.
+
+        Tokens may go negative: later callers queue up behind the debt, so
+        no lock is needed on a single event loop.
+        """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        return max(wait, self.blocked_until - now)
+
+
+class RobotsRules:
+    def __init__(self, text=None, unreachable=False):
+        self.parser = RobotFileParser()
+        self.parser.parse((text or "").splitlines())
+        self.parser.disallow_all = unreachable
+        self.ttl = ROBOTS_ERROR_TTL if unreachable else ROBOTS_TTL
+        self.crawl_delay = parse_crawl_delay(text or "", ROBOTS_USER_AGENT)
+        request_rate = self.parser.request_rate(ROBOTS_USER_AGENT)
+        self.max_rate = None
+        if self.crawl_delay:
+            self.max_rate = 1 / self.crawl_delay
+        elif request_rate and request_rate.seconds:
+            self.max_rate = request_rate.requests / request_rate.seconds
+        self.fetched_at = time.monotonic()
+
+    def allowed(self, url):
+        return self.parser.can_fetch(ROBOTS_USER_AGENT, url)
+
+    def sitemaps(self):
+        return self.parser.site_maps() or []
+
+
+class PolitenessScheduler:
+    """Per-host token buckets shaped by robots.txt and server feedback.
+
+    Shared by every job in the process, so two crawls of the same host draw
+    from the same budget.
+    """
+
+    def __init__(self):
+        self.hosts = {}
+        self.robots = {}
+        self._robots_pending = {}
+
+    async def wait(self, session, url):
+        """Sleep until ``url`` may be fetched; False if robots.txt forbids it."""
+        host = urlsplit(url).netloc
+        rules = await self.get_robots(session, url)
+        if OBEY_ROBOTS and not rules.allowed(url):
+            return False
+        state = self.hosts.get(host)
+        if state is None:
+            burst = 1 if rules.max_rate else None
+            state = self.hosts[host] = HostState(rules.max_rate, rules.max_rate, burst)
+        delay = state.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return True
+
+    def record(self, url, status, retry_after=None):
+        state = self.hosts.get(urlsplit(url).netloc)
+        if state is None:
+            return
+        if status in (429, 503):
+            state.rate = min(state.max_rate, max(MIN_RATE, state.rate * DECREASE_FACTOR))
+            delay = parse_retry_after(retry_after)
+            if delay:
+                state.blocked_until = max(state.blocked_until, time.monotonic() + delay)
+        elif status < 500:
+            state.rate = min(state.max_rate, state.rate + INCREASE_STEP)
+
+    async def get_robots(self, session, url):
+        parts = urlsplit(url)
+        host = parts.netloc
+        rules = self.robots.get(host)
+        if rules is not None and time.monotonic() - rules.fetched_at < rules.ttl:
+            return rules
+        pending = self._robots_pending.get(host)
+        if pending is not None:
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    raise
+            # The fetching task was cancelled before it got an answer: fetch it here.
+            return await self.get_robots(session, url)
+
+        pending = self._robots_pending[host] = asyncio.get_running_loop().create_future()
+        try:
+            text = await fetch_robots(session, f"{parts.scheme}://{host}/robots.txt")
+        except BaseException:
+            # Cancelled (or failed outside the fetch): nothing was learnt about
+            # the host, so nothing is cached.
+            del self._robots_pending[host]
+            pending.cancel()
+            raise
+        rules = self.robots[host] = RobotsRules(text, unreachable=text is None)
+        del self._robots_pending[host]
+        pending.set_result(rules)
+        return rules
+
+
+async def fetch_robots(session, robots_url):
+    """robots.txt text; "" when the site has none (4xx), None when it is
+    unreachable (5xx, network error, timeout)."""
+    try:
+        async with session.get(robots_url, timeout=aiohttp.ClientTimeout(total=10)) as resp:
+            if resp.status == 200:
+                return await resp.text(errors="ignore")
+            if resp.status < 500:
+                return ""
+    except Exception:
+        pass
+    return None
+
+
+def parse_crawl_delay(text, user_agent):
+    # RobotFileParser only understands integer delays; sites often use "0.5".
+    delays = {}
+    agents, in_rules = [], False
+    for line in text.splitlines():
+        line = line.split("#", 1)[0].strip()
+        if ":" not in line:
+            continue
+        key, value = (part.strip() for part in line.split(":", 1))
+        key = key.lower()
+        if key == "user-agent":
+            if in_rules:
+                agents, in_rules = [], False
+            agents.append(value.lower())
+        else:
+            in_rules = True
+            if key == "crawl-delay":
+                try:
+                    for agent in agents:
+                        delays[agent] = float(value)
+                except ValueError:
+                    pass
+    return delays.get(user_agent.lower(), delays.get("*"))
+
+
+def parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = email.utils.parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(seconds, 0.0), MAX_RETRY_AFTER)
@@ -0,0 +1,150 @@
+import json
+import os
+import sqlite3
+import zlib
+from contextlib import closing
+
+from output_index import LIST_LIMIT, file_ext, query_listing
+
+# Lives inside each output_{domain} directory written in "jsonl" mode.
+RECORD_INDEX = ".records.sqlite3"
+# A new shard is started once the current one passes this size.
+RECORD_SHARD_BYTES = 64 * 1024 * 1024
+COMMIT_EVERY = 50
+
+
+def shard_name(n):
+    return f"records-{n:05d}.jsonl.gz"
+
+
+def encode_record(record):
+    # Each record is its own gzip member: the shard is still one valid
+    # .jsonl.gz stream, and any record can be read alone from its offset.
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    line = json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n"
+    return compressor.compress(line) + compressor.flush()
+
+
+def decode_record(data):
+    return json.loads(zlib.decompress(data, 31))
+
+
+class RecordStore:
+    """Appends result records to compressed JSONL shards in an output directory.
+
+    Every record gets a row in an SQLite index (name, url, shard, offset,
+    length) so listings page through the index and a single record is read
+    with one seek. Appends run on the output writer thread.
+    """
+
+    def __init__(self, out_dir):
+        self.out_dir = out_dir
+        self.db = sqlite3.connect(
+            os.path.join(out_dir, RECORD_INDEX), timeout=30, check_same_thread=False
+        )
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS records (seq INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT UNIQUE, "
+            "url TEXT, kind TEXT, shard INTEGER, offset INTEGER, length INTEGER, target TEXT, ext TEXT, size INTEGER)"
+        )
+        self.pending = 0
+        # Read from the event loop while the writer thread appends.
+        self.names = {name for (name,) in self.db.execute("SELECT name FROM records")}
+        self.shard, end = self.db.execute(
+            "SELECT COALESCE(MAX(shard), 0), COALESCE(MAX(offset + length), 0) FROM records "
+            "WHERE shard = (SELECT MAX(shard) FROM records)"
+        ).fetchone()
+        path = os.path.join(out_dir, shard_name(self.shard))
+        if os.path.exists(path) and os.path.getsize(path) > end:
+            # Drop a record torn by a crash after its bytes but before its row.
+            os.truncate(path, end)
+        self.file = open(path, "ab")
+
+    def has(self, name):
+        return name in self.names
+
+    def append(self, record):
+        """Write one record; returns (shard path, bytes written)."""
+        if self.file.tell() >= RECORD_SHARD_BYTES:
+            self.file.close()
+            self.shard += 1
+            self.file = open(os.path.join(self.out_dir, shard_name(self.shard)), "ab")
+        data = encode_record(record)
+        offset = self.file.tell()
+        self.file.write(data)
+        self.file.flush()
+        # Listings filter on the document's size, or a page's text size.
+        size = record.get("size", len(record.get("text", "").encode("utf-8")))
+        self.db.execute(
+            "INSERT OR REPLACE INTO records (name, url, kind, shard, offset, length, ext, size) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                record["name"],
+                record.get("url"),
+                record.get("kind"),
+                self.shard,
+                offset,
+                len(data),
+                file_ext(record["name"]),
+                size,
+            ),
+        )
+        self.names.add(record["name"])
+        self._written()
+        return self.file.name, len(data)
+
+    def add_alias(self, name, url, target, kind="page"):
+        """List ``name`` as a record whose content is ``target``'s."""
+        self.db.execute(
+            "INSERT OR REPLACE INTO records (name, url, kind, target, ext) VALUES (?, ?, ?, ?, ?)",
+            (name, url, kind, target, file_ext(name)),
+        )
+        self.names.add(name)
+        self._written()
+
+    def close(self):
+        self.file.close()
+        self.db.commit()
+        self.db.close()
+
+    def _written(self):
+        self.pending += 1
+        if self.pending >= COMMIT_EVERY:
+            self.db.commit()
+            self.pending = 0
+
+
+def has_records(out_dir):
+    return os.path.exists(os.path.join(out_dir, RECORD_INDEX))
+
+
+def list_records(
+    out_dir, cursor=None, limit=LIST_LIMIT, kind=None, ext=None, min_size=None, max_size=None
+):
+    """One page of record names after ``cursor``; returns (names, next_cursor)."""
+    with closing(sqlite3.connect(os.path.join(out_dir, RECORD_INDEX), timeout=30)) as db:
+        return query_listing(db, "records", cursor, limit, kind, ext, min_size, max_size)
+
+
+def list_shards(out_dir):
+    with closing(sqlite3.connect(os.path.join(out_dir, RECORD_INDEX), timeout=30)) as db:
+        rows = db.execute(
+            "SELECT DISTINCT shard FROM records WHERE shard IS NOT NULL ORDER BY shard"
+        ).fetchall()
+    return [shard_name(shard) for (shard,) in rows]
+
+
+def read_record(out_dir, name):
+    with closing(sqlite3.connect(os.path.join(out_dir, RECORD_INDEX))) as db:
+        row = db.execute(
+            "SELECT shard, offset, length, target FROM records WHERE name = ?", (name,)
+        ).fetchone()
+        if row and row[3]:
+            row = db.execute(
+                "SELECT shard, offset, length, target FROM records WHERE name = ?", (row[3],)
+            ).fetchone()
+    if not row or row[0] is None:
+        return None
+    shard, offset, length, _ = row
+    with open(os.path.join(out_dir, shard_name(shard)), "rb") as f:
+        f.seek(offset)
+        return decode_record(f.read(length))
@@ -0,0 +1,115 @@
+import random
+import time
+from urllib.parse import urlsplit
+
+# Failed fetches are retried up to MAX_ATTEMPTS in all when the failure is
+# likely transient: a refused or reset connection, a timeout, a body cut
+# short, or one of RETRY_STATUSES. Attempt n waits a random time up to
+# BACKOFF_BASE * 2**(n-1) seconds, at most BACKOFF_MAX ("full jitter"), so
+# workers retrying the same host do not arrive together. 429/503 also slow
+# the host down in politeness.py, which honours Retry-After before the
+# retry goes out.
+MAX_ATTEMPTS = 3
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 10.0
+RETRY_CATEGORIES = ("connect", "timeout", "truncated")
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Per-host circuit breaker. BREAKER_THRESHOLD host failures in a row (DNS,
+# connect, timeout, 5xx) open it: requests to the host fail at once for
+# BREAKER_COOLDOWN seconds. Then a single probe goes through; success
+# closes the breaker, failure opens it again for twice as long, up to
+# BREAKER_MAX_COOLDOWN.
+BREAKER_THRESHOLD = 5
+BREAKER_COOLDOWN = 30.0
+BREAKER_MAX_COOLDOWN = 300.0
+HOST_FAILURES = ("dns", "connect", "timeout", "http_5xx")
+# Each job keeps its last FAILURE_LOG_SIZE failed URLs (with category and
+# attempts) in its stats next to the per-category counts.
+FAILURE_LOG_SIZE = 50
+
+
+class HTTPStatusError(Exception):
+    """A response whose status means the fetch failed."""
+
+    def __init__(self, status):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+
+
+def retryable(category, status=None):
+    return category in RETRY_CATEGORIES or status in RETRY_STATUSES
+
+
+def backoff(attempt):
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1)))
+
+
+def record_failure(stats, url, category, attempts):
+    if stats is None:
+        return
+    failures = stats.setdefault("failures", [])
+    failures.append({"url": url, "category": category, "attempts": attempts})
+    del failures[:-FAILURE_LOG_SIZE]
+
+
+class HostCircuit:
+    def __init__(self):
+        self.failures = 0
+        self.cooldown = BREAKER_COOLDOWN
+        self.open_until = None
+        self.probing = False
+
+    def allow(self):
+        now = time.monotonic()
+        if self.open_until is None:
+            return True
+        if now < self.open_until:
+            return False
+        # Half-open: let one probe through. Should it never report back,
+        # the next one goes after another cooldown.
+        self.open_until = now + self.cooldown
+        self.probing = True
+        return True
+
+    def record(self, failed):
+        if not failed:
+            self.failures, self.cooldown, self.open_until, self.probing = (
+                0,
+                BREAKER_COOLDOWN,
+                None,
+                False,
+            )
+            return
+        self.failures += 1
+        if self.probing:
+            self.cooldown = min(self.cooldown * 2, BREAKER_MAX_COOLDOWN)
+        if self.probing or self.failures >= BREAKER_THRESHOLD:
+            self.open_until = time.monotonic() + self.cooldown
+            self.probing = False
+
+
+class CircuitBreakers:
+    """Per-host circuit breakers, shared by every job in the process."""
+
+    def __init__(self):
+        self.hosts = {}
+
+    def allow(self, url):
+        """False while the url's host is considered down."""
+        circuit = self.hosts.get(urlsplit(url).netloc)
+        return circuit is None or circuit.allow()
+
+    def record(self, url, category=None):
+        """Feed a fetch outcome: None for success, else its failure category.
+
+        Only HOST_FAILURES count against the host; any other outcome means
+        it answered, which resets the count and closes an open breaker.
+        """
+        host = urlsplit(url).netloc
+        circuit = self.hosts.get(host)
+        if category in HOST_FAILURES:
+            if circuit is None:
+                circuit = self.hosts[host] = HostCircuit()
+            circuit.record(True)
+        elif circuit is not None:
+            circuit.record(False)
@@ -1,20 +1,154 @@
 import os
+import copy
+import contextlib
 import uuid
+import time
 import asyncio
 import aiohttp
-from urllib.parse import urlparse, urljoin
-from bs4 import BeautifulSoup
+from urllib.parse import urlparse
 from docx import Document as DocxDocument
 import PyPDF2
 import pandas as pd
+import openpyxl
 from pptx import Presentation
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
 import hashlib
+import collections
+from urlnorm import canonicalize_url
+from html_parse import parse_page, sniff_charset
+from writer import OutputWriter, new_write_stats
+from politeness import PolitenessScheduler
+from job_scheduler import DEFAULT_PRIORITY, PRIORITIES, JobScheduler
+from http_cache import HttpCache, conditional_headers, content_hash
+from content_index import resolve_alias
+from output_index import MAX_LIST_LIMIT, list_outputs
+from archive import iter_archive
+from record_store import RecordStore, has_records, list_records, list_shards, read_record
+import job_store
+from events import EventBus
+from js_render import BrowserPool, looks_like_js_shell
+from metrics import Metrics, classify_error, status_category
+from http_client import HttpClient
+from frontier import SITEMAP_DEPTH, Frontier, check_limits
+from sitemaps import iter_sitemap_urls
+from retries import MAX_ATTEMPTS, CircuitBreakers, HTTPStatusError, backoff, record_failure, retryable
 
 JOBS = {}
 MAX_CONCURRENT = 50
 MAX_PAGES = 500
+# New jobs seed their frontier from the site's sitemaps (robots.txt Sitemap:
+# lines, else /sitemap.xml) while the crawl from the start URL runs. Seeding
+# stops after SITEMAP_SEED_FACTOR * MAX_PAGES pages, and is cancelled once
+# MAX_PAGES are fetched or the frontier runs dry.
+USE_SITEMAPS = True
+SITEMAP_SEED_FACTOR = 2
+# Documents are downloaded and extracted while the crawl is still running, by
+# DOC_CONCURRENCY workers fed from a queue of at most DOC_QUEUE_SIZE links;
+# page workers wait when it is full.
+DOC_CONCURRENCY = 10
+DOC_QUEUE_SIZE = 200
+# Page bodies are streamed and abandoned past MAX_PAGE_BYTES (checked against
+# Content-Length first). Responses that are not HTML go to the document
+# pipeline when their type is one of the job's doc_types, else are skipped.
+MAX_PAGE_BYTES = 10 * 1024 * 1024
+FETCH_CHUNK = 65536
+HTML_TYPES = ("text/html", "application/xhtml+xml")
+DOC_CONTENT_TYPES = {
+    "application/pdf": "pdf",
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document": "docx",
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet": "xlsx",
+    "application/vnd.openxmlformats-officedocument.presentationml.presentation": "pptx",
+    "application/vnd.ms-excel": "xls",
+    "text/csv": "csv",
+    "text/plain": "txt",
+}
+# Remember ETag/Last-Modified/content hashes per domain so re-crawls send
+# conditional requests and skip unchanged pages and documents.
+HTTP_CACHE = True
+# "files" writes one .txt per page/document; "jsonl" appends records to
+# compressed shards indexed for paging and single-record reads.
+OUTPUT_FORMATS = ("files", "jsonl")
+# Running jobs save their frontier/seen/visited sets and stats to the job
+# store this often; the save doubles as the job's lease heartbeat. The state
+# is copied on the event loop and encoded and written on one thread, so saves
+# land in order without stalling the crawl.
+CHECKPOINT_INTERVAL = 5
+# Progress events for streaming clients are published at most this often
+# per job (plus one final event when the job ends).
+PROGRESS_EVENT_INTERVAL = 0.5
+KEEPALIVE_INTERVAL = 15
+event_bus = EventBus()
+# Stage latencies, byte/error counters and queue depths for /metrics; the
+# same calls keep a per-job summary in the job's stats.
+metrics = Metrics()
+# Headless browsers shared by all use_js crawls; only pages whose static HTML
+# looks like a JavaScript shell are rendered.
+renderer = BrowserPool()
 executor = ThreadPoolExecutor(max_workers=20)
+checkpoint_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="checkpoint")
+# All page, document and extracted-text writes go through one writer thread.
+writer = OutputWriter(observer=lambda seconds, nbytes: (metrics.observe("write", seconds), metrics.count_bytes("written", nbytes)))
+# Crawls running in this process, for the queue-depth gauges.
+active_crawls = set()
+metrics.gauge("frontier", lambda: sum(ctx.frontier.qsize() for ctx in active_crawls))
+metrics.gauge("documents", lambda: sum(ctx.doc_queue.qsize() for ctx in active_crawls))
+metrics.gauge("writer", writer.queue_depth)
+# One session, DNS cache and set of keep-alive pools for every job.
+http_client = HttpClient(trace_configs=[metrics.trace_config()])
+# Per-host rate limits (robots.txt Crawl-delay, adaptive 429/503 backoff),
+# shared by all jobs in the process.
+host_scheduler = PolitenessScheduler()
+# Hosts that keep failing fail fast for a while instead of timing out per URL.
+host_breakers = CircuitBreakers()
+# Job admission and the fetch/document budgets shared by running jobs.
+job_scheduler = JobScheduler()
+metrics.gauge("jobs", lambda: len(job_scheduler.queue))
+
+# HTML parsing runs in its own process pool so CPU-bound parsing never stalls
+# in-flight fetches. PARSE_WORKERS = 0 parses inline on the event loop.
+PARSE_WORKERS = os.cpu_count() or 1
+PARSE_CONCURRENCY = 2 * PARSE_WORKERS
+PARSE_BACKEND = "lxml"  # or "bs4"
+parse_executor = None
+
+def get_parse_executor():
+    global parse_executor
+    if parse_executor is None and PARSE_WORKERS > 0:
+        parse_executor = ProcessPoolExecutor(max_workers=PARSE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return parse_executor
+
+# Document extraction backend. "thread" runs extract_document on the shared
+# thread pool; "process" routes each format family to its own process pool so
+# GIL-bound PDF/spreadsheet/slide parsing actually runs in parallel and a
+# backlog of one format never queues ahead of another.
+EXTRACT_BACKEND = "process"
+EXTRACT_POOL_SIZES = {"pdf": os.cpu_count() or 1, "office": 2, "table": 2}
+EXTRACT_POOL_FOR = {"pdf": "pdf", "docx": "office", "pptx": "office", "txt": "office", "csv": "table", "xlsx": "table", "xls": "table"}
+# PDFs longer than PDF_PAGES_PER_TASK are split into page ranges; at most
+# MAX_TASKS_PER_DOC ranges of one document are queued at a time so a
+# 300-page PDF shares the pool with the documents behind it.
+PDF_PAGES_PER_TASK = 25
+MAX_TASKS_PER_DOC = 2
+# Per-document PDF budgets (0 = unlimited). Extraction stops after the page
+# that crosses one; the document counts as docs_truncated.
+PDF_MAX_PAGES = 2000
+PDF_MAX_SECONDS = 120
+PDF_MAX_TEXT_BYTES = 20 * 1024 * 1024
+# CSV/XLSX files are read and rendered in chunks of about TABLE_CHUNK_BYTES
+# of DataFrame memory (sized from the rows read so far) and, in "files"
+# output mode, written straight to the output file by the extraction worker.
+TABLE_CHUNK_BYTES = 8 * 1024 * 1024
+TABLE_SAMPLE_ROWS = 1000
+TABLE_EXTS = ("csv", "xlsx")
+extract_executors = {}
+
+def get_extract_executor(ext):
+    name = EXTRACT_POOL_FOR.get(ext, "office")
+    if name not in extract_executors:
+        extract_executors[name] = ProcessPoolExecutor(max_workers=EXTRACT_POOL_SIZES.get(name, 1), mp_context=multiprocessing.get_context("spawn"))
+    return extract_executors[name]
 
 def safe_filename(url, ext='txt'):
     hash_part = hashlib.md5(url.encode()).hexdigest()[:8]
@@ -26,22 +160,101 @@ def extract_docx(path):
     return '\n'.join([p.text for p in doc.paragraphs])
 
 def extract_pdf(path):
-    text = ""
+    return "".join(iter_pdf_pages(path))
+
+def iter_pdf_pages(path, start=0, stop=None, deadline=None):
+    # Pages are parsed one at a time as they are asked for.
     with open(path, "rb") as f:
         reader = PyPDF2.PdfReader(f)
-        for page in reader.pages:
-            page_text = page.extract_text()
-            if page_text:
-                text += page_text
-    return text
+        stop = len(reader.pages) if stop is None else min(stop, len(reader.pages))
+        for i in range(start, stop):
+            if deadline and time.time() > deadline:
+                return
+            yield reader.pages[i].extract_text() or ""
+
+def count_pdf_pages(path):
+    with open(path, "rb") as f:
+        return len(PyPDF2.PdfReader(f).pages)
+
+def extract_pdf_pages(path, start, stop, deadline=None, max_bytes=0):
+    parts = []
+    size = 0
+    try:
+        for text in iter_pdf_pages(path, start, stop, deadline):
+            parts.append(text)
+            size += len(text.encode("utf-8"))
+            if max_bytes and size >= max_bytes:
+                break
+    except Exception:
+        pass  # keep the pages read before a broken one
+    return "".join(parts)
 
 def extract_csv(path):
-    df = pd.read_csv(path)
-    return df.to_string()
+    return "".join(iter_table_text(path, "csv"))
 
 def extract_xlsx(path):
-    df = pd.read_excel(path)
-    return df.to_string()
+    if path.lower().endswith(".xls"):
+        return pd.read_excel(path).to_string()  # openpyxl cannot stream legacy .xls
+    return "".join(iter_table_text(path, "xlsx"))
+
+def iter_table_chunks(path, ext, chunk_bytes=TABLE_CHUNK_BYTES):
+    """Yield a CSV or XLSX (first sheet) as DataFrames of about chunk_bytes."""
+    rows = TABLE_SAMPLE_ROWS
+
+    def next_size(chunk):
+        per_row = chunk.memory_usage(deep=True).sum() / max(1, len(chunk))
+        return max(1, int(chunk_bytes // max(1, per_row)))
+
+    if ext == "csv":
+        with pd.read_csv(path, chunksize=rows) as reader:
+            while True:
+                try:
+                    chunk = reader.get_chunk(rows)
+                except StopIteration:
+                    return
+                yield chunk
+                rows = next_size(chunk)
+
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        sheet_rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(sheet_rows, None)
+        if header is None:
+            return
+        columns = [name if name is not None else f"Unnamed: {i}" for i, name in enumerate(header)]
+        width = len(columns)
+        batch = []
+        start = 0
+        for row in sheet_rows:
+            batch.append(row[:width] + (None,) * (width - len(row)))
+            if len(batch) >= rows:
+                chunk = pd.DataFrame(batch, columns=columns, index=range(start, start + len(batch)))
+                yield chunk
+                start += len(batch)
+                batch = []
+                rows = next_size(chunk)
+        if batch:
+            yield pd.DataFrame(batch, columns=columns, index=range(start, start + len(batch)))
+    finally:
+        workbook.close()
+
+def iter_table_text(path, ext, chunk_bytes=TABLE_CHUNK_BYTES):
+    # Column widths are set per chunk; only the first chunk has the header.
+    for n, chunk in enumerate(iter_table_chunks(path, ext, chunk_bytes)):
+        yield chunk.to_string(header=n == 0) + "\n"
+
+def write_table(path, ext, out_path, chunk_bytes=TABLE_CHUNK_BYTES):
+    """Render a table to out_path chunk by chunk; returns bytes written."""
+    written = 0
+    try:
+        with open(out_path, "wb") as out:
+            for text in iter_table_text(path, ext, chunk_bytes):
+                written += out.write(text.encode("utf-8"))
+    except Exception:
+        pass  # keep the rows written before a broken one
+    if not written and os.path.exists(out_path):
+        os.remove(out_path)
+    return written
 
 def extract_pptx(path):
     prs = Presentation(path)
@@ -52,145 +265,791 @@ def extract_pptx(path):
                 text += shape.text + "\n"
     return text
 
-async def start_scrape_job(url, use_js, doc_types):
+async def start_scrape_job(url, use_js, doc_types, output_format="files", priority=DEFAULT_PRIORITY, limits=None):
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"output_format must be one of {', '.join(OUTPUT_FORMATS)}")
+    if priority not in PRIORITIES:
+        raise ValueError(f"priority must be one of {', '.join(PRIORITIES)}")
+    limits = {key: value for key, value in (limits or {}).items() if value is not None}
+    check_limits(limits)
     job_id = str(uuid.uuid4())
     domain = urlparse(url).netloc
     out_dir = f"output_{domain}"
     os.makedirs(out_dir, exist_ok=True)
-    JOBS[job_id] = {"status": "running", "progress": 0, "domain": domain}
-    asyncio.create_task(scrape_site(url, use_js, doc_types, out_dir, job_id))
+    job_store.get_store().create_job(job_id, url, domain, out_dir, use_js, doc_types, output_format, priority, limits)
+    JOBS[job_id] = {"status": "queued", "progress": 0, "domain": domain, "stats": new_job_stats()}
+    asyncio.create_task(run_job(url, use_js, doc_types, out_dir, job_id, output_format, priority, limits))
     return job_id
 
+async def run_job(url, use_js, doc_types, out_dir, job_id, output_format="files", priority=DEFAULT_PRIORITY, limits=None):
+    """Wait for the scheduler to admit the job, then crawl."""
+    store = job_store.get_store()
+    job = JOBS[job_id]
+    await job_scheduler.admit(job_id, priority, lambda: store.save_progress(job_id, "queued", 0, job["stats"]))
+    try:
+        job["status"] = "running"
+        store.save_progress(job_id, "running", job["progress"], job["stats"])
+        await scrape_site(url, use_js, doc_types, out_dir, job_id, output_format, limits)
+    finally:
+        job_scheduler.finish(job_id)
+
+def new_job_stats():
+    return {
+        "pages_fetched": 0, "pages_unchanged": 0, "docs_found": 0, "docs_done": 0, "docs_unchanged": 0,
+        "pages_duplicate": 0, "pages_near_duplicate": 0, "docs_duplicate": 0, "docs_truncated": 0, "pages_skipped": 0,
+        "pages_rendered": 0, "retries": 0, "pages_from_sitemaps": 0, "pages_too_deep": 0, "pages_over_budget": 0,
+        "bytes_fetched": 0, "errors": 0, **new_write_stats(),
+    }
+
 def get_job_status(job_id):
-    job = JOBS.get(job_id, None)
+    # Jobs run by this process are live in JOBS; anything else (another
+    # worker's job, or one from before a restart) comes from the job store.
+    job = JOBS.get(job_id, None) or job_store.get_store().get_job(job_id)
     if job:
-        return job["status"], job["progress"]
+        return job["status"], job["progress"], job.get("stats", {})
     else:
-        return "not_found", 0
+        return "not_found", 0, {}
+
+async def stream_job_events(job_id, poll_interval=1.0):
+    """Yield progress events for a job until it stops running.
+
+    Jobs run by this process are followed on the event bus; jobs owned by
+    another worker are followed by polling the job store. None is yielded
+    as a keepalive when nothing happened for KEEPALIVE_INTERVAL seconds.
+    """
+    queue = event_bus.subscribe(job_id) if job_id in JOBS else None
+    try:
+        status, progress, stats = get_job_status(job_id)
+        last = {"type": "progress", "status": status, "progress": progress, **stats}
+        yield last
+        while last["status"] in ("queued", "running"):
+            if queue is not None:
+                try:
+                    event = await asyncio.wait_for(queue.get(), KEEPALIVE_INTERVAL)
+                except TimeoutError:
+                    yield None
+                    continue
+            else:
+                await asyncio.sleep(poll_interval)
+                status, progress, stats = get_job_status(job_id)
+                event = {"type": "progress", "status": status, "progress": progress, **stats}
+                if event == last:
+                    continue
+            last = event
+            yield event
+    finally:
+        if queue is not None:
+            event_bus.unsubscribe(job_id, queue)
+
+def resume_orphaned_jobs():
+    tasks = []
+    for job in job_store.get_store().claim_orphans():
+        JOBS[job["job_id"]] = {
+            "status": "queued",
+            "progress": job["progress"],
+            "domain": job["domain"],
+            "stats": {**new_job_stats(), **job["stats"]},
+        }
+        tasks.append(asyncio.create_task(run_job(
+            job["url"], job["use_js"], job["doc_types"], job["out_dir"], job["job_id"], job["output_format"], job["priority"], job["limits"],
+        )))
+    return tasks
+
+async def watch_orphaned_jobs():
+    while True:
+        resume_orphaned_jobs()
+        await asyncio.sleep(job_store.LEASE_TIMEOUT / 2)
+
+def list_results(domain, cursor=None, limit=None, kind=None, ext=None, min_size=None, max_size=None):
+    """One page of result names for a domain; returns (names, next_cursor).
 
-def list_results(domain):
+    Served from the index the writer keeps (or the jsonl record index),
+    never from a directory listing.
+    """
     out_dir = f"output_{domain}"
-    return os.listdir(out_dir) if os.path.exists(out_dir) else []
+    if not os.path.exists(out_dir):
+        return [], None
+    if has_records(out_dir):
+        return list_records(out_dir, cursor, limit, kind, ext, min_size, max_size)
+    return list_outputs(out_dir, cursor, limit, kind, ext, min_size, max_size)
+
+def get_result_record(domain, name):
+    out_dir = f"output_{domain}"
+    if not has_records(out_dir):
+        return None
+    return read_record(out_dir, name)
 
 def get_result_file(domain, filename):
-    return os.path.join(f"output_{domain}", filename)
+    out_dir = f"output_{domain}"
+    path = os.path.join(out_dir, filename)
+    if not os.path.exists(path):
+        target = resolve_alias(out_dir, filename)
+        if target:
+            return os.path.join(out_dir, target)
+    return path
 
-async def fetch_url(session, url):
-    try:
-        async with session.get(url, timeout=aiohttp.ClientTimeout(total=15), ssl=False) as resp:
-            if resp.status == 200:
-                return await resp.text()
-    except:
-        pass
-    return None
-
-async def download_file(session, url, path):
-    try:
-        async with session.get(url, timeout=aiohttp.ClientTimeout(total=30), ssl=False) as resp:
-            if resp.status == 200:
-                with open(path, 'wb') as f:
-                    async for chunk in resp.content.iter_chunked(8192):
-                        f.write(chunk)
-                return True
-    except:
-        pass
-    return False
-
-async def scrape_site(start_url, use_js, doc_types, out_dir, job_id):
-    visited = set()
-    queue = [start_url]
-    base_domain = urlparse(start_url).netloc
-    doc_tasks = []
+def export_results(domain, archive_format):
+    """Stream every result for a domain as a zip or tar.gz, built on the fly."""
+    out_dir = f"output_{domain}"
+
+    def entries():
+        # The output index lists the shards too; they go out once, first.
+        shards = list_shards(out_dir) if has_records(out_dir) else []
+        for name in shards:
+            yield name, os.path.join(out_dir, name)
+        cursor = None
+        while True:
+            names, cursor = list_outputs(out_dir, cursor, MAX_LIST_LIMIT)
+            for name in names:
+                if name not in shards:
+                    yield name, get_result_file(domain, name)
+            if cursor is None:
+                return
+
+    return iter_archive(entries(), archive_format)
+
+def response_info(resp, **extra):
+    return {
+        "status": resp.status,
+        # Where the server answered from, after redirects: the base for relative links.
+        "url": str(resp.url),
+        "etag": resp.headers.get("ETag"),
+        "last_modified": resp.headers.get("Last-Modified"),
+        **extra,
+    }
+
+async def fetch_with_retries(session, url, attempt, budget, job_id=None, stats=None):
+    """Run ``attempt()`` for url, retrying transient failures with backoff.
+
+    Each attempt holds a slot of ``budget`` (job_scheduler.fetch or
+    .documents) for the request and body read only: politeness waits and
+    backoff sleeps leave the slot to other jobs. Returns its result, or
+    None once the fetch has failed for good, the host's circuit breaker is
+    open, or robots.txt forbids the URL (or could not be fetched); each of
+    these is counted as a failure on the job.
+    """
+    for n in range(1, MAX_ATTEMPTS + 1):
+        if not host_breakers.allow(url):
+            metrics.error("circuit_open", stats)
+            record_failure(stats, url, "circuit_open", n - 1)
+            return None
+        if not await host_scheduler.wait(session, url):
+            # Final, and not a host failure: the breaker does not see it.
+            metrics.error("robots", stats)
+            record_failure(stats, url, "robots", n - 1)
+            return None
+        try:
+            async with budget.slot(job_id):
+                result = await attempt()
+        except Exception as e:
+            status = e.status if isinstance(e, HTTPStatusError) else None
+            category = status_category(status) if status else classify_error(e)
+            host_breakers.record(url, category)
+            if n == MAX_ATTEMPTS or not retryable(category, status):
+                metrics.error(category, stats)
+                record_failure(stats, url, category, n)
+                return None
+            metrics.retry(category, stats)
+            await asyncio.sleep(backoff(n))
+        else:
+            host_breakers.record(url)
+            return result
+
+async def fetch_url(session, url, headers=None, stats=None, job_id=None):
+    async def attempt():
+        with metrics.time("fetch", stats):
+            async with session.get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=15, connect=5), trace_request_ctx={"stats": stats}) as resp:
+                host_scheduler.record(url, resp.status, resp.headers.get("Retry-After"))
+                if resp.status == 304:
+                    return response_info(resp)
+                if resp.status != 200:
+                    raise HTTPStatusError(resp.status)
+                with metrics.time("fetch_body", stats):
+                    fetched = await read_page(resp)
+                metrics.count_bytes("fetched_pages", len(fetched.get("body", b"")))
+                return fetched
+
+    return await fetch_with_retries(session, url, attempt, job_scheduler.fetch, job_id, stats)
+
+async def read_page(resp):
+    # A missing Content-Type is sniffed as HTML; anything else that is not
+    # HTML is handed back unread.
+    if "Content-Type" in resp.headers and resp.content_type not in HTML_TYPES:
+        return response_info(resp, content_type=resp.content_type)
+    if (resp.content_length or 0) > MAX_PAGE_BYTES:
+        return response_info(resp, skipped="too_large")
+    body = bytearray()
+    async for chunk in resp.content.iter_chunked(FETCH_CHUNK):
+        body += chunk
+        if len(body) > MAX_PAGE_BYTES:
+            return response_info(resp, skipped="too_large")
+    body = bytes(body)
+    return response_info(resp, body=body, charset=resp.charset or sniff_charset(body))
+
+async def download_file(session, url, path, stats=None, headers=None, job_id=None):
+    async def attempt():
+        started = time.perf_counter()
+        async with session.get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=30, connect=5), trace_request_ctx={"stats": stats}) as resp:
+            host_scheduler.record(url, resp.status, resp.headers.get("Retry-After"))
+            if resp.status == 304:
+                return response_info(resp)
+            if resp.status != 200:
+                raise HTTPStatusError(resp.status)
+            digest = hashlib.sha256()
+            f = await writer.open(path, kind="document")
+            complete = False
+            try:
+                async for chunk in resp.content.iter_chunked(65536):
+                    digest.update(chunk)
+                    metrics.count_bytes("fetched_documents", len(chunk))
+                    if stats is not None:
+                        stats["bytes_fetched"] += len(chunk)
+                    await writer.append(f, chunk, stats)
+                complete = True
+            finally:
+                await writer.close(f)
+                if not complete:
+                    await writer.remove(path)  # never leave half a document behind
+            metrics.observe("download", time.perf_counter() - started, stats)
+            return response_info(resp, content_hash=digest.hexdigest())
+
+    return await fetch_with_retries(session, url, attempt, job_scheduler.documents, job_id, stats)
+
+class CrawlContext:
+    def __init__(self, session, start_url, doc_types, out_dir, job_id, use_js=False, limits=None):
+        self.session = session
+        self.use_js = use_js
+        self.base_domain = urlparse(canonicalize_url(start_url)).netloc
+        self.doc_types = doc_types
+        self.out_dir = out_dir
+        self.job_id = job_id
+        self.cache = None
+        self.contents = None
+        self.records = None
+        # Pages best-first by depth, sitemap hints and URL shape.
+        self.frontier = Frontier(**(limits or {}))
+        # Canonical URLs that were ever queued (pages and documents), so each
+        # is fetched at most once; visited only counts pages actually fetched.
+        self.seen = set()
+        self.visited = set()
+        # Pages/documents queued or in flight: what a resumed job still owes.
+        self.pending = set()
+        self.pending_docs = set()
+        # Documents found by Content-Type rather than URL extension.
+        self.doc_exts = {}
+        self.doc_queue = asyncio.Queue(maxsize=DOC_QUEUE_SIZE)
+        self.seeding = None
+        job = JOBS.get(job_id)
+        self.stats = job.setdefault("stats", new_job_stats()) if job else new_job_stats()
+        self.parse_slots = asyncio.Semaphore(max(1, PARSE_CONCURRENCY))
+        self.started = time.monotonic()
+        self.fetched_at_start = self.stats["pages_fetched"]
+        self.last_event = 0.0
+
+    def claim(self, url):
+        url = canonicalize_url(url)
+        if url in self.seen:
+            return None
+        self.seen.add(url)
+        return url
+
+    def enqueue(self, url, depth=0, priority=None, lastmod=None):
+        """Queue a page once; False if it was seen before or is too deep."""
+        url = self.claim(url)
+        if url is None:
+            return False
+        if not self.frontier.push(url, depth, priority, lastmod):
+            self.stats["pages_too_deep"] += 1
+            return False
+        self.pending.add(url)
+        return True
+
+    async def enqueue_document(self, url):
+        self.stats["docs_found"] += 1
+        self.pending_docs.add(url)
+        await self.doc_queue.put(url)
+
+    def restore(self, state):
+        self.seen.update(state["seen"])
+        self.visited.update(state["visited"])
+        self.frontier.spent.update(state.get("spent", {}))
+        ranks = state.get("ranks", {})
+        for url in state["frontier"]:
+            depth, score = ranks.get(url, (0, None))
+            self.pending.add(url)
+            self.frontier.push(url, depth, score=score)
+
+    def snapshot(self):
+        return {
+            "seen": list(self.seen),
+            "visited": list(self.visited - self.pending),
+            "frontier": list(self.pending),
+            "ranks": {url: self.frontier.ranks[url] for url in self.pending if url in self.frontier.ranks},
+            "spent": dict(self.frontier.spent),
+            "docs": list(self.pending_docs),
+        }
+
+async def scrape_site(start_url, use_js, doc_types, out_dir, job_id, output_format="files", limits=None):
+    job = JOBS.get(job_id)
+    if job:
+        job.setdefault("stats", new_job_stats())
     
-    connector = aiohttp.TCPConnector(limit=MAX_CONCURRENT, limit_per_host=20, force_close=False, enable_cleanup_closed=True)
-    timeout = aiohttp.ClientTimeout(total=15, connect=5)
+    ctx = CrawlContext(http_client.session(), start_url, doc_types, out_dir, job_id, use_js, limits)
+    active_crawls.add(ctx)
+    if HTTP_CACHE:
+        ctx.cache = HttpCache.for_domain(ctx.base_domain)
+    ctx.contents = await writer.open_contents(out_dir)
+    if output_format == "jsonl":
+        ctx.records = RecordStore(out_dir)
+    store = job_store.get_store()
+    checkpoint = store.load_checkpoint(job_id)
+    if checkpoint:
+        ctx.restore(checkpoint)
+    else:
+        ctx.enqueue(start_url)
     
-    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
-        while queue and len(visited) < MAX_PAGES:
-            batch_size = min(MAX_CONCURRENT, len(queue))
-            batch = queue[:batch_size]
-            queue = queue[batch_size:]
-            
-            tasks = []
-            for url in batch:
-                if url not in visited and url.startswith("http"):
-                    visited.add(url)
-                    tasks.append(fetch_url(session, url))
-            
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-            
-            new_links = []
-            for i, html in enumerate(results):
-                if html is None or isinstance(html, Exception):
-                    continue
-                
-                url = batch[i]
-                try:
-                    soup = BeautifulSoup(html, 'lxml')
-                except:
-                    soup = BeautifulSoup(html, 'html.parser')
-                
-                text = soup.get_text(separator='\n', strip=True)
-                title = soup.title.string if soup.title else ""
-                
-                filename = safe_filename(url, 'txt')
-                with open(os.path.join(out_dir, filename), "w", encoding="utf-8") as f:
-                    f.write(f"URL: {url}\nTitle: {title}\n\n{text}")
-                
-                for a_tag in soup.find_all('a', href=True):
-                    href = urljoin(url, a_tag['href'])
-                    
-                    if is_document_link(href, doc_types):
-                        doc_tasks.append(process_document(session, href, doc_types, out_dir))
-                    elif is_internal_link(href, base_domain) and href not in visited:
-                        new_links.append(href)
-                
-                JOBS[job_id]["progress"] = min(95, int(len(visited) / MAX_PAGES * 100))
-            
-            queue.extend([link for link in new_links if link not in queue])
-        
-        if doc_tasks:
-            await asyncio.gather(*doc_tasks, return_exceptions=True)
+    workers = [asyncio.create_task(crawl_worker(ctx)) for _ in range(MAX_CONCURRENT)]
+    workers += [asyncio.create_task(document_worker(ctx)) for _ in range(DOC_CONCURRENCY)]
+    workers.append(asyncio.create_task(checkpoint_loop(ctx)))
+    finished = False
+    try:
+        for url in checkpoint["docs"] if checkpoint else []:
+            ctx.pending_docs.add(url)
+            await ctx.doc_queue.put(url)
+        if USE_SITEMAPS and not checkpoint:
+            ctx.seeding = asyncio.create_task(seed_from_sitemaps(ctx, start_url))
+            workers.append(ctx.seeding)
+        await ctx.frontier.join()
+        if ctx.seeding is not None:
+            ctx.seeding.cancel()
+        await ctx.doc_queue.join()
+        finished = True
+    finally:
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        active_crawls.discard(ctx)
+        if ctx.cache is not None:
+            ctx.cache.close()
+        await writer.close_contents(ctx.contents)
+        if ctx.records is not None:
+            await writer.close_records(ctx.records)
+        # Outputs are durable and listed in the index once the job ends.
+        await writer.flush()
+        if not finished:
+            # Cancelled (shutdown) or crashed: keep the frontier so the job
+            # can be picked up again, and free the lease straight away.
+            save_checkpoint(ctx)
+            store.release(job_id)
     
     JOBS[job_id]["status"] = "done"
     JOBS[job_id]["progress"] = 100
+    store.finish(job_id, "done", 100, ctx.stats)
+    publish_progress(ctx, force=True)
+
+async def seed_from_sitemaps(ctx, start_url):
+    """Queue the site's sitemap pages as they stream in, ranked by their hints."""
+    started = time.perf_counter()
+    rules = await host_scheduler.get_robots(ctx.session, start_url)
+    parts = urlparse(start_url)
+    sources = rules.sitemaps() or [f"{parts.scheme}://{parts.netloc}/sitemap.xml"]
+    seeded = 0
+    urls = iter_sitemap_urls(ctx.session, sources, lambda source: host_scheduler.wait(ctx.session, source))
+    try:
+        async with contextlib.aclosing(urls):
+            async for url, priority, lastmod in urls:
+                if not url.startswith("http") or not is_internal_link(url, ctx.base_domain) or is_document_link(url, ctx.doc_types):
+                    continue
+                if ctx.enqueue(url, SITEMAP_DEPTH, priority, lastmod):
+                    ctx.stats["pages_from_sitemaps"] += 1
+                    seeded += 1
+                    if seeded >= SITEMAP_SEED_FACTOR * MAX_PAGES:
+                        break
+    except Exception as e:
+        metrics.error(classify_error(e), ctx.stats)
+    metrics.observe("sitemaps", time.perf_counter() - started, ctx.stats)
+
+async def checkpoint_loop(ctx):
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(CHECKPOINT_INTERVAL)
+        await loop.run_in_executor(checkpoint_executor, write_checkpoint, ctx.job_id, *checkpoint_state(ctx))
+
+def save_checkpoint(ctx):
+    # Waits for the write: used once the crawl has stopped, and queued behind
+    # any periodic save still in flight so it is the one that sticks.
+    checkpoint_executor.submit(write_checkpoint, ctx.job_id, *checkpoint_state(ctx)).result()
+
+def checkpoint_state(ctx):
+    """Copies of what a checkpoint saves; taken on the event loop."""
+    job = JOBS.get(ctx.job_id, {})
+    return ctx.snapshot(), job.get("status", "running"), job.get("progress", 0), copy.deepcopy(ctx.stats)
+
+def write_checkpoint(job_id, state, status, progress, stats):
+    store = job_store.get_store()
+    store.save_checkpoint(job_id, state)
+    store.save_progress(job_id, status, progress, stats)
+
+async def crawl_worker(ctx):
+    # Long-lived worker: pulls the next URL as soon as the previous one is
+    # finished, so one slow page never holds up the other fetch slots.
+    while True:
+        url = await ctx.frontier.pop()
+        try:
+            await crawl_page(ctx, url)
+        except Exception:
+            metrics.error("crawl", ctx.stats)
+        finally:
+            ctx.frontier.task_done()
+        # Not reached when cancelled, so an interrupted page stays pending.
+        ctx.pending.discard(url)
+        ctx.frontier.done(url)
+
+async def crawl_page(ctx, url):
+    if not url.startswith("http") or len(ctx.visited) >= MAX_PAGES:
+        return
+    if not ctx.frontier.spend(url):
+        ctx.stats["pages_over_budget"] += 1
+        return
+    ctx.visited.add(url)
+    if len(ctx.visited) >= MAX_PAGES and ctx.seeding is not None:
+        ctx.seeding.cancel()  # the budget is spent: no more pages are wanted
+    depth = ctx.frontier.depth(url)
+    
+    out_name = safe_filename(url, 'txt')
+    out_path = os.path.join(ctx.out_dir, out_name)
+    # Only revalidate pages whose output from the last run is still on disk
+    # (or that were recorded as a duplicate of one that is).
+    has_output = has_result(ctx.out_dir, out_name, ctx.contents, ctx.records)
+    cached = ctx.cache.get(url) if ctx.cache is not None and has_output else None
+    
+    fetched = await fetch_url(ctx.session, url, conditional_headers(cached), ctx.stats, ctx.job_id)
+    if fetched is None:
+        ctx.stats["errors"] += 1
+        return
+    if fetched.get("content_type") or fetched.get("skipped"):
+        ext = DOC_CONTENT_TYPES.get(fetched.get("content_type"))
+        if ext in ctx.doc_types:
+            ctx.doc_exts[url] = ext
+            await ctx.enqueue_document(url)
+        else:
+            ctx.stats["pages_skipped"] += 1
+        return
+    ctx.stats["pages_fetched"] += 1
+    ctx.stats["bytes_fetched"] += len(fetched.get("body", b""))
+    
+    if cached and (fetched["status"] == 304 or content_hash(fetched["body"]) == cached["content_hash"]):
+        ctx.stats["pages_unchanged"] += 1
+        links = cached["links"]
+        if fetched["status"] == 200:
+            ctx.cache.put(url, fetched["etag"], fetched["last_modified"], cached["content_hash"], links)
+    elif fetched["status"] == 200:
+        body_hash = content_hash(fetched["body"])
+        original = ctx.contents.find_exact(body_hash)
+        if original is not None and original != out_name:
+            # Same bytes as a page already stored (mirrors, ?print=1, index.html
+            # twins): its links were already followed, so skip parse and write.
+            await add_alias(ctx, url, out_name, original)
+            ctx.stats["pages_duplicate"] += 1
+            links = []
+        else:
+            # Claim the hash before parsing so a copy arriving meanwhile is aliased.
+            ctx.contents.add_content(body_hash, out_name)
+            page = await parse_html(ctx, fetched["body"], fetched["url"], fetched["charset"])
+            if ctx.use_js and looks_like_js_shell(fetched["body"], page["text"]):
+                page = await render_page(ctx, url) or page
+            links = page["links"]
+            near = ctx.contents.find_near(page.get("simhash"))
+            if near is not None and near != out_name:
+                # Only exact copies are skipped. The SimHash covers navigation
+                # and footers too, so pages built on one template with different
+                # bodies can land within SIMHASH_DISTANCE: still write them.
+                ctx.stats["pages_near_duplicate"] += 1
+            ctx.contents.add_content(body_hash, out_name, page.get("simhash"))
+            try:
+                if ctx.records is not None:
+                    record = {"name": out_name, "url": url, "kind": "page", **{k: page[k] for k in ("title", "text", "links")}}
+                    await writer.append_record(ctx.records, record, ctx.stats)
+                else:
+                    await writer.write_text(out_path, f"URL: {url}\nTitle: {page['title']}\n\n{page['text']}", ctx.stats, kind="page")
+            except BaseException:
+                ctx.contents.remove_content(body_hash, out_name)
+                raise
+        if ctx.cache is not None:
+            ctx.cache.put(url, fetched["etag"], fetched["last_modified"], body_hash, links)
+    else:
+        return
+    
+    started = time.perf_counter()
+    for href in links:
+        if is_document_link(href, ctx.doc_types):
+            href = ctx.claim(href)
+            if href is not None:
+                await ctx.enqueue_document(href)
+        elif is_internal_link(href, ctx.base_domain):
+            ctx.enqueue(href, depth + 1)
+    metrics.observe("links", time.perf_counter() - started, ctx.stats)
+    
+    update_progress(ctx)
+
+async def render_page(ctx, url):
+    # The browser requests the page again, so it takes another token.
+    if not await host_scheduler.wait(ctx.session, url):
+        return None
+    html = await renderer.render(url)
+    if not html:
+        return None
+    ctx.stats["pages_rendered"] += 1
+    return await parse_html(ctx, html.encode("utf-8"), url, "utf-8")
 
-async def process_document(session, url, doc_types, out_dir):
+async def document_worker(ctx):
+    while True:
+        url = await ctx.doc_queue.get()
+        try:
+            await process_document(ctx.session, url, ctx.doc_types, ctx.out_dir, ctx.stats, ctx.cache, ctx.contents, ctx.records, ctx.doc_exts.pop(url, None), ctx.job_id)
+        except Exception:
+            metrics.error("document", ctx.stats)
+        finally:
+            ctx.doc_queue.task_done()
+        ctx.stats["docs_done"] += 1
+        ctx.pending_docs.discard(url)
+        update_progress(ctx)
+
+def update_progress(ctx):
+    # Pages count against the page budget, documents against the number
+    # discovered so far; never move the bar backwards as new docs turn up.
+    done = len(ctx.visited) + ctx.stats["docs_done"]
+    total = MAX_PAGES + ctx.stats["docs_found"]
+    job = JOBS.get(ctx.job_id)
+    if job is not None:
+        job["progress"] = max(job["progress"], min(95, int(done / total * 100)))
+    publish_progress(ctx)
+
+def publish_progress(ctx, force=False):
+    if not event_bus.has_subscribers(ctx.job_id):
+        return
+    now = time.monotonic()
+    if not force and now - ctx.last_event < PROGRESS_EVENT_INTERVAL:
+        return
+    ctx.last_event = now
+    job = JOBS.get(ctx.job_id, {})
+    elapsed = max(now - ctx.started, 1e-6)
+    event_bus.publish(ctx.job_id, {
+        "type": "progress",
+        "status": job.get("status", "running"),
+        "progress": job.get("progress", 0),
+        **ctx.stats,
+        "queued": len(ctx.pending),
+        "docs_queued": len(ctx.pending_docs),
+        "pages_per_sec": round((ctx.stats["pages_fetched"] - ctx.fetched_at_start) / elapsed, 2),
+    })
+
+async def parse_html(ctx, body, url, charset):
+    with metrics.time("parse", ctx.stats):
+        return await run_parse(ctx, body, url, charset)
+
+async def run_parse(ctx, body, url, charset):
+    global parse_executor
+    pool = get_parse_executor()
+    if pool is None:
+        return parse_page(body, url, charset, PARSE_BACKEND)
+    async with ctx.parse_slots:
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(pool, parse_page, body, url, charset, PARSE_BACKEND)
+        except BrokenProcessPool:
+            # A worker died (OOM on a huge page, killed, ...); start a fresh pool
+            # for later pages and parse this one inline.
+            if parse_executor is pool:
+                parse_executor = None
+            return parse_page(body, url, charset, PARSE_BACKEND)
+
+async def process_document(session, url, doc_types, out_dir, stats=None, cache=None, contents=None, records=None, ext=None, job_id=None):
     try:
-        ext = url.split('.')[-1].lower().split('?')[0]
+        ext = ext or url.split('.')[-1].lower().split('?')[0]
         if ext not in doc_types:
             return
         
         doc_filename = safe_filename(url, ext)
         doc_path = os.path.join(out_dir, doc_filename)
+        has_output = has_result(out_dir, doc_filename, contents)
+        cached = cache.get(url) if cache is not None and has_output else None
         
-        if await download_file(session, url, doc_path):
-            loop = asyncio.get_event_loop()
-            extracted = await loop.run_in_executor(executor, extract_document, doc_path, ext)
-            
-            if extracted:
-                with open(os.path.join(out_dir, doc_filename+".txt"), "w", encoding="utf-8") as ef:
-                    ef.write(extracted)
-    except:
-        pass
+        downloaded = await download_file(session, url, doc_path, stats, conditional_headers(cached), job_id)
+        if downloaded is None:
+            if stats is not None:
+                stats["errors"] += 1
+            return
+        if cached and (downloaded["status"] == 304 or downloaded["content_hash"] == cached["content_hash"]):
+            if stats is not None:
+                stats["docs_unchanged"] += 1
+            if downloaded["status"] == 200:
+                cache.put(url, downloaded["etag"], downloaded["last_modified"], cached["content_hash"])
+            return
+        if downloaded["status"] != 200:
+            return
+        
+        original = contents.find_exact(downloaded["content_hash"]) if contents is not None else None
+        if original is not None and original != doc_filename:
+            # The same file linked under another URL: keep one copy and its
+            # extracted text, and point this URL's names at them.
+            await writer.remove(doc_path)
+            contents.add_alias(url, doc_filename, original)
+            contents.add_alias(url, doc_filename + ".txt", original + ".txt")
+            if records is not None:
+                await writer.alias_record(records, doc_filename + ".txt", url, original + ".txt", kind="document")
+            else:
+                await writer.add_alias(doc_path, original, kind="document")
+                await writer.add_alias(doc_path + ".txt", original + ".txt", kind="text")
+            if stats is not None:
+                stats["docs_duplicate"] += 1
+        else:
+            if contents is not None:
+                contents.add_content(downloaded["content_hash"], doc_filename)
+            if records is not None:
+                extracted = await run_extraction(doc_path, ext, stats)
+                record = {
+                    "name": doc_filename + ".txt", "url": url, "kind": "document", "file": doc_filename, "type": ext,
+                    "size": os.path.getsize(doc_path), "content_hash": downloaded["content_hash"], "text": extracted or "",
+                }
+                await writer.append_record(records, record, stats)
+            else:
+                await write_extraction(doc_path, ext, os.path.join(out_dir, doc_filename+".txt"), stats)
+        if cache is not None:
+            cache.put(url, downloaded["etag"], downloaded["last_modified"], downloaded["content_hash"])
+    except Exception:
+        metrics.error("document", stats)
 
-def extract_document(path, ext):
+async def write_extraction(path, ext, out_path, stats=None):
+    # Text goes to the writer piece by piece; nothing is written for a
+    # document with no text.
+    if ext in TABLE_EXTS:
+        return await write_table_extraction(path, ext, out_path, stats)
+    handle = None
+    try:
+        async for text in iter_extraction(path, ext, stats):
+            if not text:
+                continue
+            if handle is None:
+                handle = await writer.open(out_path, kind="text")
+            await writer.append(handle, text.encode("utf-8"), stats)
+    finally:
+        if handle is not None:
+            await writer.close(handle)
+
+async def write_table_extraction(path, ext, out_path, stats=None):
+    # Rows go from the extraction worker straight to the output file; the
+    # writer only indexes and fsyncs it.
+    loop = asyncio.get_running_loop()
+    pool = get_extract_executor(ext) if EXTRACT_BACKEND == "process" else executor
+    try:
+        with metrics.time(f"extract_{ext}", stats):
+            written = await loop.run_in_executor(pool, write_table, path, ext, out_path, TABLE_CHUNK_BYTES)
+    except BrokenProcessPool:
+        drop_extract_executor(pool)
+        metrics.error("extract", stats)
+        return
+    if written:
+        await writer.adopt(out_path, stats, kind="text")
+
+def has_result(out_dir, name, contents=None, records=None):
+    if records is not None and records.has(name):
+        return True
+    return os.path.exists(os.path.join(out_dir, name)) or (contents is not None and contents.resolve(name) is not None)
+
+async def add_alias(ctx, url, name, target):
+    # Duplicate pages keep their own entry in listings, pointing at the
+    # stored copy.
+    ctx.contents.add_alias(url, name, target)
+    if ctx.records is not None:
+        await writer.alias_record(ctx.records, name, url, target)
+    else:
+        await writer.add_alias(os.path.join(ctx.out_dir, name), target, kind="page")
+
+async def run_extraction(path, ext, stats=None):
+    return "".join([text async for text in iter_extraction(path, ext, stats)])
+
+async def iter_extraction(path, ext, stats=None):
+    """Yield a document's text in pieces, in order, as it is extracted."""
+    loop = asyncio.get_running_loop()
+    pool = get_extract_executor(ext) if EXTRACT_BACKEND == "process" else executor
+    started = time.perf_counter()
     try:
-        if ext == "docx":
-            return extract_docx(path)
-        elif ext == "pdf":
-            return extract_pdf(path)
-        elif ext == "csv":
-            return extract_csv(path)
-        elif ext in ["xlsx", "xls"]:
-            return extract_xlsx(path)
-        elif ext == "pptx":
-            return extract_pptx(path)
-        elif ext == "txt":
-            with open(path, "r", encoding="utf-8", errors="ignore") as tf:
-                return tf.read()
-    except:
-        pass
+        if ext == "pdf":
+            async for text in iter_pdf_extraction(loop, pool, path, stats):
+                yield text
+        else:
+            yield await loop.run_in_executor(pool, extract_document, path, ext)
+    except BrokenProcessPool:
+        drop_extract_executor(pool)
+        metrics.error("extract", stats)
+    except Exception:
+        metrics.error("extract", stats)
+    finally:
+        metrics.observe(f"extract_{ext}", time.perf_counter() - started, stats)
+
+def drop_extract_executor(pool):
+    # Drop a dead pool so the next document gets a fresh one.
+    for name, candidate in list(extract_executors.items()):
+        if candidate is pool:
+            del extract_executors[name]
+
+async def iter_pdf_extraction(loop, pool, path, stats=None):
+    # Page ranges of PDF_PAGES_PER_TASK run on the pool, at most
+    # MAX_TASKS_PER_DOC at a time, and are yielded in page order as they
+    # finish, so only a window of the document's text is ever held.
+    try:
+        pages = await loop.run_in_executor(pool, count_pdf_pages, path)
+    except BrokenProcessPool:
+        raise
+    except Exception:
+        return
+    limit = min(pages, PDF_MAX_PAGES) if PDF_MAX_PAGES else pages
+    deadline = time.time() + PDF_MAX_SECONDS if PDF_MAX_SECONDS else None
+    ranges = iter(range(0, limit, PDF_PAGES_PER_TASK))
+    window = collections.deque()
+
+    def submit():
+        start = next(ranges, None)
+        if start is not None:
+            stop = min(limit, start + PDF_PAGES_PER_TASK)
+            window.append(loop.run_in_executor(pool, extract_pdf_pages, path, start, stop, deadline, PDF_MAX_TEXT_BYTES))
+
+    truncated = limit < pages
+    written = 0
+    try:
+        for _ in range(max(1, MAX_TASKS_PER_DOC)):
+            submit()
+        while window:
+            text = await window.popleft()
+            written += len(text.encode("utf-8"))
+            yield text
+            if (PDF_MAX_TEXT_BYTES and written >= PDF_MAX_TEXT_BYTES) or (deadline and time.time() > deadline):
+                truncated = True
+                break
+            submit()
+    finally:
+        for future in window:
+            future.cancel()
+        if truncated and stats is not None:
+            stats["docs_truncated"] += 1
+
+def extract_document(path, ext):
+    # Failures propagate so callers can count them (run on a pool, they
+    # re-raise in the crawler).
+    if ext == "docx":
+        return extract_docx(path)
+    elif ext == "pdf":
+        return extract_pdf(path)
+    elif ext == "csv":
+        return extract_csv(path)
+    elif ext in ["xlsx", "xls"]:
+        return extract_xlsx(path)
+    elif ext == "pptx":
+        return extract_pptx(path)
+    elif ext == "txt":
+        with open(path, "r", encoding="utf-8", errors="ignore") as tf:
+            return tf.read()
     return ""
 
 def is_document_link(link, doc_types):
@@ -0,0 +1,145 @@
+import xml.etree.ElementTree as ET
+import zlib
+from datetime import UTC, datetime
+
+import aiohttp
+
+# Sitemaps are parsed as they stream in. A crawl reads at most MAX_SITEMAPS
+# files (sitemap indexes included) and takes at most MAX_SITEMAP_URLS page
+# URLs from them; a file is cut off after MAX_SITEMAP_BYTES of XML, the
+# protocol's own limit, however small it is gzipped.
+MAX_SITEMAPS = 50
+MAX_SITEMAP_URLS = 50000
+MAX_SITEMAP_BYTES = 50 * 1024 * 1024
+SITEMAP_CHUNK = 65536
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+def parse_priority(value):
+    try:
+        return min(max(float(value), 0.0), 1.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_lastmod(value):
+    # W3C datetime: a date, or a date and time with a zone.
+    try:
+        parsed = datetime.fromisoformat(value.strip())
+    except (AttributeError, ValueError):
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=UTC)
+    return parsed.timestamp()
+
+
+class SitemapParser:
+    """Incremental parser for sitemaps and sitemap indexes, plain or gzipped.
+
+    feed() takes raw response chunks and returns the entries completed so
+    far: ("sitemap", loc, None, None) from an index, ("url", loc, priority,
+    lastmod) from a urlset. Parsed elements are dropped straight away, so
+    memory stays flat however long the file is.
+    """
+
+    def __init__(self):
+        self.parser = ET.XMLPullParser(events=("start", "end"))
+        self.inflate = None
+        self.started = False
+        self.size = 0
+        self.truncated = False
+        self.root = None
+        self.fields = {}
+
+    def feed(self, chunk):
+        if not self.started:
+            self.started = True
+            if chunk.startswith(GZIP_MAGIC):
+                self.inflate = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        if self.inflate is not None:
+            chunk = self.inflate.decompress(chunk, MAX_SITEMAP_BYTES - self.size + 1)
+        self.size += len(chunk)
+        if self.size > MAX_SITEMAP_BYTES:
+            self.truncated = True
+            return []
+        self.parser.feed(chunk)
+        return self._entries()
+
+    def close(self):
+        if self.truncated:
+            return []
+        self.parser.close()
+        return self._entries()
+
+    def _entries(self):
+        entries = []
+        for event, elem in self.parser.read_events():
+            tag = elem.tag.rsplit("}", 1)[-1]
+            if event == "start":
+                if self.root is None:
+                    self.root = elem
+                continue
+            if tag in ("loc", "priority", "lastmod"):
+                # First one wins: image and video extensions nest their own <loc>.
+                self.fields.setdefault(tag, (elem.text or "").strip())
+            elif tag in ("url", "sitemap"):
+                loc = self.fields.get("loc")
+                if loc and tag == "url":
+                    entries.append(
+                        (
+                            "url",
+                            loc,
+                            parse_priority(self.fields.get("priority")),
+                            parse_lastmod(self.fields.get("lastmod")),
+                        )
+                    )
+                elif loc:
+                    entries.append(("sitemap", loc, None, None))
+                self.fields = {}
+                self.root.clear()
+        return entries
+
+
+async def iter_sitemap(session, url):
+    """Stream one sitemap file and yield its entries as they are parsed."""
+    async with session.get(url, timeout=aiohttp.ClientTimeout(total=60)) as resp:
+        if resp.status != 200:
+            return
+        parser = SitemapParser()
+        async for chunk in resp.content.iter_chunked(SITEMAP_CHUNK):
+            for found in parser.feed(chunk):
+                yield found
+            if parser.truncated:
+                return
+        for found in parser.close():
+            yield found
+
+
+async def iter_sitemap_urls(session, sources, wait=None):
+    """Yield (url, priority, lastmod) for the pages listed under ``sources``.
+
+    Sitemap indexes are followed breadth-first. ``wait`` is awaited before
+    each file is fetched and may return False to skip it (robots.txt).
+    A file that is missing, broken or not XML ends that file only.
+    """
+    queue = list(sources)
+    done = set()
+    found = 0
+    while queue and len(done) < MAX_SITEMAPS:
+        source = queue.pop(0)
+        if source in done:
+            continue
+        done.add(source)
+        if wait is not None and not await wait(source):
+            continue
+        try:
+            async for kind, loc, priority, lastmod in iter_sitemap(session, source):
+                if kind == "sitemap":
+                    queue.append(loc)
+                    continue
+                yield loc, priority, lastmod
+                found += 1
+                if found >= MAX_SITEMAP_URLS:
+                    return
+        except (aiohttp.ClientError, TimeoutError, ET.ParseError, zlib.error):
+            continue
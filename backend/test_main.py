@@ -1,9 +1,25 @@
+import io
+import json
+import tarfile
+import zipfile
+
 import pytest
 from fastapi.testclient import TestClient
+
+import http_cache
+import job_store
+import main
 from main import app
 
 client = TestClient(app)
 
+@pytest.fixture(autouse=True)
+def state_dirs(tmp_path, monkeypatch):
+    # Jobs started by these tests write their output under the working directory.
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(http_cache, "CACHE_DIR", str(tmp_path / "http_cache"))
+    monkeypatch.setattr(job_store, "JOB_DB", str(tmp_path / "jobs.sqlite3"))
+
 def test_root_health():
     """Test that the API is accessible"""
     response = client.get("/docs")
@@ -19,6 +35,14 @@ def test_scrape_endpoint_validation():
     assert response.status_code == 200
     assert "job_id" in response.json()
 
+def test_scrape_rejects_unknown_priority():
+    response = client.post("/scrape", json={"url": "https://example.com", "use_js": False, "priority": "urgent"})
+    assert response.status_code == 400
+
+def test_scrape_rejects_bad_crawl_limits():
+    response = client.post("/scrape", json={"url": "https://example.com", "use_js": False, "path_budgets": {"events": 10}})
+    assert response.status_code == 400
+
 def test_score_text_endpoint():
     """Test AI text scoring endpoint"""
     response = client.post("/score-text", data={
@@ -40,3 +64,80 @@ def test_deai_text_endpoint():
     data = response.json()
     assert "deai_text" in data
     assert len(data["deai_text"]) > 0
+
+def test_events_stream_for_unknown_job():
+    """Event stream reports not_found and closes"""
+    response = client.get("/events/does-not-exist")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert '"status": "not_found"' in response.text
+
+class FakeNode:
+    """Answers job_status from a script of (status, progress, stats)."""
+
+    def __init__(self, *answers):
+        self.answers = list(answers)
+
+    async def job_status(self, job_id):
+        return self.answers.pop(0) if len(self.answers) > 1 else self.answers[0]
+
+def test_events_stream_follows_distributed_jobs(monkeypatch):
+    """With a broker attached, events come from the job's status across all workers"""
+    monkeypatch.setattr(main, "NODE_EVENT_POLL_INTERVAL", 0.01)
+    monkeypatch.setattr(main, "crawl_node", FakeNode(
+        ("running", 10, {"pages_fetched": 5, "queued": 40}),
+        ("running", 10, {"pages_fetched": 5, "queued": 40}),
+        ("running", 50, {"pages_fetched": 25, "queued": 3}),
+        ("done", 100, {"pages_fetched": 30, "queued": 0}),
+    ))
+    response = client.get("/events/dist-job")
+    events = [json.loads(line[len("data: "):]) for line in response.text.splitlines() if line.startswith("data: ")]
+    assert [(e["type"], e["status"], e["progress"], e["pages_fetched"]) for e in events] == [
+        ("progress", "running", 10, 5),
+        ("progress", "running", 50, 25),
+        ("progress", "done", 100, 30),
+    ]
+
+def test_events_stream_falls_back_to_local_jobs(monkeypatch):
+    """Jobs the broker does not know are streamed from this process"""
+    monkeypatch.setattr(main, "crawl_node", FakeNode(("not_found", 0, {})))
+    response = client.get("/events/does-not-exist")
+    assert '"status": "not_found"' in response.text
+
+@pytest.fixture
+def output_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    out_dir = tmp_path / "output_export.test"
+    out_dir.mkdir()
+    (out_dir / "page.txt").write_text("URL: http://export.test/\n\nhello " * 100)
+    (out_dir / "report.pdf").write_bytes(bytes(range(256)) * 64)
+    return out_dir
+
+def test_download_range_request(output_dir):
+    """Range requests get 206 and just the requested bytes"""
+    response = client.get("/download/export.test/report.pdf", headers={"Range": "bytes=256-511"})
+    assert response.status_code == 206
+    assert response.content == bytes(range(256))
+
+def test_export_streams_zip_and_tar(output_dir):
+    """The export holds every output, in either archive format"""
+    response = client.get("/export/export.test?format=zip")
+    assert response.status_code == 200
+    with zipfile.ZipFile(io.BytesIO(response.content)) as zf:
+        assert sorted(zf.namelist()) == ["page.txt", "report.pdf"]
+        assert zf.read("report.pdf") == (output_dir / "report.pdf").read_bytes()
+    response = client.get("/export/export.test?format=tar.gz")
+    assert response.status_code == 200
+    with tarfile.open(fileobj=io.BytesIO(response.content), mode="r:gz") as tf:
+        assert sorted(tf.getnames()) == ["page.txt", "report.pdf"]
+        assert tf.extractfile("page.txt").read() == (output_dir / "page.txt").read_bytes()
+    assert client.get("/export/export.test?format=rar").status_code == 400
+    assert client.get("/export/missing.test").status_code == 404
+
+def test_metrics_endpoint():
+    """Prometheus text exposition with the queue-depth gauges"""
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "# TYPE scraper_stage_seconds histogram" in response.text
+    assert 'scraper_queue_depth{queue="writer"}' in response.text
@@ -0,0 +1,1209 @@
+import asyncio
+import gzip
+import io
+import os
+import shutil
+import socket
+import ssl
+import struct
+import tarfile
+import threading
+import time
+import zipfile
+
+import pytest
+import pytest_asyncio
+from aiohttp import ClientConnectorCertificateError, ClientSSLError, web
+from aiohttp.client_reqrep import ConnectionKey
+from aiohttp.test_utils import TestServer
+
+import content_index
+import distributed
+import frontier
+import http_cache
+import job_scheduler
+import job_store
+import js_render
+import metrics
+import output_index
+import politeness
+import retries
+import scraper
+from urlnorm import canonicalize_url
+
+
+@pytest.fixture(autouse=True)
+def state_dirs(tmp_path_factory, monkeypatch):
+    monkeypatch.chdir(tmp_path_factory.mktemp("cwd"))
+    monkeypatch.setattr(http_cache, "CACHE_DIR", str(tmp_path_factory.mktemp("http_cache")))
+    monkeypatch.setattr(job_store, "JOB_DB", str(tmp_path_factory.mktemp("jobs") / "jobs.sqlite3"))
+
+
+@pytest_asyncio.fixture(autouse=True)
+async def shared_session():
+    # The shared HTTP session belongs to the test's event loop.
+    yield
+    await scraper.http_client.close()
+
+
+def site_app(slow_paths=(), delay=0, docs=0, robots=None, hits=None):
+    def not_modified(request):
+        return request.headers.get("If-None-Match") == f'"{request.path}"'
+
+    async def document(request):
+        if not_modified(request):
+            return web.Response(status=304)
+        return web.Response(
+            text=f"contents of {request.match_info['name']}", headers={"ETag": f'"{request.path}"'}
+        )
+
+    async def page(request):
+        n = int(request.match_info["n"])
+        if hits is not None:
+            hits[request.path] = hits.get(request.path, 0) + 1
+        if not_modified(request):
+            return web.Response(status=304)
+        if request.path in slow_paths:
+            await asyncio.sleep(delay)
+        links = "".join(f'<a href="/p/{c}">{c}</a>' for c in (2 * n + 1, 2 * n + 2) if c < 15)
+        links += '<a href="/p/0?utm_source=nav#top">home</a>'
+        links += "".join(f'<a href="/files/doc{d}.txt">doc</a>' for d in range(docs))
+        return web.Response(
+            text=f"<html><title>P{n}</title><body>{links}</body></html>",
+            content_type="text/html",
+            headers={"ETag": f'"{request.path}"'},
+        )
+
+    app = web.Application()
+    app.router.add_get("/p/{n}", page)
+    app.router.add_get("/files/{name}", document)
+
+    async def robots_txt(request):
+        return web.Response(text=robots)
+
+    if robots is not None:
+        app.router.add_get("/robots.txt", robots_txt)
+    return app
+
+
+def outputs(out_dir):
+    # Skips the content index kept next to the results.
+    return [p for p in out_dir.iterdir() if not p.name.startswith(".")]
+
+
+async def run_job(start_url, out_dir, doc_types=()):
+    job_id = "test-job"
+    scraper.JOBS[job_id] = {"status": "running", "progress": 0, "domain": "test"}
+    await scraper.scrape_site(start_url, False, list(doc_types), str(out_dir), job_id)
+    return scraper.JOBS[job_id]
+
+
+@pytest.mark.asyncio
+async def test_scrape_site_crawls_whole_site(tmp_path):
+    """Every reachable page is fetched once, however its links are spelled"""
+    async with TestServer(site_app()) as server:
+        job = await run_job(str(server.make_url("/p/0")), tmp_path)
+    assert job["status"] == "done"
+    assert len(outputs(tmp_path)) == 15
+    assert job["stats"]["writes"] == 15
+    assert job["stats"]["bytes_written"] == sum(p.stat().st_size for p in outputs(tmp_path))
+
+
+@pytest.mark.asyncio
+async def test_slow_page_does_not_block_other_fetches(tmp_path, monkeypatch):
+    """Workers keep pulling URLs while one page is still loading"""
+    monkeypatch.setattr(politeness, "BURST", 100)
+    # /p/2 and /p/3 sit on different levels; a batch-and-wait loop pays for
+    # each of them in turn, the frontier overlaps them.
+    async with TestServer(site_app(slow_paths=("/p/2", "/p/3"), delay=0.6)) as server:
+        started = time.perf_counter()
+        await run_job(str(server.make_url("/p/0")), tmp_path)
+        elapsed = time.perf_counter() - started
+    assert len(outputs(tmp_path)) == 15
+    assert elapsed < 1.1
+
+
+@pytest.mark.asyncio
+async def test_documents_are_extracted_alongside_the_crawl(tmp_path):
+    """Each linked document is fetched once and counted in the job stats"""
+    async with TestServer(site_app(docs=3)) as server:
+        job = await run_job(str(server.make_url("/p/0")), tmp_path, doc_types=["txt"])
+    assert (
+        job["stats"]["pages_fetched"],
+        job["stats"]["docs_found"],
+        job["stats"]["docs_done"],
+    ) == (15, 3, 3)
+    extracted = [p.name for p in outputs(tmp_path) if p.name.endswith(".txt.txt")]
+    assert len(extracted) == 3
+
+
+@pytest.mark.asyncio
+async def test_crawl_honours_robots_txt(tmp_path):
+    """Disallowed paths are skipped and Crawl-delay spaces out requests"""
+    robots = "User-agent: *\nDisallow: /p/2\nCrawl-delay: 0.1\n"
+    async with TestServer(site_app(robots=robots)) as server:
+        started = time.perf_counter()
+        await run_job(str(server.make_url("/p/0")), tmp_path)
+        elapsed = time.perf_counter() - started
+    # /p/2 and everything only reachable through it (5, 6, 11-14) is skipped
+    assert len(outputs(tmp_path)) == 8
+    assert elapsed >= 0.7
+
+
+@pytest.mark.asyncio
+async def test_interrupted_job_resumes_from_checkpoint(tmp_path):
+    """A crawl cancelled mid-way is claimed again and finishes its frontier"""
+    hits = {}
+    store = job_store.get_store()
+    async with TestServer(site_app(slow_paths=("/p/5", "/p/6"), delay=0.5, hits=hits)) as server:
+        url = str(server.make_url("/p/0"))
+        store.create_job("resume-job", url, "test", str(tmp_path), False, [])
+        scraper.JOBS["resume-job"] = {"status": "running", "progress": 0, "domain": "test"}
+        crawl = asyncio.create_task(
+            scraper.scrape_site(url, False, [], str(tmp_path), "resume-job")
+        )
+        await asyncio.sleep(0.3)
+        crawl.cancel()
+        await asyncio.gather(crawl, return_exceptions=True)
+        assert store.get_job("resume-job")["status"] == "running"
+        assert any(u.endswith("/p/5") for u in store.load_checkpoint("resume-job")["frontier"])
+
+        del scraper.JOBS["resume-job"]
+        await asyncio.gather(*scraper.resume_orphaned_jobs())
+    assert store.get_job("resume-job")["status"] == "done"
+    assert len(outputs(tmp_path)) == 15
+    assert hits["/p/0"] == 1
+
+
+@pytest.mark.asyncio
+async def test_checkpoints_are_written_off_the_event_loop(tmp_path, monkeypatch):
+    """Periodic checkpoints are encoded and saved on the checkpoint thread"""
+    monkeypatch.setattr(scraper, "CHECKPOINT_INTERVAL", 0.05)
+    store = job_store.get_store()
+    threads = []
+    save = store.save_checkpoint
+
+    def save_checkpoint(job_id, state):
+        threads.append(threading.current_thread().name)
+        save(job_id, state)
+
+    monkeypatch.setattr(store, "save_checkpoint", save_checkpoint)
+    scraper.JOBS["checkpoint-job"] = {"status": "running", "progress": 0, "domain": "test"}
+    async with TestServer(site_app(slow_paths=("/p/3",), delay=0.4)) as server:
+        url = str(server.make_url("/p/0"))
+        store.create_job("checkpoint-job", url, "test", str(tmp_path), False, [])
+        await scraper.scrape_site(url, False, [], str(tmp_path), "checkpoint-job")
+    assert threads and all(name.startswith("checkpoint") for name in threads)
+
+
+@pytest.mark.asyncio
+async def test_progress_events_are_pushed_until_done(tmp_path):
+    """Subscribers see live progress snapshots and a final done event"""
+    scraper.JOBS["events-job"] = {"status": "running", "progress": 0, "domain": "test"}
+    async with TestServer(site_app(slow_paths=("/p/3",), delay=0.6)) as server:
+        crawl = asyncio.create_task(
+            scraper.scrape_site(
+                str(server.make_url("/p/0")), False, [], str(tmp_path), "events-job"
+            )
+        )
+        events = [event async for event in scraper.stream_job_events("events-job") if event]
+        await crawl
+    assert events[0]["status"] == "running"
+    assert events[-1]["status"] == "done"
+    assert events[-1]["pages_fetched"] == 15
+    assert any(0 < event.get("pages_fetched", 0) < 15 for event in events)
+
+
+SHELL_PAGE = """<html><head><title>App</title></head><body><div id="root"></div>
+<script>document.getElementById("root").innerHTML =
+  "<p>Rendered by the browser with enough words to pass for content</p><a href='/p/1'>next</a>";</script>
+</body></html>"""
+
+
+def shell_app():
+    app = site_app()
+
+    async def shell(request):
+        return web.Response(text=SHELL_PAGE, content_type="text/html")
+
+    app.router.add_get("/app", shell)
+    return app
+
+
+def test_js_shell_detection():
+    """Only near-empty pages with scripts or a mount point are rendered"""
+    assert js_render.looks_like_js_shell(SHELL_PAGE.encode(), "App")
+    assert not js_render.looks_like_js_shell(b"<html><body><p>Plain</p></body></html>", "Plain")
+    assert not js_render.looks_like_js_shell(b"<script></script>" + b"x" * 10, "word " * 100)
+
+
+@pytest.mark.asyncio
+async def test_use_js_renders_only_shell_pages(tmp_path, monkeypatch):
+    """Shell pages go through the browser pool, ordinary pages do not"""
+    rendered = []
+
+    class FakePool:
+        async def render(self, url, wait_selector=None):
+            rendered.append(url)
+            return (
+                "<html><title>App</title><body><p>Rendered</p><a href='/p/1'>next</a></body></html>"
+            )
+
+    monkeypatch.setattr(scraper, "renderer", FakePool())
+    async with TestServer(shell_app()) as server:
+        scraper.JOBS["js-job"] = {"status": "running", "progress": 0, "domain": "test"}
+        await scraper.scrape_site(str(server.make_url("/app")), True, [], str(tmp_path), "js-job")
+    assert [url.rsplit("/", 1)[-1] for url in rendered] == ["app"]
+    # /p/1 is only linked from the rendered page; from there the whole site
+    assert len(outputs(tmp_path)) == 16
+    assert scraper.JOBS["js-job"]["stats"]["pages_rendered"] == 1
+
+
+@pytest.mark.integration
+@pytest.mark.asyncio
+@pytest.mark.skipif(
+    not (shutil.which("google-chrome") or shutil.which("chromium")), reason="needs Chrome"
+)
+async def test_browser_pool_renders_fixture_page():
+    """A real headless Chrome renders the shell and is reused for the next page"""
+    pool = js_render.BrowserPool(size=1)
+    try:
+        async with TestServer(shell_app()) as server:
+            first = await pool.render(str(server.make_url("/app")))
+            second = await pool.render(str(server.make_url("/app")))
+    finally:
+        pool.close()
+    assert "Rendered by the browser" in first and "Rendered by the browser" in second
+
+
+@pytest.mark.asyncio
+async def test_unreachable_robots_txt_disallows_the_host_briefly():
+    """A 5xx or unreachable robots.txt blocks the host until ROBOTS_ERROR_TTL; a 4xx allows all"""
+    answers = [503, 404]
+
+    async def robots_txt(request):
+        return web.Response(status=answers.pop(0))
+
+    app = web.Application()
+    app.router.add_get("/robots.txt", robots_txt)
+    scheduler = politeness.PolitenessScheduler()
+    session = scraper.http_client.session()
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        dead = f"http://127.0.0.1:{sock.getsockname()[1]}/page"
+    assert not await scheduler.wait(session, dead)
+    async with TestServer(app) as server:
+        url = str(server.make_url("/page"))
+        assert not await scheduler.wait(session, url)
+        rules = scheduler.robots[f"127.0.0.1:{server.port}"]
+        assert rules.ttl == politeness.ROBOTS_ERROR_TTL
+        rules.fetched_at -= politeness.ROBOTS_ERROR_TTL
+        assert await scheduler.wait(session, url)
+        assert scheduler.robots[f"127.0.0.1:{server.port}"].ttl == politeness.ROBOTS_TTL
+    assert answers == []
+
+
+@pytest.mark.asyncio
+async def test_cancelled_robots_fetch_is_not_cached():
+    """Cancelling the task fetching robots.txt leaves the host unknown, not disallowed"""
+    started = asyncio.Event()
+    release = asyncio.Event()
+
+    async def robots_txt(request):
+        started.set()
+        await release.wait()
+        return web.Response(text="User-agent: *\nAllow: /\n")
+
+    app = web.Application()
+    app.router.add_get("/robots.txt", robots_txt)
+    scheduler = politeness.PolitenessScheduler()
+    session = scraper.http_client.session()
+    async with TestServer(app) as server:
+        url = str(server.make_url("/page"))
+        first = asyncio.create_task(scheduler.get_robots(session, url))
+        await started.wait()
+        waiter = asyncio.create_task(scheduler.get_robots(session, url))
+        await asyncio.sleep(0)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        assert f"127.0.0.1:{server.port}" not in scheduler.robots
+        # The waiter fetches robots.txt itself instead of inheriting the cancellation.
+        release.set()
+        rules = await waiter
+    assert rules.ttl == politeness.ROBOTS_TTL and not rules.parser.disallow_all
+
+
+def test_throttled_host_slows_down():
+    """429 halves the host rate and Retry-After pauses it"""
+    scheduler = politeness.PolitenessScheduler()
+    scheduler.hosts["example.com"] = politeness.HostState(rate=10)
+    scheduler.record("https://example.com/a", 429, "2")
+    state = scheduler.hosts["example.com"]
+    assert state.rate == 5
+    assert 1.5 < state.reserve() <= 2
+    scheduler.record("https://example.com/a", 200)
+    assert state.rate == 5 + politeness.INCREASE_STEP
+
+
+def test_throttling_never_exceeds_the_robots_rate():
+    """A 429 on a host slower than MIN_RATE (Crawl-delay: 10) keeps its robots.txt rate"""
+    rules = politeness.RobotsRules("User-agent: *\nCrawl-delay: 10\n")
+    assert rules.max_rate == 0.1
+    scheduler = politeness.PolitenessScheduler()
+    state = scheduler.hosts["example.com"] = politeness.HostState(rules.max_rate, rules.max_rate, 1)
+    scheduler.record("https://example.com/a", 429)
+    assert state.rate == 0.1
+
+
+@pytest.mark.asyncio
+async def test_recrawl_revalidates_instead_of_reprocessing(tmp_path):
+    """A second crawl gets 304s, follows cached links and writes nothing"""
+    out_dir = tmp_path / "out"
+    out_dir.mkdir()
+    async with TestServer(site_app(docs=2)) as server:
+        await run_job(str(server.make_url("/p/0")), out_dir, doc_types=["txt"])
+        job = await run_job(str(server.make_url("/p/0")), out_dir, doc_types=["txt"])
+    stats = job["stats"]
+    assert stats["pages_fetched"] == stats["pages_unchanged"] == 15
+    assert stats["docs_done"] == stats["docs_unchanged"] == 2
+    assert stats["writes"] == 0
+
+
+def test_canonicalize_url_collapses_variants():
+    """Case, default port, fragment and tracking params are normalised; trailing slashes kept"""
+    variants = [
+        "https://example.com/a",
+        "HTTPS://Example.com:443/a",
+        "https://example.com/a#frag",
+        "https://example.com/a?utm_source=x&fbclid=abc",
+    ]
+    assert {canonicalize_url(u) for u in variants} == {"https://example.com/a"}
+    assert canonicalize_url("https://example.com/a/") == "https://example.com/a/"
+    assert (
+        canonicalize_url("https://example.com/a/", trailing_slash="strip")
+        == "https://example.com/a"
+    )
+    assert (
+        canonicalize_url("https://example.com/a?id=1%202&utm_medium=y")
+        == "https://example.com/a?id=1%202"
+    )
+    assert (
+        canonicalize_url("https://example.com/a", trailing_slash="add") == "https://example.com/a/"
+    )
+    assert canonicalize_url("http://example.com:8080") == "http://example.com:8080/"
+
+
+@pytest.mark.asyncio
+async def test_relative_links_resolve_against_the_answering_url(tmp_path):
+    """A directory page reached through a redirect resolves its relative links under the directory"""
+
+    async def dept(request):
+        if not request.path.endswith("/"):
+            raise web.HTTPMovedPermanently(request.path + "/")
+        body = '<html><title>Dept</title><body><a href="staff.html">staff</a></body></html>'
+        return web.Response(text=body, content_type="text/html")
+
+    async def staff(request):
+        return web.Response(
+            text="<html><title>Staff</title><body>people</body></html>", content_type="text/html"
+        )
+
+    async def home(request):
+        return web.Response(text='<a href="/dept">dept</a>', content_type="text/html")
+
+    app = web.Application()
+    app.router.add_get("/", home)
+    app.router.add_get("/dept", dept)
+    app.router.add_get("/dept/", dept)
+    app.router.add_get("/dept/staff.html", staff)
+    async with TestServer(app) as server:
+        job = await run_job(str(server.make_url("/")), tmp_path)
+    assert any("staff" in p.name for p in outputs(tmp_path))
+    assert job["stats"]["pages_fetched"] == 3 and not job["stats"].get("failures")
+
+
+def write_pdf(path, pages):
+    # Minimal text PDF: one Helvetica "Page N" line per page.
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    kids = []
+    for n in range(pages):
+        stream = f"BT /F1 12 Tf 72 720 Td (Page {n}) Tj ET".encode()
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>"
+            % len(objects)
+        )
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {pages} >>".encode()
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, obj in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (i, obj)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % off for off in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1,
+        xref,
+    )
+    path.write_bytes(bytes(out))
+
+
+@pytest.mark.asyncio
+async def test_process_backend_splits_large_pdfs(tmp_path, monkeypatch):
+    """Page ranges extracted across the PDF pool join up to the single-pass text"""
+    pdf = tmp_path / "big.pdf"
+    write_pdf(pdf, 12)
+    monkeypatch.setattr(scraper, "EXTRACT_BACKEND", "process")
+    monkeypatch.setattr(scraper, "PDF_PAGES_PER_TASK", 5)
+    text = await scraper.run_extraction(str(pdf), "pdf")
+    assert text == scraper.extract_pdf(str(pdf))
+    assert "Page 0" in text and "Page 11" in text
+
+
+def mirror_app():
+    article = " ".join(f"word{i}" for i in range(200))
+
+    async def home(request):
+        links = "".join(
+            f'<a href="{path}">x</a>'
+            for path in ("/a", "/a-copy", "/b", "/f/one.txt", "/f/two.txt")
+        )
+        return web.Response(text=f"<html><body>{links}</body></html>", content_type="text/html")
+
+    async def article_page(request):
+        # /b only differs from /a by a footer line: a near-duplicate, still written.
+        footer = " printed copy" if request.path == "/b" else ""
+        return web.Response(
+            text=f"<html><title>A</title><body>{article}{footer}</body></html>",
+            content_type="text/html",
+        )
+
+    async def document(request):
+        return web.Response(text="the same report")
+
+    app = web.Application()
+    app.router.add_get("/", home)
+    app.router.add_get("/a", article_page)
+    app.router.add_get("/a-copy", article_page)
+    app.router.add_get("/b", article_page)
+    app.router.add_get("/f/{name}", document)
+    return app
+
+
+@pytest.mark.asyncio
+async def test_duplicates_are_stored_once(tmp_path, monkeypatch):
+    """Exact duplicate pages/documents are aliased, not written again"""
+    monkeypatch.chdir(tmp_path)
+    out_dir = tmp_path / "output_test"
+    out_dir.mkdir()
+    write_text = scraper.writer.write_text
+
+    async def slow_write_text(*args, **kwargs):
+        # Keeps /a and /a-copy in flight together: the second must still find the first.
+        await asyncio.sleep(0.2)
+        await write_text(*args, **kwargs)
+
+    monkeypatch.setattr(scraper.writer, "write_text", slow_write_text)
+    commit = content_index.ContentIndex.commit
+    committed_on = set()
+
+    def tracked_commit(index):
+        committed_on.add(threading.current_thread().name)
+        commit(index)
+
+    monkeypatch.setattr(content_index.ContentIndex, "commit", tracked_commit)
+    async with TestServer(mirror_app()) as server:
+        job = await run_job(str(server.make_url("/")), out_dir, doc_types=("txt",))
+    # The content index is only ever written on the output writer thread.
+    assert committed_on == {"output-writer"}
+    assert job["stats"]["pages_duplicate"] == 1
+    assert job["stats"]["pages_near_duplicate"] == 1
+    assert job["stats"]["docs_duplicate"] == 1
+    # home, the article and its near-duplicate, one document and its extracted text
+    assert len(outputs(out_dir)) == 5
+    listed, _ = scraper.list_results("test")
+    assert len(listed) == 5 + 1 + 2
+    for name in listed:
+        assert os.path.exists(scraper.get_result_file("test", name))
+
+
+@pytest.mark.asyncio
+async def test_pages_sharing_a_template_are_all_written(tmp_path):
+    """Profile pages with the same navigation but different bodies are not aliased"""
+    nav = " ".join(f"menu{i}" for i in range(800))
+
+    async def home(request):
+        links = '<a href="/people/alice">a</a><a href="/people/bob">b</a>'
+        return web.Response(text=f"<html><body>{links}</body></html>", content_type="text/html")
+
+    async def profile(request):
+        name = request.match_info["name"]
+        body = " ".join(f"{name}{i}" for i in range(10))
+        return web.Response(
+            text=f"<html><title>{name}</title><body><nav>{nav}</nav><p>{body}</p></body></html>",
+            content_type="text/html",
+        )
+
+    app = web.Application()
+    app.router.add_get("/", home)
+    app.router.add_get("/people/{name}", profile)
+    async with TestServer(app) as server:
+        job = await run_job(str(server.make_url("/")), tmp_path)
+    # Close enough to count as near-duplicates, but each profile keeps its own file.
+    assert job["stats"]["pages_near_duplicate"] == 1 and job["stats"]["pages_duplicate"] == 0
+    texts = [p.read_text() for p in outputs(tmp_path)]
+    assert len(texts) == 3
+    assert any("alice9" in text for text in texts) and any("bob9" in text for text in texts)
+
+
+@pytest.mark.asyncio
+async def test_jsonl_output_pages_through_records(tmp_path, monkeypatch):
+    """jsonl mode writes indexed shards that list in pages and read back by name"""
+    monkeypatch.chdir(tmp_path)
+    out_dir = tmp_path / "output_test"
+    out_dir.mkdir()
+    scraper.JOBS["test-job"] = {"status": "running", "progress": 0, "domain": "test"}
+    async with TestServer(site_app(docs=1)) as server:
+        await scraper.scrape_site(
+            str(server.make_url("/p/0")), False, ["txt"], str(out_dir), "test-job", "jsonl"
+        )
+    assert not [p for p in outputs(out_dir) if p.name.endswith(".txt.txt")]
+    names, cursor = scraper.list_results("test", limit=10)
+    assert len(names) == 10 and cursor
+    rest, cursor = scraper.list_results("test", cursor, limit=10)
+    assert len(rest) == 6 and cursor is None
+    page = scraper.get_result_record("test", names[0])
+    assert page["kind"] == "page" and page["title"] == "P0" and page["links"]
+    doc = scraper.get_result_record("test", next(n for n in names + rest if n.endswith(".txt.txt")))
+    assert doc["kind"] == "document" and doc["text"] == "contents of doc0.txt"
+    # An output index rebuilt from the directory lists the shards as well.
+    (out_dir / output_index.OUTPUT_INDEX).unlink()
+    with zipfile.ZipFile(io.BytesIO(b"".join(scraper.export_results("test", "zip")))) as zf:
+        exported = zf.namelist()
+    with tarfile.open(
+        fileobj=io.BytesIO(b"".join(scraper.export_results("test", "tar.gz"))), mode="r:gz"
+    ) as tf:
+        assert sorted(tf.getnames()) == sorted(exported)
+    assert len(exported) == len(set(exported)) == 2
+    assert [name for name in exported if name.startswith("records-")] == scraper.list_shards(
+        str(out_dir)
+    )
+
+
+@pytest.mark.asyncio
+async def test_results_page_through_the_output_index(tmp_path, monkeypatch):
+    """Listings come from the writer's index, in pages and filtered, not os.listdir"""
+    monkeypatch.chdir(tmp_path)
+    out_dir = tmp_path / "output_test"
+    out_dir.mkdir()
+    async with TestServer(site_app(docs=2)) as server:
+        await run_job(str(server.make_url("/p/0")), out_dir, doc_types=["txt"])
+    expected = sorted(p.name for p in outputs(out_dir))
+    monkeypatch.setattr(os, "listdir", None)
+    monkeypatch.setattr(os, "scandir", None)
+    names, cursor = scraper.list_results("test", limit=7)
+    while cursor:
+        more, cursor = scraper.list_results("test", cursor, limit=7)
+        names += more
+    assert sorted(names) == expected
+    assert len(scraper.list_results("test", kind="page")[0]) == 15
+    assert len(scraper.list_results("test", kind="text")[0]) == 2
+    small, _ = scraper.list_results("test", kind="document", max_size=100)
+    assert len(small) == 2
+    assert scraper.list_results("test", kind="document", min_size=100) == ([], None)
+
+
+@pytest.mark.asyncio
+async def test_pdf_budget_truncates_at_page_limit(tmp_path, monkeypatch):
+    """A PDF over its page budget stops at the limit and is counted as truncated"""
+    pdf = tmp_path / "long.pdf"
+    write_pdf(pdf, 12)
+    monkeypatch.setattr(scraper, "PDF_PAGES_PER_TASK", 5)
+    monkeypatch.setattr(scraper, "PDF_MAX_PAGES", 7)
+    stats = scraper.new_job_stats()
+    pieces = [text async for text in scraper.iter_extraction(str(pdf), "pdf", stats)]
+    assert len(pieces) == 2
+    assert "Page 6" in pieces[1] and "Page 7" not in "".join(pieces)
+    assert stats["docs_truncated"] == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("ext", ["csv", "xlsx"])
+async def test_tables_stream_in_chunks_to_output(tmp_path, monkeypatch, ext):
+    """Spreadsheets are rendered chunk by chunk into the output file, every row kept"""
+    import openpyxl
+
+    rows = [(i, f"name {i}", i * 1.5) for i in range(3000)]
+    path = tmp_path / f"table.{ext}"
+    if ext == "csv":
+        path.write_text("id,name,value\n" + "".join(f"{a},{b},{c}\n" for a, b, c in rows))
+    else:
+        workbook = openpyxl.Workbook(write_only=True)
+        sheet = workbook.create_sheet()
+        sheet.append(["id", "name", "value"])
+        for row in rows:
+            sheet.append(row)
+        workbook.save(path)
+    monkeypatch.setattr(scraper, "TABLE_CHUNK_BYTES", 50_000)
+    out = tmp_path / "out" / "table.txt"
+    out.parent.mkdir()
+    stats = scraper.new_job_stats()
+    await scraper.write_extraction(str(path), ext, str(out), stats)
+    text = out.read_text()
+    assert text.count("name") == 3001 and "name 2999" in text
+    assert len(list(scraper.iter_table_chunks(str(path), ext, 50_000))) > 2
+    assert stats["bytes_written"] == out.stat().st_size
+
+
+def mixed_app():
+    async def home(request):
+        links = "".join(
+            f'<a href="/{path}">x</a>' for path in ("report", "huge", "photo", "chunked")
+        )
+        return web.Response(text=f"<html><body>{links}</body></html>", content_type="text/html")
+
+    async def report(request):
+        # A document behind an extension-less URL.
+        return web.Response(text="quarterly figures", content_type="text/plain")
+
+    async def huge(request):
+        return web.Response(body=b"<html>" + b"x" * 4096, content_type="text/html")
+
+    async def chunked(request):
+        resp = web.StreamResponse(headers={"Content-Type": "text/html"})
+        await resp.prepare(request)
+        for _ in range(8):
+            await resp.write(b"<p>" + b"y" * 1024)
+        return resp
+
+    async def photo(request):
+        return web.Response(body=b"\x89PNG", content_type="image/png")
+
+    app = web.Application()
+    app.router.add_get("/", home)
+    app.router.add_get("/report", report)
+    app.router.add_get("/huge", huge)
+    app.router.add_get("/chunked", chunked)
+    app.router.add_get("/photo", photo)
+    return app
+
+
+@pytest.mark.asyncio
+async def test_non_html_and_oversized_pages_are_not_parsed(tmp_path, monkeypatch):
+    """Non-HTML pages go to the document pipeline or are skipped; big bodies are abandoned"""
+    monkeypatch.setattr(scraper, "MAX_PAGE_BYTES", 2048)
+    async with TestServer(mixed_app()) as server:
+        job = await run_job(str(server.make_url("/")), tmp_path, doc_types=["txt"])
+    stats = job["stats"]
+    assert stats["pages_fetched"] == 1
+    assert stats["pages_skipped"] == 3
+    assert stats["docs_done"] == 1
+    texts = [p.read_text() for p in outputs(tmp_path) if p.name.endswith(".txt.txt")]
+    assert texts == ["quarterly figures"]
+
+
+def test_sniff_charset_from_bom_and_meta():
+    """Charsets come from a BOM or <meta> without decoding the whole body"""
+    from html_parse import sniff_charset
+
+    assert sniff_charset(b"\xef\xbb\xbf<html>") == "utf-8"
+    assert sniff_charset(b'<html><head><meta charset="Windows-1252">') == "cp1252"
+    assert (
+        sniff_charset(b'<meta http-equiv="Content-Type" content="text/html; charset=iso-8859-1">')
+        == "iso8859-1"
+    )
+    assert sniff_charset(b"<html><body>plain") is None
+
+
+@pytest.mark.asyncio
+async def test_stages_are_timed_per_job_and_globally(tmp_path):
+    """Fetch phases, parse, links and writes land in the job summary and /metrics"""
+    async with TestServer(site_app()) as server:
+        job = await run_job(str(server.make_url("/p/0")), tmp_path)
+        (tmp_path / "missing").mkdir()
+        failed = await run_job(str(server.make_url("/missing")), tmp_path / "missing")
+    timings = job["stats"]["timings"]
+    for stage in ("fetch", "fetch_ttfb", "fetch_body", "parse", "links"):
+        assert timings[stage]["count"] >= 1, stage
+    # Only new connections are timed; the pages may all reuse robots.txt's.
+    connects = timings.get("fetch_connect", {}).get("count", 0)
+    assert connects == job["stats"].get("connections_new", 0)
+    assert timings["parse"]["count"] == 15
+    assert failed["stats"]["errors_by_category"] == {"http_4xx": 1}
+    text = scraper.metrics.render()
+    assert 'scraper_stage_seconds_count{stage="parse"}' in text
+    assert 'scraper_errors_total{category="http_4xx"}' in text
+
+
+@pytest.mark.asyncio
+async def test_jobs_share_keep_alive_connections(tmp_path):
+    """A second crawl of the same host reuses the first one's pooled sockets"""
+    (tmp_path / "second").mkdir()
+    async with TestServer(site_app()) as server:
+        first = dict(await run_job(str(server.make_url("/p/0")), tmp_path))
+        second = await run_job(str(server.make_url("/p/0")), tmp_path / "second")
+    assert first["stats"].get("connections_new", 0) >= 1
+    assert (
+        second["stats"].get("connections_new", 0) == 0
+        and second["stats"]["connections_reused"] >= 15
+    )
+    text = scraper.metrics.render()
+    assert 'scraper_connections_total{kind="reused"}' in text
+    assert "scraper_connection_reuse_ratio" in text
+
+
+@pytest.mark.asyncio
+async def test_transient_failures_are_retried(tmp_path, monkeypatch):
+    """A page answering 503 twice is fetched on the third attempt"""
+    monkeypatch.setattr(retries, "BACKOFF_BASE", 0.01)
+    failures = {"/p/1": 2}
+
+    @web.middleware
+    async def flaky(request, handler):
+        if failures.get(request.path):
+            failures[request.path] -= 1
+            return web.Response(status=503)
+        return await handler(request)
+
+    app = site_app()
+    app.middlewares.append(flaky)
+    async with TestServer(app) as server:
+        job = await run_job(str(server.make_url("/p/0")), tmp_path)
+    assert job["stats"]["pages_fetched"] == 15 and job["stats"]["retries"] == 2
+    assert "failures" not in job["stats"]
+
+
+@pytest.mark.asyncio
+async def test_connection_resets_are_retried(monkeypatch):
+    """A server resetting the connection counts as a retryable connect failure"""
+    monkeypatch.setattr(retries, "BACKOFF_BASE", 0.01)
+    requests = []
+
+    async def handle(reader, writer):
+        head = await reader.readuntil(b"\r\n\r\n")
+        if head.startswith(b"GET /robots.txt"):
+            writer.write(b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\n\r\n")
+            await writer.drain()
+            writer.close()
+            return
+        requests.append(head)
+        if len(requests) == 1:
+            # SO_LINGER 0: close with a TCP RST instead of a FIN.
+            writer.get_extra_info("socket").setsockopt(
+                socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0)
+            )
+            writer.transport.abort()
+            return
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: text/html\r\nContent-Length: 11\r\n\r\n<p>back</p>"
+        )
+        await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    url = f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}/page"
+    stats = scraper.new_job_stats()
+    try:
+        fetched = await scraper.fetch_url(scraper.http_client.session(), url, stats=stats)
+    finally:
+        server.close()
+        await server.wait_closed()
+    assert fetched["body"] == b"<p>back</p>"
+    assert stats["retries"] == 1 and "errors_by_category" not in stats
+    assert scraper.metrics.render().count('scraper_retries_total{category="connect"}') == 1
+
+
+def test_tls_failures_are_final_and_not_host_failures():
+    """Certificate and handshake errors are "tls": not retried, not counted by the breaker"""
+    key = ConnectionKey("example.com", 443, True, True, None, None, None)
+    errors = [
+        ClientConnectorCertificateError(key, ssl.SSLCertVerificationError("self-signed")),
+        ClientSSLError(key, ssl.SSLError("handshake failure")),
+    ]
+    assert [metrics.classify_error(e) for e in errors] == ["tls", "tls"]
+    assert not retries.retryable("tls") and "tls" not in retries.HOST_FAILURES
+
+
+@pytest.mark.asyncio
+async def test_circuit_breaker_fails_fast_on_a_dead_host(tmp_path, monkeypatch):
+    """Documents on an unreachable host stop being tried once its breaker opens"""
+    monkeypatch.setattr(scraper, "host_breakers", retries.CircuitBreakers())
+    monkeypatch.setattr(retries, "BACKOFF_BASE", 0.01)
+    # An unreachable robots.txt would disallow the host before the breaker is tried.
+    monkeypatch.setattr(politeness, "OBEY_ROBOTS", False)
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        dead = f"http://127.0.0.1:{sock.getsockname()[1]}"
+
+    async def page(request):
+        links = "".join(f'<a href="{dead}/files/doc{n}.txt">doc</a>' for n in range(10))
+        return web.Response(text=f"<html><body>{links}</body></html>", content_type="text/html")
+
+    app = web.Application()
+    app.router.add_get("/", page)
+    async with TestServer(app) as server:
+        job = await run_job(str(server.make_url("/")), tmp_path, ["txt"])
+    errors = job["stats"]["errors_by_category"]
+    assert sum(errors.values()) == 10 and errors.get("circuit_open", 0) >= 5
+    assert set(errors) <= {"connect", "circuit_open"}
+    assert sorted(f["url"] for f in job["stats"]["failures"]) == sorted(
+        f"{dead}/files/doc{n}.txt" for n in range(10)
+    )
+    assert job["stats"]["docs_done"] == 10 and len(outputs(tmp_path)) == 1  # just the page
+
+
+@pytest.mark.asyncio
+async def test_robots_failures_show_in_job_stats(tmp_path):
+    """URLs skipped because robots.txt is unreachable are reported as "robots" failures"""
+
+    async def robots_txt(request):
+        return web.Response(status=503)
+
+    async def page(request):
+        return web.Response(text="<html><body>hello</body></html>", content_type="text/html")
+
+    app = web.Application()
+    app.router.add_get("/robots.txt", robots_txt)
+    app.router.add_get("/", page)
+    async with TestServer(app) as server:
+        url = str(server.make_url("/"))
+        job = await run_job(url, tmp_path)
+    assert job["stats"]["errors_by_category"] == {"robots": 1}
+    assert job["stats"]["failures"] == [{"url": url, "category": "robots", "attempts": 0}]
+    assert "retries" not in job["stats"] or job["stats"]["retries"] == 0
+
+
+def sitemap_app(hits):
+    pages = {"/s/high": "0.9", "/s/plain": None, "/s/low": "0.1", "/s/calendar/2024/05": "0.9"}
+
+    async def robots_txt(request):
+        return web.Response(
+            text=f"User-agent: *\nSitemap: http://{request.host}/sitemap_index.xml\n"
+        )
+
+    async def index(request):
+        return web.Response(
+            text=f'<?xml version="1.0"?><sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+            f"<sitemap><loc>http://{request.host}/pages.xml.gz</loc></sitemap></sitemapindex>",
+            content_type="application/xml",
+        )
+
+    async def urlset(request):
+        entries = "".join(
+            f"<url><loc>http://{request.host}{path}</loc>{f'<priority>{priority}</priority>' if priority else ''}</url>"
+            for path, priority in pages.items()
+        )
+        xml = f'<?xml version="1.0"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{entries}</urlset>'
+        return web.Response(body=gzip.compress(xml.encode()), content_type="application/gzip")
+
+    async def page(request):
+        hits.append(request.path)
+        if request.path == "/":
+            # Hold the start page until every sitemap page is queued behind it.
+            while not any(ctx.frontier.qsize() == len(pages) for ctx in scraper.active_crawls):
+                await asyncio.sleep(0.01)
+        return web.Response(
+            text="<html><title>T</title><body>text</body></html>", content_type="text/html"
+        )
+
+    app = web.Application()
+    app.router.add_get("/robots.txt", robots_txt)
+    app.router.add_get("/sitemap_index.xml", index)
+    app.router.add_get("/pages.xml.gz", urlset)
+    app.router.add_get("/", page)
+    app.router.add_get("/s/{tail:.*}", page)
+    return app
+
+
+@pytest.mark.asyncio
+async def test_sitemap_pages_are_seeded_and_crawled_best_first(tmp_path, monkeypatch):
+    """robots.txt Sitemap: -> gzipped index -> urlset; priority and URL shape set the order"""
+    monkeypatch.setattr(scraper, "MAX_CONCURRENT", 1)
+    hits = []
+    async with TestServer(sitemap_app(hits)) as server:
+        job = await run_job(str(server.make_url("/")), tmp_path)
+    assert job["stats"]["pages_from_sitemaps"] == 4
+    assert hits == ["/", "/s/high", "/s/plain", "/s/low", "/s/calendar/2024/05"]
+
+
+@pytest.mark.asyncio
+async def test_large_sitemap_does_not_delay_completion(tmp_path, monkeypatch):
+    """Seeding stops at a multiple of the page budget and never outlives the crawl"""
+    monkeypatch.setattr(scraper, "MAX_PAGES", 5)
+    monkeypatch.setattr(scraper, "MAX_CONCURRENT", 1)
+
+    async def robots_txt(request):
+        return web.Response(text=f"User-agent: *\nSitemap: http://{request.host}/big.xml\n")
+
+    async def big_sitemap(request):
+        # Trickles out an endless urlset.
+        resp = web.StreamResponse(headers={"Content-Type": "application/xml"})
+        await resp.prepare(request)
+        await resp.write(b'<?xml version="1.0"?><urlset>')
+        for n in range(100_000):
+            await resp.write(f"<url><loc>http://{request.host}/s/{n}</loc></url>".encode())
+            await asyncio.sleep(0.001)
+        return resp
+
+    async def page(request):
+        if request.path == "/":
+            # Hold the start page until seeding has stopped at its cap.
+            while not any(ctx.seeding and ctx.seeding.done() for ctx in scraper.active_crawls):
+                await asyncio.sleep(0.01)
+        return web.Response(text="<html><body>text</body></html>", content_type="text/html")
+
+    app = web.Application()
+    app.router.add_get("/robots.txt", robots_txt)
+    app.router.add_get("/big.xml", big_sitemap)
+    app.router.add_get("/", page)
+    app.router.add_get("/s/{n}", page)
+    async with TestServer(app) as server:
+        job = await asyncio.wait_for(run_job(str(server.make_url("/")), tmp_path), 10)
+    assert job["stats"]["pages_from_sitemaps"] == scraper.SITEMAP_SEED_FACTOR * 5
+    assert job["stats"]["pages_fetched"] == 5
+
+
+@pytest.mark.asyncio
+async def test_depth_limit_and_path_budgets(tmp_path):
+    """Links past max_depth are not queued; a prefix stops at its page budget"""
+    (tmp_path / "budget").mkdir()
+    async with TestServer(site_app()) as server:
+        url = str(server.make_url("/p/0"))
+        scraper.JOBS["test-job"] = {"status": "running", "progress": 0, "domain": "test"}
+        await scraper.scrape_site(
+            url, False, [], str(tmp_path), "test-job", limits={"max_depth": 2}
+        )
+        shallow = scraper.JOBS["test-job"]
+        assert (shallow["stats"]["pages_fetched"], shallow["stats"]["pages_too_deep"]) == (7, 8)
+        scraper.JOBS["test-job"] = {"status": "running", "progress": 0, "domain": "test"}
+        await scraper.scrape_site(
+            url,
+            False,
+            [],
+            str(tmp_path / "budget"),
+            "test-job",
+            limits={"path_budgets": {"/p/": 5}},
+        )
+    stats = scraper.JOBS["test-job"]["stats"]
+    assert stats["pages_fetched"] == 5 and stats["pages_over_budget"] >= 1
+    assert len(outputs(tmp_path / "budget")) == 5
+
+
+@pytest.mark.asyncio
+async def test_distributed_workers_join_and_leave_without_losing_urls(tmp_path, monkeypatch):
+    """A worker joining and another leaving mid-job: every page crawled exactly once"""
+    monkeypatch.setattr(distributed, "HEARTBEAT_INTERVAL", 0.05)
+    monkeypatch.setattr(distributed, "POLL_INTERVAL", 0.02)
+    monkeypatch.setattr(politeness, "BURST", 100)
+    broker = distributed.SQLiteBroker(str(tmp_path / "broker.sqlite3"))
+    hits = {}
+    slow = tuple(f"/p/{n}" for n in range(15))
+    async with TestServer(site_app(slow_paths=slow, delay=0.1, docs=2, hits=hits)) as server:
+        first = distributed.CrawlNode(broker, "node-a", str(tmp_path / "a"))
+        job_id = await first.submit(str(server.make_url("/p/0")), False, ["txt"])
+        running = asyncio.create_task(first.run())
+        while len(hits) < 3:
+            await asyncio.sleep(0.02)
+        second = distributed.CrawlNode(broker, "node-b", str(tmp_path / "b"))
+        joined = asyncio.create_task(second.run())
+        await asyncio.sleep(0.1)
+        running.cancel()
+        await first.leave()
+        while (await broker.status(job_id)) != "done":
+            await asyncio.sleep(0.02)
+        joined.cancel()
+        await second.leave()
+    assert len(hits) == 15 and set(hits.values()) == {1}
+    status, progress, stats = await second.job_status(job_id)
+    assert (status, progress, stats["pages_fetched"], stats["docs_done"], stats["queued"]) == (
+        "done",
+        100,
+        15,
+        2,
+        0,
+    )
+    written = [p.name for node in tmp_path.glob("*/output_*") for p in outputs(node)]
+    assert (
+        all(outputs(node) for node in tmp_path.glob("*/output_*"))
+        and len(list(tmp_path.glob("*/output_*"))) == 2
+    )
+    assert len(written) == len(set(written)) == 15 + 2 * 2
+    await broker.close()
+
+
+@pytest.mark.asyncio
+async def test_distributed_crawl_keeps_the_depth_limit(tmp_path, monkeypatch):
+    """Link depth travels with queued URLs, so workers stop at MAX_DEPTH"""
+    monkeypatch.setattr(distributed, "POLL_INTERVAL", 0.02)
+    monkeypatch.setattr(frontier, "MAX_DEPTH", 2)
+    broker = distributed.SQLiteBroker(str(tmp_path / "broker.sqlite3"))
+    hits = {}
+    async with TestServer(site_app(hits=hits)) as server:
+        node = distributed.CrawlNode(broker, "node-a", str(tmp_path))
+        job_id = await node.submit(str(server.make_url("/p/0")), False, [])
+        running = asyncio.create_task(node.run())
+        while (await broker.status(job_id)) != "done":
+            await asyncio.sleep(0.02)
+        running.cancel()
+        await node.leave()
+    assert sorted(hits) == [f"/p/{n}" for n in range(7)]
+    _, _, stats = await node.job_status(job_id)
+    assert stats["pages_fetched"] == 7 and stats["pages_too_deep"] == 8
+    await broker.close()
+
+
+@pytest.mark.asyncio
+async def test_distributed_crawl_applies_job_limits(tmp_path, monkeypatch):
+    """max_depth and path_budgets given at submit time hold across the workers"""
+    monkeypatch.setattr(distributed, "POLL_INTERVAL", 0.02)
+    broker = distributed.SQLiteBroker(str(tmp_path / "broker.sqlite3"))
+    hits = {}
+    async with TestServer(site_app(hits=hits)) as server:
+        node = distributed.CrawlNode(broker, "node-a", str(tmp_path))
+        with pytest.raises(ValueError):
+            await node.submit(str(server.make_url("/p/0")), False, [], limits={"max_depth": -1})
+        limits = {"max_depth": 2, "path_budgets": {"/p/": 4}}
+        job_id = await node.submit(str(server.make_url("/p/0")), False, [], limits=limits)
+        running = asyncio.create_task(node.run())
+        while (await broker.status(job_id)) != "done":
+            await asyncio.sleep(0.02)
+        running.cancel()
+        await node.leave()
+    _, _, stats = await node.job_status(job_id)
+    assert len(hits) == stats["pages_fetched"] == 4
+    assert stats["pages_over_budget"] == 3 and stats["pages_too_deep"] == 2
+    await broker.close()
+
+
+@pytest.mark.asyncio
+async def test_broker_requeues_in_flight_urls_of_a_dead_worker(tmp_path, monkeypatch):
+    """A partition taken over after its lease lapsed hands out the unacked URLs again"""
+    broker = distributed.SQLiteBroker(str(tmp_path / "broker.sqlite3"))
+    url = "http://example.com/a"
+    part = distributed.partition(url)
+    await broker.submit("job", {}, [distributed.entry("page", url)])
+    assert await broker.acquire(part, "dead")
+    assert await broker.pop("job", [part], 10, "dead") == [(part, f"page 0 {url}")]
+    assert not await broker.acquire(part, "alive")
+    # The dead worker's last renewal lapses.
+    monkeypatch.setattr(distributed, "LEASE_TTL", -1)
+    await broker.renew("dead")
+    assert await broker.acquire(part, "alive")
+    await broker.requeue("job", part)
+    assert await broker.add("job", [distributed.entry("page", url)]) == 0
+    assert await broker.pop("job", [part], 10, "alive") == [(part, f"page 0 {url}")]
+    assert not await broker.ack("job", part, f"page 0 {url}", "dead")
+    assert await broker.ack("job", part, f"page 0 {url}", "alive")
+    assert await broker.status("job") == "done"
+    await broker.close()
+
+
+@pytest.mark.asyncio
+async def test_redis_broker_scripts_queue_and_requeue_urls(monkeypatch):
+    """The Redis broker's Lua scripts dedupe, hand out, requeue and ack URLs"""
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    monkeypatch.setattr(
+        "redis.asyncio.from_url", lambda url, **kwargs: fakeredis.FakeAsyncRedis(**kwargs)
+    )
+    broker = distributed.RedisBroker("redis://localhost:6379/0")
+    url, other = "http://example.com/a", "http://example.com/b"
+    part = distributed.partition(url)
+    await broker.submit("job", {"url": url}, [distributed.entry("page", url)])
+    assert (
+        await broker.add(
+            "job", [distributed.entry("page", url), distributed.entry("page", other, 1)]
+        )
+        == 1
+    )
+    assert await broker.jobs() == [("job", {"url": url})]
+    assert await broker.acquire(part, "dead") and not await broker.acquire(part, "alive")
+    assert await broker.pop("job", [part], 1, "dead") == [(part, f"page 0 {url}")]
+    await broker.release(part, "dead")
+    assert await broker.renew("dead") == set()
+    assert await broker.acquire(part, "alive")
+    await broker.requeue("job", part)
+    popped = await broker.pop("job", [part], 10, "alive")
+    assert popped == [(part, f"page 0 {url}"), (part, f"page 1 {other}")]
+    assert await broker.ack("job", part, popped[0][1], "alive")
+    assert not await broker.ack("job", part, popped[0][1], "alive")
+    assert await broker.status("job") == "running"
+    assert await broker.ack("job", part, popped[1][1], "alive")
+    assert (
+        await broker.status("job") == "done" and (await broker.get_job("job"))["outstanding"] == 0
+    )
+    await broker.close()
+
+
+@pytest.mark.asyncio
+async def test_fair_share_hands_out_slots_by_weight():
+    """Two jobs competing for one slot take turns 2:1 by weight"""
+    share = job_scheduler.FairShare(1)
+    share.register("heavy", 2)
+    share.register("light", 1)
+    order = []
+
+    async def take(job_id):
+        async with share.slot(job_id):
+            order.append(job_id)
+            await asyncio.sleep(0)
+
+    await share.acquire("holder")
+    tasks = [asyncio.create_task(take(job_id)) for job_id in ["heavy"] * 6 + ["light"] * 6]
+    await asyncio.sleep(0)
+    share.release()
+    await asyncio.gather(*tasks)
+    assert order[:6].count("heavy") == 4 and len(order) == 12
+
+
+@pytest.mark.asyncio
+async def test_politeness_waits_do_not_hold_fetch_slots(monkeypatch):
+    """A fetch sleeping out its host's delay leaves the fetch slot to other hosts"""
+    monkeypatch.setattr(job_scheduler, "FETCH_BUDGET", 1)
+    monkeypatch.setattr(scraper, "job_scheduler", job_scheduler.JobScheduler())
+    monkeypatch.setattr(scraper, "host_scheduler", politeness.PolitenessScheduler())
+    session = scraper.http_client.session()
+    async with TestServer(site_app()) as server:
+        blocked = str(server.make_url("/p/1"))
+        other = blocked.replace("127.0.0.1", "localhost")
+        state = scraper.host_scheduler.hosts[f"127.0.0.1:{server.port}"] = politeness.HostState()
+        state.blocked_until = time.monotonic() + 1
+        waiting = asyncio.create_task(scraper.fetch_url(session, blocked, job_id="slow"))
+        started = time.monotonic()
+        fetched = await scraper.fetch_url(session, other, job_id="fast")
+        assert fetched["body"] and time.monotonic() - started < 0.5
+        assert not waiting.done() and scraper.job_scheduler.fetch.in_use == 0
+        assert (await waiting)["body"]
+
+
+@pytest.mark.asyncio
+async def test_jobs_beyond_capacity_queue_by_priority(monkeypatch):
+    """Queued jobs are admitted high before normal before low, first come first served within a class"""
+    monkeypatch.setattr(job_scheduler, "MAX_RUNNING_JOBS", 1)
+    scheduler = job_scheduler.JobScheduler()
+    await scheduler.admit("running")
+    waiting = {
+        job_id: asyncio.create_task(scheduler.admit(job_id, priority))
+        for job_id, priority in (
+            ("low", "low"),
+            ("normal-1", "normal"),
+            ("high", "high"),
+            ("normal-2", "normal"),
+        )
+    }
+    await asyncio.sleep(0)
+    assert [scheduler.position(job_id) for job_id in waiting] == [4, 2, 1, 3]
+    waiting["normal-1"].cancel()
+    await asyncio.gather(waiting["normal-1"], return_exceptions=True)
+    assert scheduler.position("low") == 3
+    for finished, job_id in (("running", "high"), ("high", "normal-2"), ("normal-2", "low")):
+        scheduler.finish(finished)
+        assert scheduler.running == {job_id}
+        await asyncio.wait_for(waiting[job_id], 1)
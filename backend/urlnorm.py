@@ -0,0 +1,76 @@
+from urllib.parse import unquote_plus, urlsplit, urlunsplit
+
+# Query parameters that only carry analytics/session noise. Anything starting
+# with one of TRACKING_PREFIXES is dropped as well.
+TRACKING_PARAMS = frozenset(
+    {
+        "fbclid",
+        "gclid",
+        "dclid",
+        "msclkid",
+        "mc_cid",
+        "mc_eid",
+        "_ga",
+        "_gl",
+        "igshid",
+        "yclid",
+        "ref_src",
+    }
+)
+TRACKING_PREFIXES = ("utm_",)
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+# "/dept" and "/dept/" are often different resources (and relative links
+# resolve differently under them), so trailing slashes are kept by default.
+TRAILING_SLASH = "keep"
+
+
+def canonicalize_url(url, strip_params=None, strip_prefixes=None, trailing_slash=None):
+    """Normalise a URL so trivially different spellings share one key.
+
+    Lowercases scheme and host, drops the fragment and default port, removes
+    tracking query parameters and applies ``trailing_slash`` ("strip", "add"
+    or "keep") to the path. The root path is always "/". Arguments left as
+    None fall back to the module-level settings.
+    """
+    strip_params = TRACKING_PARAMS if strip_params is None else strip_params
+    strip_prefixes = tuple(TRACKING_PREFIXES if strip_prefixes is None else strip_prefixes)
+    trailing_slash = trailing_slash or TRAILING_SLASH
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").rstrip(".")
+    if ":" in host:
+        host = f"[{host}]"
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    netloc = host
+    if port is not None and port != DEFAULT_PORTS.get(scheme):
+        netloc = f"{host}:{port}"
+    if parts.username:
+        userinfo = parts.username + (f":{parts.password}" if parts.password else "")
+        netloc = f"{userinfo}@{netloc}"
+
+    path = parts.path or "/"
+    if path != "/":
+        if trailing_slash == "strip":
+            path = path.rstrip("/") or "/"
+        elif (
+            trailing_slash == "add"
+            and not path.endswith("/")
+            and "." not in path.rsplit("/", 1)[-1]
+        ):
+            path += "/"
+
+    # Filter the raw "k=v" pairs so the remaining parameters keep their
+    # original encoding and order.
+    kept = []
+    for pair in parts.query.split("&"):
+        key = unquote_plus(pair.split("=", 1)[0]).lower()
+        if pair and key not in strip_params and not key.startswith(strip_prefixes):
+            kept.append(pair)
+    query = "&".join(kept)
+
+    return urlunsplit((scheme, netloc, path, query, ""))
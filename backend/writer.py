@@ -0,0 +1,252 @@
+import asyncio
+import os
+import queue
+import threading
+import time
+
+from content_index import ContentIndex
+from output_index import OutputIndex
+
+# Written files are fsync'ed in batches: once FSYNC_BATCH files are dirty or
+# FSYNC_INTERVAL seconds have passed. FSYNC_BATCH = 0 leaves it to the OS.
+FSYNC_BATCH = 64
+FSYNC_INTERVAL = 1.0
+
+
+class OutputWriter:
+    """Runs all output file I/O on one dedicated thread.
+
+    Coroutines submit operations and await their completion, so a slow
+    (e.g. network-mounted) output volume only delays the task that is
+    writing, never the event loop. Operations run in submission order.
+    Each output directory's index is updated as files are written and
+    committed together with the batched fsync, as are the rows queued on
+    its content index.
+    """
+
+    def __init__(self, fsync_batch=None, fsync_interval=None, observer=None):
+        self.fsync_batch = FSYNC_BATCH if fsync_batch is None else fsync_batch
+        self.fsync_interval = FSYNC_INTERVAL if fsync_interval is None else fsync_interval
+        self._ops = queue.Queue()
+        self._dirty = set()
+        self._indexes = {}
+        self._index_dirty = False
+        self._contents = set()
+        self._kinds = {}
+        # Called with (seconds, nbytes) for every completed write.
+        self.observer = observer
+        self._last_sync = time.monotonic()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    async def write_text(self, path, text, stats=None, kind=None):
+        data = text.encode("utf-8")
+        await self._submit(self._write_file, path, data, kind, stats=stats, nbytes=len(data))
+
+    async def write_bytes(self, path, data, stats=None, kind=None):
+        await self._submit(self._write_file, path, data, kind, stats=stats, nbytes=len(data))
+
+    async def open(self, path, kind=None):
+        return await self._submit(self._open, path, kind)
+
+    async def append(self, handle, data, stats=None):
+        await self._submit(handle.write, data, stats=stats, nbytes=len(data))
+
+    async def close(self, handle):
+        await self._submit(self._close, handle)
+
+    async def append_record(self, store, record, stats=None):
+        started = time.perf_counter()
+        nbytes = await self._submit(self._append_record, store, record)
+        self._record(stats, time.perf_counter() - started, nbytes)
+
+    async def alias_record(self, store, name, url, target, kind="page"):
+        await self._submit(store.add_alias, name, url, target, kind)
+
+    async def close_records(self, store):
+        await self._submit(store.close)
+
+    async def open_contents(self, out_dir):
+        """A ContentIndex for ``out_dir`` whose rows this thread writes."""
+        return await self._submit(self._open_contents, out_dir)
+
+    async def close_contents(self, index):
+        await self._submit(self._close_contents, index)
+
+    async def adopt(self, path, stats=None, kind=None):
+        """Index and fsync a file written by another process."""
+        started = time.perf_counter()
+        nbytes = await self._submit(self._adopt, path, kind)
+        self._record(stats, time.perf_counter() - started, nbytes)
+
+    async def remove(self, path):
+        await self._submit(self._remove, path)
+
+    async def add_alias(self, path, target, kind=None):
+        """List ``path`` in its directory's index as a name for ``target``."""
+        await self._submit(self._index, path, 0, kind, target)
+
+    async def flush(self):
+        await self._submit(self._sync)
+
+    def _write_file(self, path, data, kind=None):
+        with open(path, "wb") as f:
+            f.write(data)
+        self._dirty.add(path)
+        self._index(path, len(data), kind)
+
+    def _open(self, path, kind=None):
+        handle = open(path, "wb")
+        self._kinds[handle.name] = kind
+        return handle
+
+    def _close(self, handle):
+        handle.close()
+        self._dirty.add(handle.name)
+        self._index(handle.name, os.path.getsize(handle.name), self._kinds.pop(handle.name, None))
+
+    def _adopt(self, path, kind=None):
+        size = os.path.getsize(path)
+        self._dirty.add(path)
+        self._index(path, size, kind)
+        return size
+
+    def _index(self, path, size, kind=None, target=None):
+        out_dir, name = os.path.split(path)
+        if name.startswith("."):
+            return
+        self._index_for(out_dir).add(name, size, kind, target)
+        self._index_dirty = True
+
+    def _index_for(self, out_dir):
+        index = self._indexes.get(out_dir)
+        if index is None:
+            index = self._indexes[out_dir] = OutputIndex(out_dir or ".")
+        return index
+
+    def _open_contents(self, out_dir):
+        index = ContentIndex(out_dir)
+        self._contents.add(index)
+        return index
+
+    def _close_contents(self, index):
+        self._contents.discard(index)
+        index.close()
+
+    def _append_record(self, store, record):
+        path, nbytes = store.append(record)
+        self._dirty.add(path)
+        return nbytes
+
+    def _remove(self, path):
+        self._dirty.discard(path)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        out_dir, name = os.path.split(path)
+        self._index_for(out_dir).remove(name)
+        self._index_dirty = True
+
+    def _sync(self):
+        for path in self._dirty:
+            try:
+                fd = os.open(path, os.O_RDONLY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+            except OSError:
+                pass
+        self._dirty.clear()
+        if self._index_dirty:
+            for index in self._indexes.values():
+                index.commit()
+            self._index_dirty = False
+        for index in self._contents:
+            index.commit()
+        self._last_sync = time.monotonic()
+
+    async def _submit(self, fn, *args, stats=None, nbytes=0):
+        self._ensure_started()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        started = time.perf_counter()
+        self._ops.put((fn, args, loop, future))
+        result = await future
+        if stats is not None or nbytes:
+            self._record(stats, time.perf_counter() - started, nbytes)
+        return result
+
+    def _record(self, stats, seconds, nbytes):
+        if stats is not None:
+            record_write(stats, seconds, nbytes)
+        if self.observer is not None:
+            self.observer(seconds, nbytes)
+
+    def queue_depth(self):
+        return self._ops.qsize()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="output-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                fn, args, loop, future = self._ops.get(timeout=self.fsync_interval or None)
+            except queue.Empty:
+                if (
+                    self._dirty
+                    or self._index_dirty
+                    or any(index.queued for index in self._contents)
+                ):
+                    self._sync()
+                continue
+            result = error = None
+            try:
+                result = fn(*args)
+            except Exception as exc:
+                error = exc
+            try:
+                loop.call_soon_threadsafe(_resolve, future, result, error)
+            except RuntimeError:
+                pass  # the submitting loop is already closed
+            if (
+                self.fsync_batch
+                and self._dirty
+                and (
+                    len(self._dirty) >= self.fsync_batch
+                    or time.monotonic() - self._last_sync >= self.fsync_interval
+                )
+            ):
+                self._sync()
+
+
+def _resolve(future, result, error):
+    if future.cancelled():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+def new_write_stats():
+    return {
+        "writes": 0,
+        "bytes_written": 0,
+        "write_latency_ms_avg": 0.0,
+        "write_latency_ms_max": 0.0,
+    }
+
+
+def record_write(stats, seconds, nbytes):
+    ms = seconds * 1000
+    stats["writes"] = stats.get("writes", 0) + 1
+    stats["bytes_written"] = stats.get("bytes_written", 0) + nbytes
+    avg = stats.get("write_latency_ms_avg", 0.0)
+    stats["write_latency_ms_avg"] = round(avg + (ms - avg) / stats["writes"], 3)
+    stats["write_latency_ms_max"] = round(max(stats.get("write_latency_ms_max", 0.0), ms), 3)
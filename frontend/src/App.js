@@ -3,15 +3,17 @@ import {
   ChakraProvider, Box, Button, Input, Checkbox, Spinner,
   Text, VStack, HStack, Textarea, Select
 } from "@chakra-ui/react";
-import { startScrape, getStatus, getResults, downloadFile, scoreText, deaiText } from "./api";
+import { startScrape, getStatus, subscribeStatus, getResults, downloadFile, scoreText, deaiText } from "./api";
 
 function App() {
   const [url, setUrl] = useState("");
   const [docTypes, setDocTypes] = useState(["docx", "pdf", "csv", "xlsx", "pptx", "txt"]);
   const [jobId, setJobId] = useState(null);
   const [status, setStatus] = useState("");
+  const [queuePosition, setQueuePosition] = useState(null);
   const [progress, setProgress] = useState(0);
   const [results, setResults] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [domain, setDomain] = useState("");
   const [error, setError] = useState("");
 
@@ -25,11 +27,21 @@ function App() {
     setError("");
     try {
       let res = await startScrape(url, docTypes);
+      const jobDomain = new URL(url).hostname;
       setJobId(res.job_id);
-      setDomain(new URL(url).hostname);
+      setDomain(jobDomain);
       setStatus("running");
       setProgress(0);
       setResults([]);
+      subscribeStatus(res.job_id, async (event) => {
+        setStatus(event.status);
+        setProgress(event.progress);
+        if (event.status === "done") {
+          let files = await getResults(jobDomain);
+          setResults(files.files);
+          setNextCursor(files.next_cursor);
+        }
+      });
     } catch (err) {
       setError("Failed to start scrape. Check your URL and server.");
     }
@@ -41,14 +53,25 @@ function App() {
       let res = await getStatus(jobId);
       setStatus(res.status);
       setProgress(res.progress);
+      setQueuePosition(res.queue_position ?? null);
       if (res.status === "done") {
         let files = await getResults(domain);
         setResults(files.files);
+        setNextCursor(files.next_cursor);
       }
     } catch (err) {
       setError("Failed to check status. Is the server running?");
     }
   };
+  const handleMoreResults = async () => {
+    try {
+      let files = await getResults(domain, nextCursor);
+      setResults(results.concat(files.files));
+      setNextCursor(files.next_cursor);
+    } catch (err) {
+      setError("Failed to load results.");
+    }
+  };
   const handleScoreText = async () => {
     setError("");
     try {
@@ -95,7 +118,8 @@ function App() {
             <Button colorScheme="blue" onClick={handleStart}>Start Scrape</Button>
             <Button colorScheme="green" onClick={handleCheckStatus} isDisabled={!jobId}>Check Status</Button>
             {status && <Text>Status: {status} | Progress: {progress}%</Text>}
-            {status === "running" && <Spinner />}
+            {status === "queued" && queuePosition && <Text>Queue position: {queuePosition}</Text>}
+            {(status === "running" || status === "queued") && <Spinner />}
             {results.length > 0 && (
               <Box mt="5">
                 <Text fontWeight="bold">Results for {domain}:</Text>
@@ -104,6 +128,7 @@ function App() {
                     <Button key={file} onClick={() => downloadFile(domain, file)}>{file}</Button>
                   ))}
                 </VStack>
+                {nextCursor && <Button mt="2" onClick={handleMoreResults}>Load more</Button>}
               </Box>
             )}
           </VStack>
@@ -14,8 +14,23 @@ export async function getStatus(jobId) {
   return await resp.json();
 }
 
-export async function getResults(domain) {
-  const resp = await fetch(`http://localhost:8000/results/${domain}`);
+// Queued and running jobs keep streaming; these end the stream.
+const TERMINAL_STATUSES = ["done", "failed", "not_found"];
+
+export function subscribeStatus(jobId, onEvent) {
+  const source = new EventSource(`http://localhost:8000/events/${jobId}`);
+  source.onmessage = (e) => {
+    const event = JSON.parse(e.data);
+    onEvent(event);
+    if (TERMINAL_STATUSES.includes(event.status)) source.close();
+  };
+  source.onerror = () => source.close();
+  return () => source.close();
+}
+
+export async function getResults(domain, cursor) {
+  const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : "";
+  const resp = await fetch(`http://localhost:8000/results/${domain}${query}`);
   if (!resp.ok) throw new Error("Backend error");
   return await resp.json();
 }